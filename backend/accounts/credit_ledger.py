@@ -0,0 +1,167 @@
+"""
+Credit account ledger: posting movements, statements, and the backfill.
+
+Every change to a CreditAccount balance appends a CreditLedgerEntry in the
+same database transaction, with the account row locked, so balance_after
+values follow each other exactly. Statements page backwards through the
+(account, created_at, id) index with a keyset cursor rather than an OFFSET,
+so any page costs the same however long the history.
+"""
+import base64
+import re
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .models import CreditAccount, CreditLedgerEntry
+
+STATEMENT_PAGE_SIZE = 50
+MAX_STATEMENT_PAGE_SIZE = 500
+
+OPENING_DESCRIPTION = 'Opening balance'
+
+# How the checkout and the payment action have always described a credit
+# account, which is all the history the backfill has to go on
+CREDIT_REFERENCE_PREFIX = 'Credit: '
+PAYMENT_DESCRIPTION_PREFIX = 'Credit payment from '
+_PAYMENT_ACCOUNT = re.compile(r'\(([^()]+)\)\.')
+
+
+def post_entry(account, kind, amount, transaction=None, description='', user=None):
+    """
+    Append the ledger entry of a balance change already applied to account
+    (locked, with its new balance loaded). amount is the signed change.
+    """
+    return CreditLedgerEntry.objects.create(
+        account=account,
+        kind=kind,
+        amount=amount,
+        balance_after=account.balance,
+        transaction=transaction,
+        description=description[:255],
+        created_by=user,
+    )
+
+
+def encode_cursor(entry):
+    raw = f'{entry.created_at.isoformat()}|{entry.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; ValueError if it is not one."""
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        entry_id = int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    return created_at, entry_id
+
+
+def statement_page(account, cursor=None, limit=STATEMENT_PAGE_SIZE):
+    """
+    (entries, next_cursor): up to limit entries of account, newest first,
+    older than cursor if given. next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_STATEMENT_PAGE_SIZE))
+    entries = account.ledger_entries.order_by('-created_at', '-id')
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        entries = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id))
+    page = list(entries.select_related('transaction').prefetch_related('transaction__lines')[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
+def _history():
+    """
+    {account_id: [(when, kind, amount, transaction, description)]} of every
+    credit sale, cancellation and payment recorded before the ledger existed.
+    """
+    from ledger.models import CashBookEntry
+    from transactions.models import Transaction
+
+    history = defaultdict(list)
+    sales = Transaction.objects.filter(
+        payment_type__in=('credit', 'mixed'), payment_reference__startswith=CREDIT_REFERENCE_PREFIX
+    ).select_related('receipt')
+    for tx in sales.iterator(chunk_size=2000):
+        account_id = tx.payment_reference[len(CREDIT_REFERENCE_PREFIX):].strip()
+        if tx.payment_type == 'credit':
+            amount = tx.total_amount
+        else:
+            receipt = getattr(tx, 'receipt', None)
+            amount = Decimal(str((receipt.payload if receipt else {}).get('payment', {}).get('credit_amount', 0)))
+        if amount <= 0:
+            continue
+        history[account_id].append((tx.timestamp, 'charge', amount, tx, f'TX #{tx.id}'))
+        if tx.is_canceled:
+            history[account_id].append((tx.timestamp, 'reversal', -amount, tx, f'TX #{tx.id} canceled'))
+
+    payments = CashBookEntry.objects.filter(entry_type='income', description__startswith=PAYMENT_DESCRIPTION_PREFIX)
+    for entry in payments.iterator(chunk_size=2000):
+        match = _PAYMENT_ACCOUNT.search(entry.description)
+        if match:
+            note = entry.description[match.end():].strip()
+            history[match.group(1)].append((entry.date, 'payment', -entry.amount, None, note))
+    return history
+
+
+def backfill_account(account, history):
+    """
+    Write the ledger of account from history (see _history), covering what
+    happened before its first entry. An opening entry absorbs whatever the
+    history does not explain (manual charges, edited balances), so the
+    entries always end at the balance the account had. Returns the number of
+    entries written; 0 if the account was already backfilled.
+    """
+    with transaction.atomic():
+        account = CreditAccount.objects.select_for_update().get(pk=account.pk)
+        existing = account.ledger_entries.order_by('created_at', 'id')
+        if existing.filter(description=OPENING_DESCRIPTION, transaction__isnull=True).exists():
+            return 0
+        first = existing.first()
+        if first is not None:
+            closing = first.balance_after - first.amount
+            # A sale charged or canceled since is already in the ledger
+            posted = set(existing.filter(transaction__isnull=False).values_list('transaction_id', 'kind'))
+            history = [
+                h for h in history
+                if h[0] < first.created_at and (h[3] is None or (h[3].pk, h[1]) not in posted)
+            ]
+        else:
+            closing = account.balance
+        history = sorted(history, key=lambda h: (h[0], h[1] == 'reversal'))
+
+        opening = closing - sum((h[2] for h in history), Decimal('0'))
+        balance = opening
+        rows = [CreditLedgerEntry(
+            account=account, kind='charge' if opening >= 0 else 'payment', amount=opening,
+            balance_after=opening, description=OPENING_DESCRIPTION,
+            created_at=min([account.created_at] + [h[0] for h in history]),
+        )]
+        for when, kind, amount, tx, description in history:
+            balance += amount
+            rows.append(CreditLedgerEntry(
+                account=account, kind=kind, amount=amount, balance_after=balance,
+                transaction=tx, description=description[:255], created_at=when,
+            ))
+        CreditLedgerEntry.objects.bulk_create(rows)
+        return len(rows)
+
+
+def backfill_ledger():
+    """Backfill every credit account (see backfill_account). Returns (accounts, entries) written."""
+    history = _history()
+    accounts = entries = 0
+    for account in CreditAccount.objects.order_by('pk').iterator():
+        written = backfill_account(account, history.get(account.account_id, []))
+        if written:
+            accounts += 1
+            entries += written
+    return accounts, entries
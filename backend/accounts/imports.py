@@ -0,0 +1,205 @@
+"""
+Bulk import of credit accounts from a CSV or XLSX roster.
+
+The file is read a row at a time (csv, or openpyxl in read-only mode) and
+each valid row is upserted by account_id in batches: one
+INSERT ... ON CONFLICT (account_id) DO UPDATE per batch through
+bulk_create(update_conflicts=True), and one summarizing AuditLog entry per
+batch instead of one per account. Only the columns present in the file are
+written to existing accounts; balances are never imported.
+
+The first row holds the column names, matched case-insensitively with
+spaces taken as underscores ("Account ID" is account_id). account_id, name
+and account_type are required.
+"""
+import csv
+import io
+import os
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from audit.models import AuditLog
+from .models import CreditAccount
+from .search import normalize_search
+
+IMPORT_BATCH_SIZE = 500
+
+REQUIRED_COLUMNS = ('account_id', 'name', 'account_type')
+IMPORT_COLUMNS = REQUIRED_COLUMNS + (
+    'class_or_department', 'contact_info', 'roll_no', 'barcode', 'credit_limit', 'daily_limit',
+)
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown format, missing columns)."""
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Spreadsheets store ids and roll numbers as numbers
+    return str(value).strip()
+
+
+def _csv_rows(fileobj):
+    yield from csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+
+
+def _xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    """
+    Return (columns, rows) for a .csv or .xlsx file: the importable columns
+    named in the header, and an iterator of (row_number, {column: text}) for
+    each non-empty data row. Every row carries every column, with '' for
+    cells a short row leaves out. Raises ImportFileError for other files or
+    a bad header.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(fileobj)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(fileobj)
+    else:
+        raise ImportFileError('Upload a .csv or .xlsx file')
+
+    header = [_cell(name).lower().replace(' ', '_') for name in next(rows, None) or ()]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ImportFileError(f'Missing column(s): {", ".join(missing)}')
+    columns = [name for name in dict.fromkeys(header) if name in IMPORT_COLUMNS]
+
+    def values():
+        for number, row in enumerate(rows, start=2):
+            cells = dict.fromkeys(columns, '')
+            cells.update((name, _cell(value)) for name, value in zip(header, row) if name in cells)
+            if any(cells.values()):
+                yield number, cells
+
+    return columns, values()
+
+
+def clean_row(values):
+    """{field: python value} for a row, or raise ValidationError with a message per field."""
+    cleaned, errors = {}, {}
+    for name, value in values.items():
+        field = CreditAccount._meta.get_field(name)
+        if name == 'account_type':
+            value = value.lower()
+        if value == '' and field.null:
+            value = None
+        try:
+            cleaned[name] = field.clean(value, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def _write_batch(batch, columns, user, filename, dry_run):
+    """
+    Upsert one batch of (row_number, cleaned) rows. Returns (created,
+    updated, errors) where errors are the rows left out because their
+    barcode belongs to another account.
+    """
+    errors = []
+    codes = [cleaned['barcode'] for _, cleaned in batch if cleaned.get('barcode')]
+    if codes:
+        owners = dict(CreditAccount.objects.filter(barcode__in=codes).values_list('barcode', 'account_id'))
+        kept = []
+        for number, cleaned in batch:
+            owner = owners.get(cleaned.get('barcode'))
+            if owner is not None and owner != cleaned['account_id']:
+                errors.append({'row': number, 'account_id': cleaned['account_id'],
+                               'errors': {'barcode': [f'Already the barcode of {owner}']}})
+            else:
+                kept.append((number, cleaned))
+        batch = kept
+    if not batch:
+        return 0, 0, errors
+
+    ids = [cleaned['account_id'] for _, cleaned in batch]
+    with transaction.atomic():
+        existing = set(CreditAccount.objects.filter(account_id__in=ids).values_list('account_id', flat=True))
+        created, updated = len(ids) - len(existing), len(existing)
+        if dry_run:
+            return created, updated, errors
+
+        now = timezone.now()
+        # bulk_create skips CreditAccount.save(), which keeps search_name
+        update_fields = [name for name in columns if name != 'account_id'] + ['search_name', 'updated_at']
+        CreditAccount.objects.bulk_create(
+            [CreditAccount(**cleaned, search_name=normalize_search(cleaned['name']), updated_at=now)
+             for _, cleaned in batch],
+            update_conflicts=True,
+            unique_fields=['account_id'],
+            update_fields=update_fields,
+        )
+        AuditLog.objects.create(
+            who=user,
+            action='import',
+            model='CreditAccount',
+            new_data={
+                'file': filename,
+                'rows': [batch[0][0], batch[-1][0]],
+                'created': created,
+                'updated': updated,
+            }
+        )
+    return created, updated, errors
+
+
+def import_accounts(fileobj, filename, user=None, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate every row of a roster and upsert the valid ones by account_id.
+    Returns {'rows', 'created', 'updated', 'errors'}; errors lists
+    {'row', 'account_id', 'errors': {column: [messages]}} for each row
+    skipped. With dry_run nothing is written. Each batch commits on its own.
+    """
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'errors': []}
+    seen = {}
+    columns, rows = read_rows(fileobj, filename)
+    batch = []
+
+    def flush():
+        created, updated, errors = _write_batch(batch, columns, user, filename, dry_run)
+        report['created'] += created
+        report['updated'] += updated
+        report['errors'].extend(errors)
+        batch.clear()
+
+    for number, values in rows:
+        report['rows'] += 1
+        try:
+            cleaned = clean_row(values)
+        except ValidationError as e:
+            report['errors'].append({'row': number, 'account_id': values.get('account_id', ''),
+                                     'errors': e.message_dict})
+            continue
+        # One statement cannot upsert the same key twice
+        duplicate = {
+            name: [f'Duplicate of row {seen[(name, cleaned[name])]}']
+            for name in ('account_id', 'barcode') if cleaned.get(name) and (name, cleaned[name]) in seen
+        }
+        if duplicate:
+            report['errors'].append({'row': number, 'account_id': cleaned['account_id'], 'errors': duplicate})
+            continue
+        for name in ('account_id', 'barcode'):
+            if cleaned.get(name):
+                seen[(name, cleaned[name])] = number
+        batch.append((number, cleaned))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
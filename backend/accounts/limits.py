@@ -0,0 +1,71 @@
+"""
+Credit limits. An account may carry its own credit_limit (the highest
+balance credit sales may reach) and daily_limit (the most sold to it on
+credit in one local day); either left blank falls back to the default for
+its account type in Organization.settings, e.g.
+
+    {"credit_limits": {"student": {"credit_limit": "500", "daily_limit": "150"}}}
+
+No limit configured anywhere means none applies. Only sales are limited:
+manual charges by a manager and payments are not.
+"""
+from decimal import Decimal, InvalidOperation
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import CreditDailySpend
+
+
+class CreditLimitExceeded(APIException, ValueError):
+    """A credit sale over an account's limit. The API answers 400; services treat it as a ValueError."""
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = 'credit_limit_exceeded'
+
+
+def _amount(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def account_limits(account, org_settings):
+    """(credit_limit, daily_limit) of account, each None when unlimited."""
+    defaults = ((org_settings or {}).get('credit_limits') or {}).get(account.account_type) or {}
+    return tuple(
+        getattr(account, name) if getattr(account, name) is not None else _amount(defaults.get(name))
+        for name in ('credit_limit', 'daily_limit')
+    )
+
+
+def charge_sale(account, amount, day, org_settings):
+    """
+    Check a credit sale of amount to account (locked, balance not yet
+    charged) on local date day against its limits and add it to the day's
+    spend. Raises CreditLimitExceeded, leaving everything as it was.
+    """
+    credit_limit, daily_limit = account_limits(account, org_settings)
+    if credit_limit is not None and account.balance + amount > credit_limit:
+        raise CreditLimitExceeded(
+            f'{account.name} ({account.account_id}) would owe {account.balance + amount}, '
+            f'over their credit limit of {credit_limit}'
+        )
+
+    spent = CreditDailySpend.objects.filter(account=account, date=day).values_list('amount', flat=True).first()
+    if daily_limit is not None and (spent or 0) + amount > daily_limit:
+        raise CreditLimitExceeded(
+            f'{account.name} ({account.account_id}) has {spent or 0} on credit today; '
+            f'{amount} more is over their daily limit of {daily_limit}'
+        )
+    if spent is None:
+        CreditDailySpend.objects.create(account=account, date=day, amount=amount)
+    else:
+        CreditDailySpend.objects.filter(account=account, date=day).update(amount=F('amount') + amount)
+
+
+def refund_sale(account, amount, day):
+    """Take a canceled credit sale of amount off account's spend on day (account locked)."""
+    CreditDailySpend.objects.filter(account=account, date=day).update(amount=Greatest(F('amount') - amount, Value(Decimal('0'))))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from accounts.credit_ledger import backfill_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the credit ledger of every account from the sales and payments recorded before it '
+        'existed. Accounts already backfilled are skipped, so it is safe to run again.'
+    )
+
+    def handle(self, *args, **options):
+        accounts, entries = backfill_ledger()
+        self.stdout.write(f'Backfilled {accounts} account(s): {entries} ledger entr{"y" if entries == 1 else "ies"}')
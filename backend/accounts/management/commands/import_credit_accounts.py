@@ -0,0 +1,32 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from accounts.imports import IMPORT_BATCH_SIZE, ImportFileError, import_accounts
+
+
+class Command(BaseCommand):
+    help = 'Create or update credit accounts from a CSV/XLSX roster, keyed by account_id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The .csv or .xlsx file')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without writing anything')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as fileobj:
+                report = import_accounts(fileobj, os.path.basename(path), dry_run=options['dry_run'],
+                                         batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except ImportFileError as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            messages = '; '.join(f'{name}: {" ".join(text)}' for name, text in error['errors'].items())
+            self.stderr.write(f'Row {error["row"]} ({error["account_id"] or "no account_id"}): {messages}')
+        prefix = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(
+            f'{prefix} {report["rows"]} row(s): {report["created"]} created, {report["updated"]} updated, '
+            f'{len(report["errors"])} skipped'
+        )
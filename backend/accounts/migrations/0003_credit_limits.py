@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditaccount',
+            name='credit_limit',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Highest balance credit sales may take the account to', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='creditaccount',
+            name='daily_limit',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Most that may be sold on credit to the account per day', max_digits=12, null=True),
+        ),
+        migrations.CreateModel(
+            name='CreditDailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.creditaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='creditdailyspend',
+            constraint=models.UniqueConstraint(fields=('account', 'date'), name='credit_daily_spend_unique'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:19
+
+from django.db import migrations, models
+
+
+def fill_search_names(apps, schema_editor):
+    from accounts.search import normalize_search
+    CreditAccount = apps.get_model('accounts', 'CreditAccount')
+    accounts = list(CreditAccount.objects.only('pk', 'name'))
+    for account in accounts:
+        account.search_name = normalize_search(account.name)
+    CreditAccount.objects.bulk_update(accounts, ['search_name'], batch_size=1000)
+
+
+def add_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return  # Other databases use the search_name prefix index alone
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS account_search_trgm_idx '
+        'ON accounts_creditaccount USING gin (search_name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS account_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_payment_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditaccount',
+            name='barcode',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='creditaccount',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='creditaccount',
+            name='roll_no',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.RunPython(add_trigram_index, drop_trigram_index),
+    ]
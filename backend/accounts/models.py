@@ -1,4 +1,6 @@
 from django.db import models
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
 
@@ -49,30 +51,93 @@ class CreditAccount(models.Model):
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPE)
     class_or_department = models.CharField(max_length=100, blank=True)
     contact_info = models.CharField(max_length=255, blank=True)
-    roll_no = models.CharField(max_length=50, blank=True)
+    roll_no = models.CharField(max_length=50, blank=True, db_index=True)
+    # ID card barcode, when it is not the account_id itself
+    barcode = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    # normalize_search(name), kept by save() for indexed typeahead (accounts.search)
+    search_name = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Blank: the default for the account type in Organization.settings['credit_limits']
+    credit_limit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                       help_text='Highest balance credit sales may take the account to')
+    daily_limit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                      help_text='Most that may be sold on credit to the account per day')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def charge(self, amount):
-        # increase balance (they owe more)
-        from django.db import transaction
-        from django.db.models import F
-        with transaction.atomic():
-            acct = CreditAccount.objects.select_for_update().get(pk=self.pk)
-            acct.balance = F('balance') + amount
-            acct.save()
-            acct.refresh_from_db()
-            return acct.balance
-
-    def pay(self, amount):
-        # decrease balance
-        from django.db import transaction
-        from django.db.models import F
-        with transaction.atomic():
-            acct = CreditAccount.objects.select_for_update().get(pk=self.pk)
-            acct.balance = F('balance') - amount
-            acct.save()
-            acct.refresh_from_db()
-            return acct.balance
+    def save(self, *args, **kwargs):
+        from .search import normalize_search
+        self.search_name = normalize_search(self.name)
+        self.barcode = self.barcode or None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'search_name'}
+        super().save(*args, **kwargs)
 
+
+class CreditDailySpend(models.Model):
+    """
+    Credit sold to an account on one local day, kept by the checkout and
+    cancellations with the account row locked, so the daily limit is checked
+    against one row instead of summing the day's sales.
+    """
+    account = models.ForeignKey(CreditAccount, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='credit_daily_spend_unique'),
+        ]
+
+
+class CreditLedgerEntry(models.Model):
+    """
+    One movement of a credit account's balance, append-only. amount is the
+    signed change (charges add, payments and reversals subtract) and
+    balance_after the balance it left, so a statement is a range scan of
+    (account, created_at) with no joins or string matching.
+    """
+    KIND = (('charge', 'Charge'), ('payment', 'Payment'), ('reversal', 'Reversal'))
+
+    account = models.ForeignKey(CreditAccount, on_delete=models.PROTECT, related_name='ledger_entries')
+    transaction = models.ForeignKey(
+        'transactions.Transaction', on_delete=models.SET_NULL, null=True, blank=True, related_name='credit_entries'
+    )
+    kind = models.CharField(max_length=10, choices=KIND)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'created_at', 'id'], name='credit_ledger_account_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Credit ledger entries cannot be changed; post a reversal instead')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Credit ledger entries cannot be deleted; post a reversal instead')
+
+
+class PaymentBatch(models.Model):
+    """
+    A batch of credit payments posted together, kept for good under its
+    reference so posting the same batch again replays its result instead of
+    charging the payments twice.
+    """
+    reference = models.CharField(max_length=100, unique=True)
+    fingerprint = models.CharField(max_length=64, help_text='SHA-256 of the payments')
+    payment_count = models.PositiveIntegerField()
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.reference
@@ -0,0 +1,126 @@
+"""
+Batch payment posting for month-end settlements.
+
+A batch is posted in one database transaction: every account it pays is
+locked with one SELECT ... FOR UPDATE in primary key order (through
+StockLockManager, so it follows the global lock order), the new balances
+written with one bulk UPDATE, and the cashbook, ledger and audit rows
+bulk-inserted. The batch reference is claimed first, on a unique index, so
+a retry of the same batch waits for the first attempt and replays its
+result; the reference reused for different payments is refused.
+"""
+import hashlib
+import json
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from audit.models import AuditLog
+from ledger.models import CashBookEntry
+from reports.cache import invalidate_report_timestamps
+from .models import CreditAccount, CreditLedgerEntry, PaymentBatch
+
+MAX_BATCH_PAYMENTS = 2000
+
+
+class PaymentBatchConflict(ValueError):
+    """The batch reference was already used for different payments."""
+
+
+def _fingerprint(payments):
+    body = json.dumps(
+        [[p['account_id'], str(p['amount']), p.get('reference', '')] for p in payments], default=str
+    )
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(batch, fingerprint):
+    if batch.fingerprint != fingerprint:
+        raise PaymentBatchConflict(f'Batch {batch.reference} was already posted with different payments')
+    return batch.result, True
+
+
+def post_payment_batch(reference, payments, user):
+    """
+    Post payments ([{'account_id', 'amount', 'reference'}], amounts
+    positive) as batch reference. Returns (result, replayed); result lists
+    each account's new balance. Raises ValueError naming any unknown
+    accounts (nothing is posted) and PaymentBatchConflict for a reference
+    already used differently.
+    """
+    from inventory.services import StockLockManager
+
+    fingerprint = _fingerprint(payments)
+    existing = PaymentBatch.objects.filter(reference=reference).first()
+    if existing is not None:
+        return _replay(existing, fingerprint)
+
+    try:
+        with transaction.atomic():
+            batch = PaymentBatch.objects.create(
+                reference=reference,
+                fingerprint=fingerprint,
+                payment_count=len(payments),
+                total=sum((p['amount'] for p in payments), Decimal('0')),
+                created_by=user,
+            )
+            ids = {p['account_id'] for p in payments}
+            accounts = {
+                account.account_id: account
+                for account in StockLockManager().lock(CreditAccount, account_id__in=ids).values()
+            }
+            missing = sorted(ids - set(accounts))
+            if missing:
+                raise ValueError(f'Unknown account(s): {", ".join(missing)}')
+
+            now = timezone.now()
+            cashbook, ledger, audit = [], [], []
+            for payment in payments:
+                account, amount = accounts[payment['account_id']], payment['amount']
+                note = payment.get('reference', '')
+                old_balance = account.balance
+                account.balance = old_balance - amount
+                account.updated_at = now
+                cashbook.append(CashBookEntry(
+                    entry_type='income',
+                    amount=amount,
+                    description=f'Credit payment from {account.name} ({account.account_id}). {note}',
+                    created_by=user,
+                    date=now,
+                ))
+                ledger.append(CreditLedgerEntry(
+                    account=account, kind='payment', amount=-amount, balance_after=account.balance,
+                    description=note[:255], created_by=user, created_at=now,
+                ))
+                audit.append(AuditLog(
+                    who=user,
+                    action='payment',
+                    model='CreditAccount',
+                    previous_data={'balance': str(old_balance)},
+                    new_data={'account_id': account.account_id, 'balance': str(account.balance),
+                              'paid': str(amount), 'description': note, 'batch': reference}
+                ))
+
+            CreditAccount.objects.bulk_update(list(accounts.values()), ['balance', 'updated_at'])
+            CashBookEntry.objects.bulk_create(cashbook)
+            CreditLedgerEntry.objects.bulk_create(ledger)
+            AuditLog.objects.bulk_create(audit)
+            # bulk_create skips CashBookEntry.save(), which invalidates today's reports
+            invalidate_report_timestamps(now)
+
+            batch.result = {
+                'reference': reference,
+                'payment_count': batch.payment_count,
+                'total': str(batch.total),
+                'accounts': [
+                    {'account_id': account.account_id, 'name': account.name, 'new_balance': str(account.balance)}
+                    for account in sorted(accounts.values(), key=lambda a: a.account_id)
+                ],
+            }
+            batch.save(update_fields=['result'])
+            return batch.result, False
+    except IntegrityError:
+        # The same batch committed first from another request
+        existing = PaymentBatch.objects.filter(reference=reference).first()
+        if existing is None:
+            raise
+        return _replay(existing, fingerprint)
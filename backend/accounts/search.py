@@ -0,0 +1,86 @@
+"""
+Account lookup for the till: typeahead by name, account ID or roll number,
+and exact lookup by ID card barcode.
+
+Every match comes from an index: the account_id and barcode unique indexes,
+roll_no, and search_name, a normalized copy of the name (lowercase ASCII
+letters and digits, single spaces) whose prefixes are searched as a range,
+search_name >= 'ram' AND search_name < 'ran', which a plain b-tree serves on
+any database. On PostgreSQL a pg_trgm GIN index on search_name adds fuzzy
+matches anywhere in the name (surnames, typos), ranked by similarity.
+Each kind of match is one small query capped at the result size, merged in
+rank order: exact ID or barcode, ID prefix, roll number, name prefix,
+trigram.
+"""
+import re
+import unicodedata
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Func, Value
+from .models import CreditAccount
+
+LOOKUP_LIMIT = 10
+
+# pg_trgm's default similarity threshold for the % operator
+TRIGRAM_THRESHOLD = 0.3
+
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_search(text):
+    """'  Ramesh  Shrestha-K.' -> 'ramesh shrestha k'."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return _NOT_ALNUM.sub(' ', text.lower()).strip()
+
+
+def _prefix_range(field, prefix):
+    """Lookups selecting values of field that start with prefix, as an index range."""
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def _trigram_matches(query, limit):
+    similarity = Func(F('search_name'), Value(query), function='similarity', output_field=FloatField())
+    # search_name % query: the operator the GIN index serves. The SQL has to
+    # read %% for psycopg2, which turns it into a single %
+    similar = Func(F('search_name'), Value(query), template='%(expressions)s', arg_joiner=' %% ',
+                   output_field=BooleanField())
+    return CreditAccount.objects.filter(similar).annotate(
+        similarity=similarity
+    ).order_by('-similarity', 'search_name')[:limit]
+
+
+def find_by_barcode(code):
+    """The account whose ID card reads code (its barcode, or else its account_id), or None."""
+    code = (code or '').strip()
+    if not code:
+        return None
+    return (CreditAccount.objects.filter(barcode=code).first()
+            or CreditAccount.objects.filter(account_id=code).first())
+
+
+def lookup_accounts(query, limit=LOOKUP_LIMIT):
+    """Up to limit accounts matching query, best first."""
+    query = (query or '').strip()
+    name = normalize_search(query)
+    if not query:
+        return []
+
+    candidates = [
+        CreditAccount.objects.filter(account_id=query)[:1],
+        CreditAccount.objects.filter(barcode=query)[:1],
+        CreditAccount.objects.filter(**_prefix_range('account_id', query)).order_by('account_id')[:limit],
+        CreditAccount.objects.filter(roll_no=query).order_by('search_name')[:limit],
+    ]
+    if name:
+        candidates.append(
+            CreditAccount.objects.filter(**_prefix_range('search_name', name)).order_by('search_name')[:limit]
+        )
+        if connection.vendor == 'postgresql' and len(name) >= 3:
+            candidates.append(_trigram_matches(name, limit))
+
+    found = {}
+    for queryset in candidates:
+        for account in queryset:
+            found.setdefault(account.pk, account)
+        if len(found) >= limit:
+            break
+    return list(found.values())[:limit]
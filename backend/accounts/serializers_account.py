@@ -1,8 +1,38 @@
+from decimal import Decimal
 from rest_framework import serializers
-from .models import CreditAccount
+from .models import CreditAccount, CreditLedgerEntry
+from .payments import MAX_BATCH_PAYMENTS
 
 
 class CreditAccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = CreditAccount
         fields = '__all__'
+
+
+class AccountLookupSerializer(serializers.ModelSerializer):
+    """The few fields the till shows for a matching account."""
+
+    class Meta:
+        model = CreditAccount
+        fields = ['id', 'account_id', 'name', 'account_type', 'class_or_department', 'roll_no', 'balance']
+
+
+class CreditLedgerEntrySerializer(serializers.ModelSerializer):
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True, default=None)
+
+    class Meta:
+        model = CreditLedgerEntry
+        fields = ['id', 'kind', 'amount', 'balance_after', 'transaction', 'description',
+                  'created_by', 'created_by_username', 'created_at']
+
+
+class BatchPaymentSerializer(serializers.Serializer):
+    account_id = serializers.CharField(max_length=50)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    reference = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+
+class PaymentBatchSerializer(serializers.Serializer):
+    reference = serializers.CharField(max_length=100)
+    payments = BatchPaymentSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_PAYMENTS)
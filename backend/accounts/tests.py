@@ -0,0 +1,412 @@
+import os
+from unittest import skipUnless
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from ledger.models import CashBookEntry
+from menu.models import FoodItem
+from transactions.models import Receipt, Transaction
+from transactions.services import cancel_transaction_atomic, create_transaction_atomic
+from .models import CreditAccount, CreditLedgerEntry, User
+
+
+class CreditLedgerTests(TestCase):
+    """Every balance change appends a ledger entry; statements page through them."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+        self.student = CreditAccount.objects.create(account_id='S1', name='Student', account_type='student')
+        self.tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+
+    def sell(self, payment_type, quantity, **kwargs):
+        return create_transaction_atomic(
+            cashier=self.manager, payment_type=payment_type, linked_account_id='S1',
+            lines_data=[{'food_item': self.tea.pk, 'quantity': quantity, 'portion_type': 'full', 'unit_price': 20}],
+            **kwargs
+        )
+
+    def ledger(self):
+        return list(self.student.ledger_entries.order_by('created_at', 'id').values_list(
+            'kind', 'amount', 'balance_after', 'transaction'
+        ))
+
+    def test_every_balance_change_is_posted(self):
+        credit = self.sell('credit', 2)
+        mixed = self.sell('mixed', 5, cash_amount=30)
+        url = f'/api/accounts/{self.student.pk}/'
+        self.assertEqual(self.client.post(url + 'charge/', {'amount': '15', 'description': 'Books'}).status_code, 200)
+        self.assertEqual(self.client.post(url + 'payment/', {'amount': '50'}).status_code, 200)
+        cancel_transaction_atomic(mixed, self.manager)
+
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.balance, Decimal('5'))
+        self.assertEqual(self.ledger(), [
+            ('charge', Decimal('40'), Decimal('40'), credit.pk),
+            ('charge', Decimal('70'), Decimal('110'), mixed.pk),
+            ('charge', Decimal('15'), Decimal('125'), None),
+            ('payment', Decimal('-50'), Decimal('75'), None),
+            ('reversal', Decimal('-70'), Decimal('5'), mixed.pk),
+        ])
+        entry = CreditLedgerEntry.objects.first()
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+    def test_account_with_history_cannot_be_deleted(self):
+        self.sell('credit', 1)
+        resp = self.client.delete(f'/api/accounts/{self.student.pk}/')
+        self.assertEqual(resp.status_code, 409)
+        self.assertTrue(CreditAccount.objects.filter(pk=self.student.pk).exists())
+        unused = CreditAccount.objects.create(account_id='S9', name='Unused', account_type='student')
+        self.assertEqual(self.client.delete(f'/api/accounts/{unused.pk}/').status_code, 204)
+
+    def test_statement_pages_by_cursor(self):
+        for _ in range(5):
+            self.sell('credit', 1)
+        self.client.post(f'/api/accounts/{self.student.pk}/payment/', {'amount': '10'})
+        url = f'/api/accounts/{self.student.pk}/statement/'
+
+        first = self.client.get(url, {'limit': 4}).data
+        self.assertEqual([e['kind'] for e in first['entries']], ['payment', 'charge', 'charge', 'charge'])
+        self.assertEqual(first['entries'][0]['balance_after'], '90.00')
+        self.assertEqual((len(first['transactions']), len(first['payments'])), (3, 1))
+        self.assertEqual(first['payments'][0]['amount'], '10.00')
+
+        second = self.client.get(url, {'limit': 4, 'cursor': first['next_cursor']}).data
+        self.assertEqual([e['balance_after'] for e in second['entries']], ['40.00', '20.00'])
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+
+    def test_statement_export_reads_the_ledger(self):
+        self.sell('credit', 2)
+        resp = self.client.get('/api/reports/account-statement/S1/')
+        self.assertEqual(resp.status_code, 200)
+        body = b''.join(resp.streaming_content).decode()
+        self.assertIn('Charge,40.00,40.00,TX #', body)
+
+
+class CreditLedgerBackfillTests(TestCase):
+    """The backfill rebuilds the ledger of the sales and payments made before it existed."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        # 'S1' is a prefix of 'S10': exact references keep their histories apart
+        self.student = CreditAccount.objects.create(account_id='S1', name='Student', account_type='student',
+                                                    balance=Decimal('65'))
+        CreditAccount.objects.create(account_id='S10', name='Other', account_type='student', balance=Decimal('30'))
+        past = timezone.now() - timedelta(days=3)
+
+        def legacy_sale(account_id, payment_type, total, credit=None, canceled=False, hours=0):
+            tx = Transaction.objects.create(
+                cashier=self.manager, payment_type=payment_type, total_amount=total,
+                payment_reference=f'Credit: {account_id}', is_canceled=canceled,
+                timestamp=past + timedelta(hours=hours)
+            )
+            if credit is not None:
+                Receipt.objects.create(transaction=tx, token=f't{tx.pk}',
+                                       payload={'payment': {'credit_amount': credit}})
+            return tx
+
+        self.credit = legacy_sale('S1', 'credit', Decimal('40'), hours=1)
+        self.mixed = legacy_sale('S1', 'mixed', Decimal('100'), credit=60, hours=2)
+        legacy_sale('S1', 'credit', Decimal('25'), canceled=True, hours=3)
+        legacy_sale('S10', 'credit', Decimal('30'), hours=1)
+        payment = CashBookEntry.objects.create(entry_type='income', amount=Decimal('50'),
+                                               description='Credit payment from Student (S1). Cash')
+        CashBookEntry.objects.filter(pk=payment.pk).update(date=past + timedelta(hours=4))
+
+    def backfill(self):
+        call_command('backfill_credit_ledger', stdout=open(os.devnull, 'w'))
+
+    def test_backfill_chains_to_the_current_balance(self):
+        self.backfill()
+        entries = list(self.student.ledger_entries.order_by('created_at', 'id'))
+        self.assertEqual([(e.kind, e.amount, e.balance_after) for e in entries], [
+            # 15 of the balance (a manual charge, say) has no history to go on
+            ('charge', Decimal('15'), Decimal('15')),
+            ('charge', Decimal('40'), Decimal('55')),
+            ('charge', Decimal('60'), Decimal('115')),
+            ('charge', Decimal('25'), Decimal('140')),
+            ('reversal', Decimal('-25'), Decimal('115')),
+            ('payment', Decimal('-50'), Decimal('65')),
+        ])
+        self.assertEqual(entries[5].description, 'Cash')
+        other = CreditAccount.objects.get(account_id='S10').ledger_entries.values_list('amount', flat=True)
+        self.assertEqual(sorted(other), [Decimal('0'), Decimal('30')])
+
+        self.backfill()
+        self.assertEqual(CreditLedgerEntry.objects.count(), 8)
+
+    def test_legacy_sale_cancels_by_reference(self):
+        cancel_transaction_atomic(self.mixed, self.manager)
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.balance, Decimal('5'))
+        self.backfill()
+        # The history before the live reversal ends where that entry started
+        entries = list(self.student.ledger_entries.order_by('created_at', 'id'))
+        self.assertEqual((entries[-1].kind, entries[-1].balance_after), ('reversal', Decimal('5')))
+        self.assertEqual(entries[-2].balance_after, Decimal('65'))
+        self.assertEqual(entries[0].amount, Decimal('15'))
+
+
+class CreditLimitTests(TestCase):
+    """Credit sales are held to the account's limits, or its type's defaults."""
+
+    def setUp(self):
+        from core.models import Organization
+        org = Organization.get_instance()
+        org.settings = {'credit_limits': {'student': {'credit_limit': '100', 'daily_limit': '60'}}}
+        org.save()
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.student = CreditAccount.objects.create(account_id='S1', name='Student', account_type='student')
+        self.teacher = CreditAccount.objects.create(account_id='T1', name='Teacher', account_type='teacher')
+        self.tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+
+    def sell(self, account, quantity, **kwargs):
+        return create_transaction_atomic(
+            cashier=self.cashier, payment_type='credit', linked_account_id=account.account_id,
+            lines_data=[{'food_item': self.tea.pk, 'quantity': quantity, 'portion_type': 'full', 'unit_price': 20}],
+            **kwargs
+        )
+
+    def test_type_defaults_and_daily_cap(self):
+        from .limits import CreditLimitExceeded
+        from .models import CreditDailySpend
+        first = self.sell(self.student, 2)
+        with self.assertRaises(CreditLimitExceeded):
+            self.sell(self.student, 2)  # 80 today, over the daily 60
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.balance, Decimal('40'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        cancel_transaction_atomic(first, self.cashier)
+        self.sell(self.student, 3)
+        self.assertEqual(CreditDailySpend.objects.get(account=self.student).amount, Decimal('60'))
+
+        # Yesterday's spend counts against the balance limit, not today's cap
+        self.sell(self.student, 2, timestamp=timezone.now() - timedelta(days=1))
+        with self.assertRaises(CreditLimitExceeded):
+            self.sell(self.student, 1, timestamp=timezone.now() - timedelta(days=2))  # balance 120 > 100
+
+        # Teachers have no default: unlimited
+        self.sell(self.teacher, 50)
+
+    def test_account_limit_overrides_default_and_api_refuses(self):
+        CreditAccount.objects.filter(pk=self.student.pk).update(credit_limit=Decimal('500'), daily_limit=Decimal('200'))
+        self.sell(self.student, 8)
+        client = APIClient()
+        client.force_authenticate(user=self.cashier)
+        resp = client.post('/api/transactions/', {
+            'payment_type': 'credit', 'linked_account': 'S1',
+            'lines': [{'food_item': self.tea.pk, 'quantity': 3, 'portion_type': 'full', 'unit_price': 20}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('daily limit of 200', resp.data['detail'])
+
+    def test_limit_check_reads_one_row(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.sell(self.student, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.sell(self.student, 1)
+        spend_queries = [q['sql'] for q in queries if 'accounts_creditdailyspend' in q['sql']]
+        self.assertEqual(len(spend_queries), 2)  # the read and the increment
+
+
+class CreditAccountImportTests(TestCase):
+    """Rosters upsert by account_id in batches with one audit entry each."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+        CreditAccount.objects.create(account_id='S1', name='Old Name', account_type='student',
+                                     roll_no='7', balance=Decimal('40'))
+
+    def upload(self, name, content, **params):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return self.client.post(f'/api/accounts/import/?{"&".join(f"{k}={v}" for k, v in params.items())}',
+                                {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_csv_upserts_and_reports_bad_rows(self):
+        from audit.models import AuditLog
+        from .imports import import_accounts
+        import io
+        roster = (
+            'Account ID,Name,Account Type,Class or Department,Daily Limit\n'
+            'S1,New Name,Student,Grade 5,\n'
+            'S2,Second,student,Grade 6,50\n'
+            'S3,,teacher,,\n'
+            'S4,Fourth,parent,,abc\n'
+            'S2,Again,student,,\n'
+            ',,,,\n'
+            'T1,Teacher,TEACHER,Science,\n'
+        ).encode()
+        report = import_accounts(io.BytesIO(roster), 'roster.csv', user=self.manager, batch_size=2)
+        self.assertEqual((report['rows'], report['created'], report['updated']), (6, 2, 1))
+        self.assertEqual([(e['row'], sorted(e['errors'])) for e in report['errors']], [
+            (4, ['name']), (5, ['account_type', 'daily_limit']), (6, ['account_id']),
+        ])
+        s1 = CreditAccount.objects.get(account_id='S1')
+        # Columns absent from the file and the balance are left alone
+        self.assertEqual((s1.name, s1.class_or_department, s1.roll_no, s1.balance),
+                         ('New Name', 'Grade 5', '7', Decimal('40')))
+        self.assertEqual(CreditAccount.objects.get(account_id='S2').daily_limit, Decimal('50'))
+        self.assertEqual(CreditAccount.objects.get(account_id='T1').account_type, 'teacher')
+        self.assertEqual(AuditLog.objects.filter(action='import').count(), 2)
+
+    def test_columns_come_from_the_header_not_the_first_row(self):
+        from .imports import import_accounts
+        import io
+        roster = (
+            'account_id,name,account_type,class_or_department,roll_no\n'
+            'S5,Short,student\n'
+            'S1,New Name,student,Grade 9,8\n'
+        ).encode()
+        report = import_accounts(io.BytesIO(roster), 'roster.csv', user=self.manager)
+        self.assertEqual((report['created'], report['updated'], report['errors']), (1, 1, []))
+        s1 = CreditAccount.objects.get(account_id='S1')
+        self.assertEqual((s1.name, s1.class_or_department, s1.roll_no), ('New Name', 'Grade 9', '8'))
+        self.assertEqual(CreditAccount.objects.get(account_id='S5').roll_no, '')
+
+    def test_xlsx_upload_and_dry_run(self):
+        from openpyxl import Workbook
+        import io
+        workbook = Workbook()
+        workbook.active.append(['account_id', 'name', 'account_type', 'roll_no'])
+        workbook.active.append([1001, 'Numbered', 'student', 12.0])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        resp = self.upload('roster.xlsx', buffer.getvalue(), dry_run='true')
+        self.assertEqual((resp.status_code, resp.data['created']), (200, 1))
+        self.assertFalse(CreditAccount.objects.filter(account_id='1001').exists())
+
+        resp = self.upload('roster.xlsx', buffer.getvalue())
+        self.assertEqual(resp.data['errors'], [])
+        self.assertEqual(CreditAccount.objects.get(account_id='1001').roll_no, '12')
+
+        self.assertEqual(self.upload('roster.txt', b'x').status_code, 400)
+        self.assertEqual(self.upload('roster.csv', b'name,account_type\n').data['error'],
+                         'Missing column(s): account_id')
+        cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.client.force_authenticate(user=cashier)
+        self.assertEqual(self.upload('roster.csv', b'account_id,name,account_type\n').status_code, 403)
+
+
+class BatchPaymentTests(TestCase):
+    """A payment batch posts all or nothing, once per reference."""
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+        for account_id, balance in (('S1', '100'), ('S2', '80'), ('T1', '300')):
+            CreditAccount.objects.create(account_id=account_id, name=account_id, account_type='student',
+                                         balance=Decimal(balance))
+
+    def post(self, reference, payments):
+        return self.client.post('/api/accounts/batch-payments/', {'reference': reference, 'payments': payments},
+                                format='json')
+
+    def test_batch_posts_once(self):
+        from audit.models import AuditLog
+        payments = [
+            {'account_id': 'T1', 'amount': '250', 'reference': 'Salary deduction'},
+            {'account_id': 'S1', 'amount': '60', 'reference': 'Fees'},
+            {'account_id': 'S1', 'amount': '15'},
+        ]
+        # Claim, lock, one UPDATE and one INSERT per table, however many payments
+        with self.assertNumQueries(10):
+            resp = self.post('2026-09', payments)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['accounts'], [
+            {'account_id': 'S1', 'name': 'S1', 'new_balance': '25.00'},
+            {'account_id': 'T1', 'name': 'T1', 'new_balance': '50.00'},
+        ])
+        s1 = CreditAccount.objects.get(account_id='S1')
+        self.assertEqual(s1.balance, Decimal('25'))
+        self.assertEqual(list(s1.ledger_entries.order_by('id').values_list('balance_after', flat=True)),
+                         [Decimal('40'), Decimal('25')])
+        self.assertEqual(CashBookEntry.objects.filter(entry_type='income').count(), 3)
+        self.assertEqual(AuditLog.objects.filter(action='payment').count(), 3)
+
+        again = self.post('2026-09', payments)
+        self.assertEqual((again.status_code, again['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(again.data, resp.data)
+        self.assertEqual(CreditAccount.objects.get(account_id='S1').balance, Decimal('25'))
+        self.assertEqual(self.post('2026-09', payments[:1]).status_code, 422)
+
+    def test_unknown_account_posts_nothing(self):
+        resp = self.post('2026-10', [{'account_id': 'S2', 'amount': '10'}, {'account_id': 'NOPE', 'amount': '5'}])
+        self.assertEqual((resp.status_code, resp.data['error']), (400, 'Unknown account(s): NOPE'))
+        self.assertEqual(CreditAccount.objects.get(account_id='S2').balance, Decimal('80'))
+        self.assertEqual(self.post('2026-10', [{'account_id': 'S2', 'amount': '10'}]).status_code, 201)
+        self.assertEqual(self.post('bad', [{'account_id': 'S2', 'amount': '0'}]).status_code, 400)
+        self.assertEqual(self.post('bad', []).status_code, 400)
+
+
+class AccountLookupTests(TestCase):
+    """The till finds accounts through indexes, best matches first."""
+
+    def setUp(self):
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.cashier)
+        for account_id, name, roll_no in (
+            ('S12', 'Sita Sharma', '4'), ('S120', 'Ram Bahadur', '12'), ('S121', 'Rámesh  Shrestha', '7'),
+            ('T12', 'Ramila K.C.', ''), ('S2', 'Hari Ram', '12'),
+        ):
+            CreditAccount.objects.create(account_id=account_id, name=name, account_type='student', roll_no=roll_no)
+        CreditAccount.objects.filter(account_id='S2').update(barcode='8801234')
+
+    def lookup(self, **params):
+        resp = self.client.get('/api/accounts/lookup/', params)
+        self.assertEqual(resp.status_code, 200)
+        return [a['account_id'] for a in resp.data['results']]
+
+    def test_ranked_matches(self):
+        self.assertEqual(CreditAccount.objects.get(account_id='S121').search_name, 'ramesh shrestha')
+        # Exact ID, then other IDs with that prefix, then roll number 12
+        self.assertEqual(self.lookup(q='S12'), ['S12', 'S120', 'S121'])
+        self.assertEqual(self.lookup(q='12'), ['S2', 'S120'])  # by name
+        self.assertEqual(self.lookup(q='  RAM '), ['S120', 'S121', 'T12'])
+        self.assertEqual(self.lookup(q='8801234'), ['S2'])
+        self.assertEqual(self.lookup(q=''), [])
+        with self.assertNumQueries(5):
+            self.lookup(q='ram')
+
+    def test_barcode_scan(self):
+        resp = self.client.get('/api/accounts/lookup/', {'barcode': '8801234'})
+        self.assertEqual((resp.status_code, resp.data['account_id']), (200, 'S2'))
+        # A card without its own barcode carries the account ID
+        self.assertEqual(self.client.get('/api/accounts/lookup/', {'barcode': 'T12'}).data['name'], 'Ramila K.C.')
+        self.assertEqual(self.client.get('/api/accounts/lookup/', {'barcode': 'S1'}).status_code, 404)
+
+    def test_prefix_search_uses_index(self):
+        from .search import _prefix_range
+        plan = CreditAccount.objects.filter(**_prefix_range('search_name', 'ram')).order_by('search_name').explain()
+        self.assertIn('search_name', plan)
+        self.assertNotIn('SCAN accounts_creditaccount\n', plan + '\n')
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm matches run on PostgreSQL only')
+    def test_trigram_matches_inside_names(self):
+        # No ID, roll number or name starts with the surname
+        self.assertEqual(self.lookup(q='shrestha'), ['S121'])
+        self.assertEqual(self.lookup(q='sharmaa'), ['S12'])
+
+    def test_import_keeps_search_names(self):
+        from .imports import import_accounts
+        import io
+        report = import_accounts(io.BytesIO(b'account_id,name,account_type,barcode\nS12,Sita  Thapa,student,99\n'
+                                            b'S9,New One,student,99\nS8,Other,student,8801234\n'), 'r.csv')
+        self.assertEqual([(e['row'], list(e['errors'])) for e in report['errors']], [(3, ['barcode']), (4, ['barcode'])])
+        self.assertEqual(self.lookup(q='sita th'), ['S12'])
+        self.assertEqual(self.client.get('/api/accounts/lookup/', {'barcode': '99'}).data['account_id'], 'S12')
@@ -1,13 +1,21 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django.db import transaction as db_transaction
-from django.db.models import F
+from django.db.models import F, ProtectedError
 from decimal import Decimal
 from .models import User, CreditAccount
 from .serializers import UserSerializer, CustomTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers_account import CreditAccountSerializer
+from .serializers_account import (
+    AccountLookupSerializer, CreditAccountSerializer, CreditLedgerEntrySerializer, PaymentBatchSerializer
+)
+from . import credit_ledger
+from .imports import ImportFileError, import_accounts
+from .payments import PaymentBatchConflict, post_payment_batch
+from .search import find_by_barcode, lookup_accounts
 from .permissions import IsAdmin, IsManagerOrAdmin, IsCashierOrHigher
 from audit.models import AuditLog
 from django_filters import rest_framework as filters
@@ -88,6 +96,12 @@ class CreditAccountFilter(filters.FilterSet):
         fields = ['account_type', 'name', 'account_id', 'balance_min', 'balance_max', 'class_or_department']
 
 
+class AccountInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This account has credit history and cannot be deleted'
+    default_code = 'account_in_use'
+
+
 class CreditAccountViewSet(viewsets.ModelViewSet):
     queryset = CreditAccount.objects.all().order_by('name')
     serializer_class = CreditAccountSerializer
@@ -95,7 +109,7 @@ class CreditAccountViewSet(viewsets.ModelViewSet):
     filterset_class = CreditAccountFilter
     
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_accounts', 'batch_payments']:
             return [IsManagerOrAdmin()]
         return [IsCashierOrHigher()]
     
@@ -119,6 +133,54 @@ class CreditAccountViewSet(viewsets.ModelViewSet):
             new_data=serializer.data
         )
     
+    def perform_destroy(self, instance):
+        old_data = CreditAccountSerializer(instance).data
+        try:
+            with db_transaction.atomic():
+                instance.delete()
+        except ProtectedError:
+            # Its ledger entries (and sales) must outlive it
+            raise AccountInUse()
+        AuditLog.objects.create(
+            who=self.request.user,
+            action='delete',
+            model='CreditAccount',
+            previous_data=old_data
+        )
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """
+        Typeahead for the till: ?q= returns the 10 best matches by account ID,
+        roll number or name (see accounts.search); ?barcode= returns the one
+        account an ID card scan names, or 404.
+        """
+        barcode = request.query_params.get('barcode')
+        if barcode is not None:
+            account = find_by_barcode(barcode)
+            if account is None:
+                return Response({'error': 'No account for this card'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(AccountLookupSerializer(account).data)
+        accounts = lookup_accounts(request.query_params.get('q', ''))
+        return Response({'results': AccountLookupSerializer(accounts, many=True).data})
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_accounts(self, request):
+        """
+        Create or update accounts from a CSV/XLSX roster uploaded as "file",
+        keyed by account_id (see accounts.imports). ?dry_run=true only
+        validates. Returns the counts and the rows skipped with their errors.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the roster as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        try:
+            report = import_accounts(upload, upload.name, user=request.user, dry_run=dry_run)
+        except ImportFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(dict(report, dry_run=dry_run))
+
     @action(detail=True, methods=['post'])
     def charge(self, request, pk=None):
         """Add charge to account (increase balance - they owe more)."""
@@ -137,6 +199,7 @@ class CreditAccountViewSet(viewsets.ModelViewSet):
             acct.balance = F('balance') + amount
             acct.save()
             acct.refresh_from_db()
+            credit_ledger.post_entry(acct, 'charge', amount, description=description, user=request.user)
         
         AuditLog.objects.create(
             who=request.user,
@@ -172,6 +235,7 @@ class CreditAccountViewSet(viewsets.ModelViewSet):
             acct.balance = F('balance') - amount
             acct.save()
             acct.refresh_from_db()
+            credit_ledger.post_entry(acct, 'payment', -amount, description=description, user=request.user)
             
             # Create cashbook entry for the payment
             from ledger.models import CashBookEntry
@@ -198,34 +262,60 @@ class CreditAccountViewSet(viewsets.ModelViewSet):
             'new_balance': str(acct.balance)
         })
     
+    @action(detail=False, methods=['post'], url_path='batch-payments')
+    def batch_payments(self, request):
+        """
+        Post many payments at once: {"reference": batch reference, "payments":
+        [{"account_id", "amount", "reference"}]}. All or nothing; posting the
+        same reference again replays the result (see accounts.payments).
+        """
+        serializer = PaymentBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result, replayed = post_payment_batch(
+                serializer.validated_data['reference'], serializer.validated_data['payments'], request.user
+            )
+        except PaymentBatchConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response(result, status=status.HTTP_200_OK if replayed else status.HTTP_201_CREATED)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
     @action(detail=True, methods=['get'])
     def statement(self, request, pk=None):
-        """Get account statement with transaction history."""
+        """
+        Account statement from the credit ledger, newest first, a page at a
+        time: ?limit= entries (default 50) older than ?cursor= (the
+        next_cursor of the previous page).
+        """
         account = self.get_object()
-        
-        # Get all transactions linked to this account
-        from transactions.models import Transaction
+        try:
+            limit = int(request.query_params.get('limit', credit_ledger.STATEMENT_PAGE_SIZE))
+            entries, next_cursor = credit_ledger.statement_page(
+                account, request.query_params.get('cursor'), limit
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor or limit'}, status=status.HTTP_400_BAD_REQUEST)
+
         from transactions.serializers import TransactionSerializer
-        
-        transactions = Transaction.objects.filter(
-            payment_reference__icontains=account.account_id
-        ).order_by('-timestamp')[:50]
-        
-        # Also get payments from cashbook
-        from ledger.models import CashBookEntry
-        payments = CashBookEntry.objects.filter(
-            description__icontains=account.account_id
-        ).order_by('-date')[:50]
-        
+        sales = [e.transaction for e in entries if e.kind == 'charge' and e.transaction is not None]
+
         return Response({
             'account': CreditAccountSerializer(account).data,
-            'transactions': TransactionSerializer(transactions, many=True).data,
+            'entries': CreditLedgerEntrySerializer(entries, many=True).data,
+            'next_cursor': next_cursor,
+            # The charged sales and the payments of this page, as before the ledger
+            'transactions': TransactionSerializer(sales, many=True).data,
             'payments': [
                 {
-                    'date': p.date,
-                    'type': p.entry_type,
-                    'amount': str(p.amount),
-                    'description': p.description
-                } for p in payments
+                    'date': e.created_at,
+                    'type': 'income',
+                    'amount': str(-e.amount),
+                    'description': e.description
+                } for e in entries if e.kind == 'payment' and e.transaction is None
             ]
         })
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model', 'when'], name='audit_model_when_idx'),
+        ),
+    ]
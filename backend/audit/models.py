@@ -10,5 +10,8 @@ class AuditLog(models.Model):
     previous_data = models.JSONField(null=True, blank=True)
     new_data = models.JSONField(null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['model', 'when'], name='audit_model_when_idx')]
+
     def __str__(self):
         return f"{self.when} {self.who} {self.action} {self.model}"
@@ -3,6 +3,7 @@ from pathlib import Path
 import os
 import dj_database_url
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -86,6 +87,15 @@ DATABASES = {
 if os.environ.get('DATABASE_URL'):
     DATABASES['default'] = dj_database_url.parse(os.environ.get('DATABASE_URL'), conn_max_age=600)
 
+# Live stock/menu events for /api/events/: LISTEN/NOTIFY reaches every gunicorn
+# worker on Postgres; other databases fall back to in-process delivery
+EVENT_BROKER = 'postgres' if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' else 'memory'
+
+# Each open stream holds a worker thread for its whole lifetime: a worker
+# answers 503 + Retry-After beyond this many, keeping the rest of its
+# GUNICORN_THREADS (gunicorn.conf.py) for the API
+EVENT_STREAMS_PER_WORKER = int(os.environ.get('EVENT_STREAMS_PER_WORKER', 8))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 # Internationalization
@@ -131,6 +141,47 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Cache. Versions of in-process tables (e.g. the menu price table) live here, so
+# every gunicorn worker must use the same backend: on Postgres a database table
+# (created by core's migrations); a SQLite development server is one process
+# and keeps them in local memory. Memcached/Redis can replace either.
+SHARED_CACHE_TABLE = "canteen_cache"
+SHARED_CACHE = {
+    "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+    "LOCATION": SHARED_CACHE_TABLE,
+    "OPTIONS": {"MAX_ENTRIES": 20000},
+}
+SHARED_CACHES = DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+CACHES = {
+    "default": SHARED_CACHE if SHARED_CACHES else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Report results and their per-day data versions (reports.cache); the same
+    # applies, since a write bumps the version only in the backend it can see
+    "reports": dict(SHARED_CACHE, KEY_PREFIX="reports") if SHARED_CACHES else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "reports",
+        "OPTIONS": {"MAX_ENTRIES": 2000},
+    },
+}
+
+# Cache alias holding report results, and how long (seconds) a report is kept:
+# one over past days until evicted (None), one that covers today briefly. A
+# local-memory alias misses the invalidations of other workers, so there past
+# reports are kept for REPORT_CACHE_LOCAL_PAST_TTL instead
+REPORT_CACHE = "reports"
+REPORT_CACHE_PAST_TTL = None
+REPORT_CACHE_LOCAL_PAST_TTL = 300
+REPORT_CACHE_RECENT_TTL = 30
+
+# How long a POST /api/transactions/ Idempotency-Key replays its stored response
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Background exports (core.ExportJob): how long a finished file is kept, and
+# after how long a running job whose worker vanished is picked up again
+EXPORT_JOB_TTL = timedelta(hours=24)
+EXPORT_JOB_TIMEOUT = timedelta(minutes=30)
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -141,6 +192,10 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# The POS sends an Idempotency-Key with every sale and revalidates the menu snapshot
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key", "if-none-match")
+CORS_EXPOSE_HEADERS = ["ETag"]
+
 # For development, allow all origins
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
@@ -5,15 +5,16 @@ from django.conf.urls.static import static
 from rest_framework import routers
 from accounts.views import UserViewSet, CreditAccountViewSet, CustomTokenObtainPairView
 from menu.views import FoodItemViewSet
+from core.views import EventStreamView
 from transactions.views import TransactionViewSet
-from ledger.views import CashBookViewSet, ExpenseViewSet
+from ledger.views import CashBookViewSet, DayCloseViewSet, ExpenseViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from reports.views import (
     DailySummaryView, MonthlySummaryView, CustomRangeReportView,
-    OutstandingCreditView, CashOnHandView, ExportAccountStatementView
+    OutstandingCreditView, CashOnHandView, ExportAccountStatementView, ReportCacheStatsView
 )
 
 # API Router
@@ -24,6 +25,7 @@ router.register(r'transactions', TransactionViewSet)
 router.register(r'accounts', CreditAccountViewSet)
 router.register(r'cashbook', CashBookViewSet)
 router.register(r'expenses', ExpenseViewSet)
+router.register(r'day-closes', DayCloseViewSet)
 
 # Swagger/OpenAPI schema
 schema_view = get_schema_view(
@@ -55,6 +57,10 @@ urlpatterns = [
     path('api/reports/outstanding-credit/', OutstandingCreditView.as_view(), name='outstanding-credit'),
     path('api/reports/cash-on-hand/', CashOnHandView.as_view(), name='cash-on-hand'),
     path('api/reports/account-statement/<str:account_id>/', ExportAccountStatementView.as_view(), name='account-statement'),
+    path('api/reports/cache-stats/', ReportCacheStatsView.as_view(), name='report-cache-stats'),
+
+    # Live stock and menu updates (Server-Sent Events)
+    path('api/events/', EventStreamView.as_view(), name='events'),
     
     # Swagger/OpenAPI
     path('api/core/', include('core.urls')),
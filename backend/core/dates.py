@@ -0,0 +1,55 @@
+"""
+Local-date filtering on timestamp columns.
+
+Lookups such as timestamp__date=, __date__gte, __year and __month convert
+every row to the local timezone (Asia/Kathmandu) before comparing, so the
+database cannot use an index on the column. These helpers turn local dates
+into half-open [start, end) ranges of aware datetimes instead, which compare
+against the stored UTC values directly.
+"""
+import calendar
+from datetime import date, datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
+
+
+def day_start(day):
+    """The aware datetime at which local date day begins."""
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def month_days(year, month):
+    """First and last date of a month."""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def date_range_q(field, date_from=None, date_to=None):
+    """
+    Q selecting rows whose timestamp field falls on local days
+    date_from..date_to (inclusive); either end may be left open. date.min
+    and date.max are open ends too: their bounds are not valid datetimes in UTC.
+    """
+    q = Q()
+    if date_from is not None and date_from > date.min:
+        q &= Q(**{f'{field}__gte': day_start(date_from)})
+    if date_to is not None and date_to < date.max:
+        q &= Q(**{f'{field}__lt': day_start(date_to + timedelta(days=1))})
+    return q
+
+
+class LocalDateFilter(filters.DateFilter):
+    """
+    DateFilter for a DateTimeField matching by local day, as a timestamp range.
+    lookup_expr is 'exact' (that day), 'gte' (from that day) or 'lte' (up to
+    and including that day).
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        date_from = value if self.lookup_expr in ('exact', 'gte') else None
+        date_to = value if self.lookup_expr in ('exact', 'lte') else None
+        qs = self.get_method(qs)(date_range_q(self.field_name, date_from, date_to))
+        return qs.distinct() if self.distinct else qs
@@ -0,0 +1,155 @@
+"""
+Pub/sub for live stock and menu updates streamed to the tills over /api/events/.
+
+Events are published when the surrounding transaction commits. LocalBroker fans
+them out to the streams of this process only (tests, runserver). PostgresBroker
+sends them through NOTIFY, and one LISTEN connection per process hands every
+notification to that process's streams, so a sale served by one gunicorn worker
+reaches tills connected to any other.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'canteen_events'
+
+# Marker put on a subscription that fell behind; the stream tells the till to resync
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    """One stream's queue of events. Close it when the stream ends."""
+
+    def __init__(self, broker, maxsize=500):
+        self.broker = broker
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Too slow to keep up: drop the backlog and ask for a full refetch
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.queue.put_nowait(RESYNC)
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBroker:
+    """In-process fan-out. Also the delivery half of PostgresBroker."""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def deliver(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def publish(self, event):
+        self.deliver(event)
+
+
+class PostgresBroker(LocalBroker):
+    """Cross-process fan-out through Postgres LISTEN/NOTIFY."""
+
+    def __init__(self, channel=CHANNEL):
+        super().__init__()
+        self.channel = channel
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, event):
+        payload = json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def subscribe(self):
+        self._ensure_listener()
+        return super().subscribe()
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            db = connections.create_connection('default')
+            try:
+                db.ensure_connection()
+                db.set_autocommit(True)
+                raw = db.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([raw], [], [], 30) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.deliver(json.loads(raw.notifies.pop(0).payload))
+            except Exception:
+                logger.exception('Event listener lost its connection, reconnecting')
+                # Events may have been missed while disconnected
+                self.deliver(RESYNC)
+                time.sleep(1)
+            finally:
+                db.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if settings.EVENT_BROKER == 'postgres':
+                    _broker = PostgresBroker()
+                else:
+                    _broker = LocalBroker()
+    return _broker
+
+
+def publish(event_type, **data):
+    """Publish an event to every connected till once the current transaction commits."""
+    event = {'type': event_type, **data}
+    transaction.on_commit(lambda: get_broker().publish(event), robust=True)
@@ -0,0 +1,227 @@
+"""
+Background export jobs.
+
+A request enqueues an ExportJob; the run_export_jobs worker claims jobs with
+SELECT ... FOR UPDATE SKIP LOCKED (so several workers never pick the same one)
+and produces the file with the same functions the export endpoints call, fed
+the job's params, so filters and file layouts stay defined in one place. The
+file is written under MEDIA_ROOT/exports/ and served by the download endpoint.
+"""
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker died is picked up again after EXPORT_JOB_TIMEOUT,
+# at most this many times in all
+MAX_ATTEMPTS = 3
+
+MANAGER_ROLES = ('manager', 'admin')
+CASHIER_ROLES = ('cashier', 'manager', 'admin')
+
+
+def _day(params, name):
+    try:
+        return datetime.strptime(params.get(name, ''), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def _gzip(params):
+    return params.get('compress') == 'gzip'
+
+
+def _render_transactions_csv(params):
+    from transactions.views import filtered_transactions, transactions_csv
+    return transactions_csv(filtered_transactions(params), gzip=_gzip(params))
+
+
+def _render_transactions_excel(params):
+    from transactions.views import filtered_transactions, transactions_excel
+    return transactions_excel(filtered_transactions(params), params)
+
+
+def _render_vendor_ledger(params):
+    from inventory.views import filtered_vendor_transactions, vendor_ledger_csv
+    return vendor_ledger_csv(filtered_vendor_transactions(params), params.get('vendor'), gzip=_gzip(params))
+
+
+def _render_account_statement(params):
+    from accounts.models import CreditAccount
+    from reports.views import account_statement_csv
+    account = CreditAccount.objects.filter(account_id=params['account_id']).first()
+    if account is None:
+        raise ValueError('Account not found')
+    return account_statement_csv(account, gzip=_gzip(params))
+
+
+def _render_daily_summary(params):
+    from reports.excel_utils import generate_daily_summary_excel
+    from reports.views import daily_summary
+    target_date = _day(params, 'date') if params.get('date') else timezone.localdate()
+    return generate_daily_summary_excel(str(target_date), daily_summary(target_date)[0])
+
+
+def _render_monthly_summary(params):
+    from reports.excel_utils import generate_monthly_summary_excel
+    from reports.views import monthly_summary
+    today = timezone.localdate()
+    try:
+        year, month = int(params.get('year', today.year)), int(params.get('month', today.month))
+    except ValueError:
+        raise ValueError('Invalid year or month')
+    if not (1 <= month <= 12 and 1 <= year <= 9999):
+        raise ValueError('Invalid year or month')
+    return generate_monthly_summary_excel(year, month, monthly_summary(year, month)[0])
+
+
+def _render_custom_report(params):
+    from reports.views import custom_report
+    data, _ = custom_report(
+        _day(params, 'date_from'), _day(params, 'date_to'),
+        params.get('food_item'), params.get('cashier'), params.get('payment_type'),
+    )
+    response = HttpResponse(json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+    response['Content-Disposition'] = 'attachment; filename="custom_report.json"'
+    return response
+
+
+# render(params) returns the download as an HTTP response, like the endpoint
+ExportKind = namedtuple('ExportKind', ['render', 'required', 'roles'])
+
+EXPORT_KINDS = {
+    'transactions_csv': ExportKind(_render_transactions_csv, (), CASHIER_ROLES),
+    'transactions_excel': ExportKind(_render_transactions_excel, (), CASHIER_ROLES),
+    'vendor_ledger': ExportKind(_render_vendor_ledger, (), MANAGER_ROLES),
+    'account_statement': ExportKind(_render_account_statement, ('account_id',), MANAGER_ROLES),
+    'daily_summary': ExportKind(_render_daily_summary, (), MANAGER_ROLES),
+    'monthly_summary': ExportKind(_render_monthly_summary, (), MANAGER_ROLES),
+    'custom_report': ExportKind(_render_custom_report, ('date_from', 'date_to'), MANAGER_ROLES),
+}
+
+
+def allowed_kinds(user):
+    return [kind for kind, spec in EXPORT_KINDS.items() if user.role in spec.roles]
+
+
+def dedup_key(kind, params):
+    payload = json.dumps({'kind': kind, 'params': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue_export(kind, params, user):
+    """
+    Queue an export, or join the queued/running job with the same kind and
+    params. Joining users are recorded so they can poll and download it.
+    Returns (job, created).
+    """
+    key = dedup_key(kind, params)
+    active = ExportJob.objects.filter(dedup_key=key, status__in=ExportJob.ACTIVE_STATUSES)
+    job = active.first()
+    if job is not None:
+        _join(job, user)
+        return job, False
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(kind=kind, params=params, dedup_key=key, requested_by=user), True
+    except IntegrityError:
+        # Another request queued it first
+        job = active.first()
+        if job is None:
+            raise
+        _join(job, user)
+        return job, False
+
+
+def _join(job, user):
+    if job.requested_by_id != user.pk:
+        job.shared_with.add(user)
+
+
+def claim_next_job():
+    """Mark the oldest waiting job (or one abandoned by a dead worker) running and return it."""
+    now = timezone.now()
+    stale = now - getattr(settings, 'EXPORT_JOB_TIMEOUT', timedelta(minutes=30))
+    with transaction.atomic():
+        job = ExportJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status='queued') | Q(status='running', started_at__lt=stale)
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+            job.error = 'Export did not finish after several attempts'
+            job.finished_at = now
+            job.save(update_fields=['status', 'error', 'finished_at'])
+            return None
+        job.status = 'running'
+        job.started_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts'])
+        return job
+
+
+def run_job(job):
+    """Produce the job's file and record the outcome. Never raises."""
+    try:
+        with tempfile.TemporaryFile() as output:
+            filename = render_export(job, output)
+            output.seek(0)
+            job.file.save(f'{uuid.uuid4().hex}/{filename}', File(output), save=False)
+        job.filename = filename
+        job.status = 'done'
+        job.expires_at = timezone.now() + getattr(settings, 'EXPORT_JOB_TTL', timedelta(hours=24))
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'filename', 'status', 'error', 'finished_at', 'expires_at'])
+
+
+def render_export(job, output):
+    """
+    Produce the job's file as its requester would get it from the endpoint,
+    writing the body to output. Returns the download filename. Raises
+    ValueError if the export cannot be run with the job's params.
+    """
+    spec = EXPORT_KINDS[job.kind]
+    user = job.requested_by
+    if user is None:
+        raise ValueError('The user who requested this export no longer exists')
+    if user.role not in spec.roles:
+        raise ValueError('The user who requested this export may no longer run it')
+
+    params = {key: str(value) for key, value in job.params.items()}
+    response = spec.render(params)
+    try:
+        for chunk in (response.streaming_content if response.streaming else [response.content]):
+            output.write(chunk)
+    finally:
+        response.close()
+
+    disposition = re.search(r'filename="([^"]+)"', response.get('Content-Disposition', ''))
+    return disposition.group(1) if disposition else f'{job.kind}.json'
+
+
+def purge_expired_exports():
+    """Delete finished jobs past expires_at together with their files."""
+    expired = ExportJob.objects.filter(expires_at__lt=timezone.now())
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+    return expired.delete()[0]
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.export_jobs import claim_next_job, purge_expired_exports, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued export jobs. Several workers may run side by side; each job is claimed by one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every waiting job, then exit')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            purged = purge_expired_exports()
+            if purged:
+                self.stdout.write(f'Removed {purged} expired export(s)')
+
+            job = claim_next_job()
+            if job is not None:
+                run_job(job)
+                self.stdout.write(f'{job}: {job.filename or job.error}')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll'])
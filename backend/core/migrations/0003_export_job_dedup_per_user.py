@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_export_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='dedup_key',
+            field=models.CharField(help_text='SHA-256 of user, kind and params', max_length=64),
+        ),
+    ]
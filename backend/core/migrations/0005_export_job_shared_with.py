@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-17 09:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0004_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='shared_with',
+            field=models.ManyToManyField(blank=True, help_text='Users who joined this job with an identical request', related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='dedup_key',
+            field=models.CharField(help_text='SHA-256 of kind and params', max_length=64),
+        ),
+    ]
@@ -24,3 +24,49 @@ class Organization(models.Model):
     def get_instance(cls):
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
+
+
+class ExportJob(models.Model):
+    """
+    A report export run by the run_export_jobs worker instead of inside a web
+    request. Identical requests (same kind and params) share one queued or
+    running job, and users who join it are added to shared_with; the finished
+    file is kept under MEDIA_ROOT until expires_at.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    dedup_key = models.CharField(max_length=64, help_text="SHA-256 of kind and params")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    requested_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, related_name='+')
+    shared_with = models.ManyToManyField(
+        'accounts.User', blank=True, related_name='+', help_text="Users who joined this job with an identical request"
+    )
+    file = models.FileField(upload_to='exports/', blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'], condition=models.Q(status__in=('queued', 'running')),
+                name='export_job_one_active_per_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -1,7 +1,45 @@
 from rest_framework import serializers
-from .models import Organization
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.reverse import reverse
+from .export_jobs import EXPORT_KINDS, allowed_kinds
+from .models import ExportJob, Organization
 
 class OrganizationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organization
         fields = '__all__'
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'kind', 'params', 'status', 'filename', 'error', 'created_at', 'started_at',
+                  'finished_at', 'expires_at', 'download_url']
+        read_only_fields = ['status', 'filename', 'error', 'created_at', 'started_at', 'finished_at', 'expires_at']
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        return reverse('export-job-download', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+    def validate_kind(self, value):
+        if value not in EXPORT_KINDS:
+            raise serializers.ValidationError(f'Unknown export. Choose from: {", ".join(EXPORT_KINDS)}')
+        if value not in allowed_kinds(self.context['request'].user):
+            raise PermissionDenied('You are not allowed to run this export')
+        return value
+
+    def validate_params(self, value):
+        if not isinstance(value, dict) or not all(
+            isinstance(v, (str, int, float, bool)) for v in value.values()
+        ):
+            raise serializers.ValidationError('params must be an object of plain values')
+        return value
+
+    def validate(self, data):
+        missing = [k for k in EXPORT_KINDS[data['kind']].required if k not in data.get('params', {})]
+        if missing:
+            raise serializers.ValidationError({'params': [f'{", ".join(missing)} required']})
+        return data
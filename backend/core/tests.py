@@ -1,3 +1,285 @@
+import json
+import os
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from inventory.models import Ingredient, Recipe, RecipeIngredient
+from menu.models import FoodItem
+from transactions.services import create_transaction_atomic
+from . import events
 
-# Create your tests here.
+
+class EventBrokerTests(TestCase):
+    def setUp(self):
+        self.subscription = events.get_broker().subscribe()
+        self.addCleanup(self.subscription.close)
+
+    def drain(self):
+        received = []
+        while (event := self.subscription.get(timeout=0)) is not None:
+            received.append(event)
+        return received
+
+    def test_published_only_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    events.publish('food_item', id=1)
+                    raise ValueError
+            except ValueError:
+                pass
+            events.publish('food_item', id=2)
+        self.assertEqual(self.drain(), [{'type': 'food_item', 'id': 2}])
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        broker = events.LocalBroker()
+        subscription = broker.subscribe()
+        subscription.queue.maxsize = 2
+        for i in range(3):
+            broker.publish({'type': 'food_item', 'id': i})
+        self.assertEqual(subscription.get(timeout=0), events.RESYNC)
+        self.assertIsNone(subscription.get(timeout=0))
+
+    def test_sale_publishes_availability_and_low_stock(self):
+        cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=1000, reorder_level=500)
+        momo = FoodItem.objects.create(name='Momo', price_full=100, available_portions=['full'])
+        chowmein = FoodItem.objects.create(name='Chowmein', price_full=80, available_portions=['full'])
+        for item in (momo, chowmein):
+            RecipeIngredient.objects.create(recipe=Recipe.objects.create(food_item=item), ingredient=flour, quantity=600)
+
+        self.drain()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_transaction_atomic(
+                cashier=cashier, payment_type='cash',
+                lines_data=[{'food_item': momo.pk, 'quantity': 1, 'portion_type': 'full', 'unit_price': 100}]
+            )
+        received = self.drain()
+
+        low = [e for e in received if e['type'] == 'ingredient_low_stock']
+        self.assertEqual([(e['id'], e['current_quantity']) for e in low], [(flour.pk, flour.current_quantity - 600)])
+        deltas = {d['id']: d for e in received if e['type'] == 'availability' for d in e['items']}
+        self.assertEqual(set(deltas), {momo.pk, chowmein.pk})
+        self.assertTrue(all(d['is_sold_out'] and d['can_make'] == 0 for d in deltas.values()))
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cashier', password='pass', role='cashier')
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 401)
+
+    def test_streams_committed_events(self):
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get('/api/events/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        stream = iter(resp.streaming_content)
+        self.assertIn(b': connected', next(stream))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            events.publish('food_item_deleted', id=7)
+        self.assertEqual(next(stream), b'event: food_item_deleted\ndata: {"type":"food_item_deleted","id":7}\n\n')
+        resp.close()
+
+    def test_streams_per_worker_are_capped(self):
+        from django.test import override_settings
+        self.client.force_authenticate(user=self.user)
+        with override_settings(EVENT_STREAMS_PER_WORKER=1):
+            first = self.client.get('/api/events/', HTTP_ACCEPT='text/event-stream')
+            second = self.client.get('/api/events/', HTTP_ACCEPT='text/event-stream')
+            self.assertEqual((first.status_code, second.status_code), (200, 503))
+            self.assertEqual(second['Retry-After'], '10')
+            # A stream closed before it was ever read gives its slot back
+            first.close()
+            third = self.client.get('/api/events/', HTTP_ACCEPT='text/event-stream')
+            self.assertEqual(third.status_code, 200)
+            third.close()
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.other_manager = User.objects.create_user(username='mgr2', password='pass', role='manager')
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+
+    def _queue(self, user, kind, **params):
+        self.client.force_authenticate(user=user)
+        return self.client.post('/api/core/export-jobs/', {'kind': kind, 'params': params}, format='json')
+
+    def test_identical_requests_share_one_job(self):
+        first = self._queue(self.manager, 'monthly_summary', year=2026, month=1)
+        second = self._queue(self.manager, 'monthly_summary', year=2026, month=1)
+        other = self._queue(self.manager, 'monthly_summary', year=2026, month=2)
+        self.assertEqual(first.status_code, 202)
+        self.assertFalse(first.data['deduplicated'])
+        self.assertTrue(second.data['deduplicated'])
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertNotEqual(first.data['id'], other.data['id'])
+
+    def test_identical_requests_from_different_users_share_one_job(self):
+        from django.core.management import call_command
+        job_id = self._queue(self.manager, 'monthly_summary', year=2026, month=1).data['id']
+        joined = self._queue(self.other_manager, 'monthly_summary', year=2026, month=1)
+        self.assertTrue(joined.data['deduplicated'])
+        self.assertEqual(joined.data['id'], job_id)
+
+        # The joining manager can poll and download the shared job
+        self.assertEqual([j['id'] for j in self.client.get('/api/core/export-jobs/').data['results']], [job_id])
+        call_command('run_export_jobs', '--once', stdout=open(os.devnull, 'w'))
+        status_data = self.client.get(f'/api/core/export-jobs/{job_id}/').data
+        self.assertEqual(self.client.get(status_data['download_url']).status_code, 200)
+
+        # A user who never asked for it does not see it
+        self.client.force_authenticate(user=User.objects.create_user(username='mgr3', password='pass', role='manager'))
+        self.assertEqual(self.client.get(f'/api/core/export-jobs/{job_id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/core/export-jobs/').data['results'], [])
+
+        self.client.force_authenticate(user=User.objects.create_user(username='admin', password='pass', role='admin'))
+        self.assertEqual(self.client.get(f'/api/core/export-jobs/{job_id}/').status_code, 200)
+
+    def test_worker_produces_downloadable_file(self):
+        from django.core.management import call_command
+        from .models import ExportJob
+        item = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        create_transaction_atomic(
+            cashier=self.cashier, payment_type='cash',
+            lines_data=[{'food_item': item.pk, 'quantity': 2, 'portion_type': 'full', 'unit_price': 20}]
+        )
+        job_id = self._queue(self.cashier, 'transactions_csv', payment_type='cash').data['id']
+        self.assertIsNone(self.client.get(f'/api/core/export-jobs/{job_id}/').data['download_url'])
+
+        call_command('run_export_jobs', '--once', stdout=open(os.devnull, 'w'))
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.filename), ('done', 'transactions.csv'))
+        self.assertTrue(job.file.name.startswith('exports/'))
+
+        status_data = self.client.get(f'/api/core/export-jobs/{job_id}/').data
+        resp = self.client.get(status_data['download_url'])
+        self.assertEqual(resp.status_code, 200)
+        body = b''.join(resp.streaming_content).decode()
+        self.assertIn('Tea (full) x2', body)
+        # The next identical request starts a fresh job
+        self.assertNotEqual(self._queue(self.cashier, 'transactions_csv', payment_type='cash').data['id'], job_id)
+
+    def test_worker_runs_every_report_kind(self):
+        from django.core.management import call_command
+        from .models import ExportJob
+        queued = {
+            self._queue(self.manager, kind, **params).data['id']: filename
+            for kind, params, filename in (
+                ('daily_summary', {'date': '2026-01-05'}, 'daily_summary_2026-01-05.xlsx'),
+                ('monthly_summary', {'year': 2026, 'month': 1}, 'monthly_summary_2026_01.xlsx'),
+                ('custom_report', {'date_from': '2026-01-01', 'date_to': '2026-01-31'}, 'custom_report.json'),
+                ('vendor_ledger', {'compress': 'gzip'}, 'vendor_ledger_all.csv.gz'),
+            )
+        }
+        call_command('run_export_jobs', '--once', stdout=open(os.devnull, 'w'))
+        jobs = ExportJob.objects.in_bulk(queued)
+        self.assertEqual({pk: (job.status, job.filename) for pk, job in jobs.items()},
+                         {pk: ('done', filename) for pk, filename in queued.items()})
+        with ExportJob.objects.get(kind='custom_report').file.open('rb') as f:
+            self.assertEqual(json.load(f)['date_from'], '2026-01-01')
+
+    def test_permissions_and_failures(self):
+        from django.core.management import call_command
+        from .models import ExportJob
+        self.assertEqual(self._queue(self.cashier, 'account_statement', account_id='S1').status_code, 403)
+        self.assertEqual(self._queue(self.manager, 'account_statement').status_code, 400)
+
+        job_id = self._queue(self.manager, 'account_statement', account_id='NOPE').data['id']
+        call_command('run_export_jobs', '--once', stdout=open(os.devnull, 'w'))
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'Account not found')
+        self.assertEqual(self.client.get(f'/api/core/export-jobs/{job_id}/download/').status_code, 409)
+
+    def test_abandoned_job_is_picked_up_again(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .export_jobs import claim_next_job, enqueue_export
+        job, _ = enqueue_export('daily_summary', {}, self.manager)
+        self.assertEqual(claim_next_job().pk, job.pk)
+        self.assertIsNone(claim_next_job())
+        job.__class__.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_next_job().attempts, 2)
+
+
+class DateRangeTests(TestCase):
+    """Local-date filters become UTC timestamp ranges that the composite indexes serve."""
+
+    def setUp(self):
+        from django.db import connection
+        if connection.vendor == 'postgresql':
+            # The test tables are tiny; make the planner show whether an index applies
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_date_range_is_half_open_in_utc(self):
+        from datetime import date, datetime, timezone as dt_timezone
+        from .dates import date_range_q
+        (_, start), (_, end) = date_range_q('timestamp', date(2026, 3, 1), date(2026, 3, 31)).children
+        # Asia/Kathmandu is UTC+05:45
+        self.assertEqual(start, datetime(2026, 2, 28, 18, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual(end, datetime(2026, 3, 31, 18, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual([lookup for lookup, _ in date_range_q('timestamp', date(2026, 3, 1)).children], ['timestamp__gte'])
+
+    def test_transaction_filter_uses_local_days(self):
+        from datetime import datetime, timezone as dt_timezone
+        from transactions.models import Transaction
+        manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        # 23:00 and 00:30 local on 1 and 2 March
+        for hour, minute in ((17, 15), (18, 45)):
+            Transaction.objects.create(payment_type='cash', total_amount=10, cashier=manager,
+                                       timestamp=datetime(2026, 3, 1, hour, minute, tzinfo=dt_timezone.utc))
+        client = APIClient()
+        client.force_authenticate(user=manager)
+        def count(**params):
+            return client.get('/api/transactions/', params).data['count']
+        self.assertEqual(count(date='2026-03-01'), 1)
+        self.assertEqual(count(date_from='2026-03-02'), 1)
+        self.assertEqual(count(date_to='2026-03-02'), 2)
+        self.assertEqual(count(year=2026, month=3), 2)
+        self.assertEqual(count(year=2026, month=13), 0)
+        # The calendar's last and first days are open ends, not a 500
+        self.assertEqual(count(date_to='9999-12-31'), 2)
+        self.assertEqual(count(date='9999-12-31'), 0)
+        self.assertEqual(count(date_from='0001-01-01'), 2)
+
+    def test_report_filters_use_indexes(self):
+        from datetime import date
+        from audit.models import AuditLog
+        from inventory.models import StockMovement
+        from ledger.models import CashBookEntry, Expense
+        from transactions.models import Transaction
+        from .dates import date_range_q
+        day = date(2026, 3, 1)
+        self.assertUsesIndex(
+            Transaction.objects.filter(date_range_q('timestamp', day, day), is_canceled=False),
+            'tx_timestamp_canceled_idx')
+        self.assertUsesIndex(
+            Transaction.objects.filter(date_range_q('timestamp', day, day), cashier_id=1),
+            'tx_cashier_timestamp_idx')
+        self.assertUsesIndex(
+            CashBookEntry.objects.filter(date_range_q('date', day, day)), 'cashbook_date_type_idx')
+        self.assertUsesIndex(Expense.objects.filter(date_range_q('date', day, day)), 'expense_date_idx')
+        self.assertUsesIndex(
+            StockMovement.objects.filter(ingredient_id=1).order_by('-timestamp'), 'movement_ingredient_ts_idx')
+        self.assertUsesIndex(
+            AuditLog.objects.filter(date_range_q('when', day), model='Transaction'), 'audit_model_when_idx')
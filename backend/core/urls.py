@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrganizationViewSet, SetupView
+from .views import ExportJobViewSet, OrganizationViewSet, SetupView
 
 router = DefaultRouter()
 router.register(r'organization', OrganizationViewSet, basename='organization')
+router.register(r'export-jobs', ExportJobViewSet, basename='export-job')
 
 urlpatterns = [
     path('', include(router.urls)),
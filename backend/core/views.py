@@ -1,9 +1,21 @@
-from rest_framework import viewsets, permissions, status, views
+from rest_framework import mixins, viewsets, permissions, status, views
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django.contrib.auth import get_user_model
-from .models import Organization
-from .serializers import OrganizationSerializer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+import json
+import threading
+import time
+from django.conf import settings
+from accounts.permissions import IsCashierOrHigher
+from . import events
+from .export_jobs import allowed_kinds, enqueue_export
+from .models import ExportJob, Organization
+from .serializers import ExportJobSerializer, OrganizationSerializer
 
 User = get_user_model()
 
@@ -77,3 +89,133 @@ class SetupView(views.APIView):
         )
 
         return Response({'status': 'Setup complete', 'admin_id': admin.id})
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class _StreamSlots:
+    """Count of the event streams open in this process, up to EVENT_STREAMS_PER_WORKER."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+
+    def claim(self):
+        with self._lock:
+            if self.open >= getattr(settings, 'EVENT_STREAMS_PER_WORKER', 8):
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+_stream_slots = _StreamSlots()
+
+
+class _EventStreamBody:
+    """
+    Body of one stream; closing it ends the subscription and frees the slot
+    whether or not the stream was ever read.
+    """
+
+    def __init__(self, chunks, subscription):
+        self._chunks = chunks
+        self._subscription = subscription
+        self._open = True
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+        self._subscription.close()
+        if self._open:
+            self._open = False
+            _stream_slots.release()
+
+
+class EventStreamView(views.APIView):
+    """
+    Server-Sent Events stream of stock and menu changes as they commit:
+    'availability', 'food_item', 'food_item_deleted', 'ingredient_low_stock',
+    and 'resync' when the till may have missed something and should refetch
+    the menu snapshot. Streams end after STREAM_LIFETIME; clients reconnect.
+    A worker holds at most EVENT_STREAMS_PER_WORKER streams; past that it
+    answers 503 with Retry-After, so streams cannot take every thread.
+    """
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+    HEARTBEAT = 15
+    STREAM_LIFETIME = 5 * 60
+    RETRY_AFTER = 10
+
+    def get(self, request):
+        if not _stream_slots.claim():
+            response = Response({'error': 'Too many open event streams'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(self.RETRY_AFTER)
+            return response
+        # Subscribe before returning so nothing committed after this point is missed
+        subscription = events.get_broker().subscribe()
+        response = StreamingHttpResponse(
+            _EventStreamBody(self._stream(subscription), subscription), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Let nginx pass events through immediately
+        return response
+
+    def _stream(self, subscription):
+        deadline = time.monotonic() + self.STREAM_LIFETIME
+        # The stream never touches the database; don't hold a connection per till
+        connection.close()
+        with subscription:
+            yield 'retry: 3000\n: connected\n\n'
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=self.HEARTBEAT)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                data = json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':'))
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+
+
+class ExportJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Background exports. POST {kind, params} queues one (or joins the queued
+    job with the same parameters) with 202; poll the job until its status is
+    'done', then fetch download_url. Users see the jobs they requested or
+    joined; admins see everyone's.
+    """
+    serializer_class = ExportJobSerializer
+    permission_classes = [IsCashierOrHigher]
+
+    def get_queryset(self):
+        jobs = ExportJob.objects.filter(kind__in=allowed_kinds(self.request.user))
+        if self.request.user.role != 'admin':
+            user = self.request.user
+            jobs = jobs.filter(Q(requested_by=user) | Q(shared_with=user)).distinct()
+        return jobs
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, created = enqueue_export(
+            serializer.validated_data['kind'], serializer.validated_data.get('params', {}), request.user
+        )
+        data = self.get_serializer(job).data
+        data['deduplicated'] = not created
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'done' or not job.file:
+            return Response({'error': f'Export is {job.status}'}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
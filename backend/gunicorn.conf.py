@@ -0,0 +1,17 @@
+"""
+Gunicorn settings, overridable from the environment.
+
+Every open /api/events/ stream holds one thread of a worker for up to
+EventStreamView.STREAM_LIFETIME, so a worker only accepts
+EVENT_STREAMS_PER_WORKER of them (settings.py) and keeps the rest of its
+threads for the API. Size workers x (threads - streams) for the API load and
+workers x streams for the tills. Several workers need the shared cache
+(settings.SHARED_CACHE, on Postgres) for the price, menu and report versions.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', min(2 * multiprocessing.cpu_count() + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
@@ -0,0 +1,64 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from accounts.models import User
+from menu.models import FoodItem
+from transactions.services import create_transaction_atomic
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure checkout throughput on one pre-made item with its stock in 1 shard '
+        'against 8, from concurrent threads. Runs in a throwaway test database; '
+        'meaningful only on PostgreSQL (SQLite serialises every write).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--sales', type=int, default=50, help='Sales per thread')
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 8])
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('Not on PostgreSQL: the figures below say little about production.'))
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            cashier = User.objects.create_user(username='bench-cashier', password='bench', role='cashier')
+            for shards in options['shards']:
+                rate, failures = self._run(cashier, shards, options['threads'], options['sales'])
+                self.stdout.write(f'{shards:>3} shard(s): {rate:8.1f} sales/s  ({failures} failed)')
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, cashier, shards, threads, sales):
+        total = threads * sales
+        item = FoodItem.objects.create(
+            name=f'Bench Samosa x{shards}', price_full=20, available_portions=['full'],
+            stock_quantity=total, stock_shards=shards,
+        )
+        lines = [{'food_item': item.pk, 'quantity': 1, 'portion_type': 'full', 'unit_price': 20}]
+        failures = []
+        start = threading.Barrier(threads)
+
+        def till():
+            start.wait()
+            try:
+                for _ in range(sales):
+                    try:
+                        create_transaction_atomic(cashier=cashier, payment_type='cash', lines_data=lines)
+                    except Exception as e:
+                        failures.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=till) for _ in range(threads)]
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - began
+        return (total - len(failures)) / elapsed, len(failures)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from menu.models import FoodItem
+from inventory.services import refresh_availability
+
+
+class Command(BaseCommand):
+    help = 'Recompute every stored FoodItemAvailability row from current stock and recipes'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            food_item_ids = list(FoodItem.objects.values_list('pk', flat=True))
+            refresh_availability(food_item_ids=food_item_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt availability for {len(food_item_ids)} food items'))
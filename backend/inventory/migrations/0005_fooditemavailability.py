@@ -0,0 +1,62 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_availability(apps, schema_editor):
+    FoodItem = apps.get_model('menu', 'FoodItem')
+    FoodItemAvailability = apps.get_model('inventory', 'FoodItemAvailability')
+
+    records = {}
+    rows = FoodItem.objects.values_list(
+        'pk', 'stock_quantity',
+        'recipe__ingredients__ingredient_id',
+        'recipe__ingredients__quantity',
+        'recipe__ingredients__ingredient__current_quantity',
+    )
+    for fid, stock_quantity, ingredient_id, qty, current in rows:
+        record = records.setdefault(fid, {'stock': stock_quantity, 'count': 0, 'can_make': None, 'limiting': None})
+        if ingredient_id is None:
+            continue
+        record['count'] += 1
+        if qty > 0:
+            possible = int(current / qty)
+            if record['can_make'] is None or possible < record['can_make']:
+                record['can_make'], record['limiting'] = possible, ingredient_id
+
+    objs = []
+    for fid, record in records.items():
+        can_make = record['can_make'] or 0
+        sold_out = record['stock'] <= 0 if record['stock'] is not None else can_make < 1
+        objs.append(FoodItemAvailability(
+            food_item_id=fid,
+            can_make=can_make,
+            recipe_ingredient_count=record['count'],
+            limiting_ingredient_id=record['limiting'],
+            is_sold_out=sold_out,
+        ))
+    FoodItemAvailability.objects.bulk_create(objs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_fooditem_image'),
+        ('inventory', '0004_purchaseorder_payment_method_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodItemAvailability',
+            fields=[
+                ('food_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability_record', serialize=False, to='menu.fooditem')),
+                ('can_make', models.IntegerField(default=0, help_text='Portions current ingredient stock can make')),
+                ('recipe_ingredient_count', models.IntegerField(default=0)),
+                ('is_sold_out', models.BooleanField(default=True, help_text="86'd: no pre-made stock, or not enough ingredients for one portion")),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('limiting_ingredient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.ingredient')),
+            ],
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+    ]
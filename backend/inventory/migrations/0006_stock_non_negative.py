@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+def clamp_negative_stock(apps, schema_editor):
+    Ingredient = apps.get_model('inventory', 'Ingredient')
+    Ingredient.objects.filter(current_quantity__lt=0).update(current_quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_fooditemavailability'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.CheckConstraint(check=models.Q(('current_quantity__gte', 0)), name='ingredient_quantity_non_negative'),
+        ),
+    ]
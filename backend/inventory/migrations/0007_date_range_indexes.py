@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['ingredient', 'timestamp'], name='movement_ingredient_ts_idx'),
+        ),
+    ]
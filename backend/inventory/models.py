@@ -53,9 +53,28 @@ class Ingredient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(current_quantity__gte=0), name='ingredient_quantity_non_negative'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.unit})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .services import refresh_availability, publish_low_stock
+        publish_low_stock([self])
+        refresh_availability(ingredient_ids=[self.pk])
+
+    def delete(self, *args, **kwargs):
+        # Recipes using this ingredient lose a row, so recompute them afterwards
+        food_item_ids = list(RecipeIngredient.objects.filter(ingredient=self).values_list('recipe__food_item_id', flat=True))
+        result = super().delete(*args, **kwargs)
+        from .services import refresh_availability
+        refresh_availability(food_item_ids=food_item_ids)
+        return result
+
 class StockMovement(models.Model):
     TYPE_CHOICES = [
         ('IN', 'Stock In'),
@@ -79,6 +98,9 @@ class StockMovement(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['ingredient', 'timestamp'], name='movement_ingredient_ts_idx')]
+
     def __str__(self):
         return f"{self.movement_type} - {self.ingredient.name} ({self.quantity})"
 
@@ -91,6 +113,13 @@ class Recipe(models.Model):
     def __str__(self):
         return f"Recipe for {self.food_item.name}"
 
+    def delete(self, *args, **kwargs):
+        food_item_id = self.food_item_id
+        result = super().delete(*args, **kwargs)
+        from .services import refresh_availability
+        refresh_availability(food_item_ids=[food_item_id])
+        return result
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredients')
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
@@ -99,6 +128,34 @@ class RecipeIngredient(models.Model):
     def __str__(self):
         return f"{self.ingredient.name} for {self.recipe.food_item.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .services import refresh_availability
+        refresh_availability(food_item_ids=[self.recipe.food_item_id])
+
+    def delete(self, *args, **kwargs):
+        food_item_id = self.recipe.food_item_id
+        result = super().delete(*args, **kwargs)
+        from .services import refresh_availability
+        refresh_availability(food_item_ids=[food_item_id])
+        return result
+
+class FoodItemAvailability(models.Model):
+    """
+    Materialized availability of one FoodItem. Rewritten by
+    inventory.services.refresh_availability in the same transaction as every
+    stock change, so menu reads never redo the recipe math.
+    """
+    food_item = models.OneToOneField(FoodItem, on_delete=models.CASCADE, primary_key=True, related_name='availability_record')
+    can_make = models.IntegerField(default=0, help_text="Portions current ingredient stock can make")
+    recipe_ingredient_count = models.IntegerField(default=0)
+    limiting_ingredient = models.ForeignKey(Ingredient, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    is_sold_out = models.BooleanField(default=True, help_text="86'd: no pre-made stock, or not enough ingredients for one portion")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.food_item.name}: {'sold out' if self.is_sold_out else self.can_make}"
+
 class PurchaseOrder(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -21,6 +21,7 @@ class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
+        extra_kwargs = {'current_quantity': {'min_value': 0}}
 
 class StockMovementSerializer(serializers.ModelSerializer):
     ingredient_name = serializers.ReadOnlyField(source='ingredient.name')
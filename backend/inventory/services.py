@@ -1,8 +1,212 @@
+import random
 from decimal import Decimal
 from django.db import transaction
-from .models import Ingredient, StockMovement, Recipe, RecipeIngredient, VendorTransaction, PurchaseOrder
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from core import events
+from .models import Ingredient, StockMovement, Recipe, RecipeIngredient, VendorTransaction, PurchaseOrder, FoodItemAvailability
 from ledger.models import CashBookEntry, Expense
 
+
+# Every operation that mutates stock takes its row locks through StockLockManager,
+# table by table in this order and by primary key within a table. Two tills can
+# then never each hold a lock the other one is waiting for, whatever they sell.
+STOCK_LOCK_ORDER = (
+    'inventory.PurchaseOrder',
+    'menu.FoodItem',
+    'menu.FoodItemStockShard',
+    'inventory.Ingredient',
+    'inventory.FoodItemAvailability',
+    'accounts.CreditAccount',
+    'reports.DailySales',
+    'reports.DailyItemSales',
+)
+
+
+# Items per 'availability' event
+AVAILABILITY_EVENT_BATCH = 50
+
+
+class StockLockManager:
+    """
+    Acquire the row locks of one stock operation in the global STOCK_LOCK_ORDER.
+    Must be used inside transaction.atomic(). Asking for a table that ranks before
+    one already locked raises RuntimeError, so a code path that would invert the
+    order fails loudly in tests instead of deadlocking at the till.
+
+    Stock itself is moved with take()/give(): one UPDATE per row that changes
+    the quantity in the database, so each row is locked by a single statement
+    instead of a SELECT ... FOR UPDATE, a read and a write.
+    """
+
+    def __init__(self):
+        self._rank = -1
+
+    def acquire(self, model):
+        """
+        Declare that rows of model are about to be locked, by this manager or by
+        the caller's own statements. Raises RuntimeError on an order violation.
+        """
+        label = model._meta.label
+        rank = STOCK_LOCK_ORDER.index(label)
+        if rank < self._rank:
+            raise RuntimeError(f"Lock order violation: {label} requested after {STOCK_LOCK_ORDER[self._rank]}")
+        self._rank = rank
+
+    def lock(self, model, **lookup):
+        """Lock every row matching lookup in primary key order. Returns {pk: row}."""
+        self.acquire(model)
+        rows = model.objects.select_for_update().filter(**lookup).order_by('pk')
+        return {row.pk: row for row in rows}
+
+    def lock_one(self, model, **lookup):
+        """Lock a single row, raising model.DoesNotExist like QuerySet.get()."""
+        rows = self.lock(model, **lookup)
+        if len(rows) != 1:
+            raise model.DoesNotExist(f"{model.__name__} matching {lookup} does not exist")
+        return next(iter(rows.values()))
+
+    def take(self, model, field, amounts, extra=None):
+        """
+        Decrement field by amounts[pk] on each row, in primary key order, with
+        UPDATE ... SET field = field - X WHERE id = ? AND field >= X.
+        extra(amount) may return more columns to set in the same statement.
+        Returns the pk of the first row that did not have enough (rows after it
+        are left alone), or None when every row was decremented.
+        """
+        self.acquire(model)
+        for pk in sorted(amounts):
+            amount = amounts[pk]
+            updates = {field: F(field) - amount, **(extra(amount) if extra else {})}
+            if not model.objects.filter(pk=pk, **{f'{field}__gte': amount}).update(**updates):
+                return pk
+        return None
+
+    def give(self, model, field, amounts, **updates):
+        """
+        Increment field by amounts[pk] on each row, one UPDATE per row in primary
+        key order. A NULL field (an item not tracking stock yet) starts from zero.
+        """
+        self.acquire(model)
+        for pk in sorted(amounts):
+            model.objects.filter(pk=pk).update(**{field: Coalesce(F(field), 0) + amounts[pk]}, **updates)
+
+    def upsert(self, model, rows, unique_field, update_fields):
+        """
+        INSERT ... ON CONFLICT (unique_field) DO UPDATE the rows, sorted by
+        unique_field so the conflicting rows are locked in the same order by
+        every writer.
+        """
+        self.acquire(model)
+        attname = model._meta.get_field(unique_field).attname
+        model.objects.bulk_create(
+            sorted(rows, key=lambda row: getattr(row, attname)),
+            update_conflicts=True,
+            unique_fields=[unique_field],
+            update_fields=update_fields,
+        )
+
+    def take_sharded(self, amounts, shard_counts):
+        """
+        Take pre-made stock held in FoodItemStockShard rows. Per item, try its
+        shards in random order with one conditional UPDATE each, so concurrent
+        sales mostly land on different rows; if no single shard holds enough,
+        lock them all and drain across them. Returns the id of the first item
+        that is short overall, or None.
+        """
+        from menu.models import FoodItemStockShard
+
+        self.acquire(FoodItemStockShard)
+        shards = FoodItemStockShard.objects
+        for fid in sorted(amounts):
+            amount = amounts[fid]
+            order = list(range(shard_counts[fid]))
+            random.shuffle(order)
+            if any(
+                shards.filter(food_item_id=fid, shard=shard, quantity__gte=amount).update(quantity=F('quantity') - amount)
+                for shard in order
+            ):
+                continue
+            rows = list(shards.select_for_update().filter(food_item_id=fid).order_by('shard'))
+            if sum(row.quantity for row in rows) < amount:
+                return fid
+            remaining = amount
+            for row in rows:
+                part = min(row.quantity, remaining)
+                if part:
+                    shards.filter(pk=row.pk).update(quantity=F('quantity') - part)
+                    remaining -= part
+        return None
+
+    def give_sharded(self, amounts, shard_counts, spread=False):
+        """
+        Add pre-made stock to FoodItemStockShard rows: all of it to one random
+        shard, or with spread=True split evenly over every shard (production).
+        """
+        from menu.models import FoodItemStockShard
+
+        self.acquire(FoodItemStockShard)
+        shards = FoodItemStockShard.objects
+        for fid in sorted(amounts):
+            count = shard_counts[fid]
+            if spread:
+                parts = split_evenly(amounts[fid], count)
+            else:
+                parts = [0] * count
+                parts[random.randrange(count)] = amounts[fid]
+            for shard, part in enumerate(parts):
+                if part:
+                    shards.filter(food_item_id=fid, shard=shard).update(quantity=F('quantity') + part)
+
+
+def split_evenly(total, count):
+    """Split total into count near-equal parts, the remainder going to the first ones."""
+    base, extra = divmod(total, count)
+    return [base + (1 if i < extra else 0) for i in range(count)]
+
+
+def rebuild_stock_shards(food_item):
+    """
+    Lay food_item.stock_quantity out again over its stock_shards rows (or drop
+    the rows when the item is no longer sharded). Called by FoodItem.save(),
+    inside the transaction that holds the item and shard locks.
+    """
+    from menu.models import FoodItemStockShard
+
+    FoodItemStockShard.objects.filter(food_item=food_item).delete()
+    if food_item.is_sharded():
+        FoodItemStockShard.objects.bulk_create([
+            FoodItemStockShard(food_item=food_item, shard=shard, quantity=part)
+            for shard, part in enumerate(split_evenly(food_item.stock_quantity, food_item.stock_shards))
+        ])
+
+
+def deactivate_sold_out_shards(food_item_ids):
+    """
+    Deactivate sharded items whose shards are all empty. Run after the sale
+    commits: the FoodItem row ranks before the shards in the lock order, so the
+    sale itself cannot go back and update it.
+    """
+    from menu.models import FoodItem
+
+    with transaction.atomic():
+        emptied = list(FoodItem.objects.with_stock_on_hand().filter(
+            pk__in=food_item_ids, is_active=True, stock_on_hand__lte=0
+        ).values_list('pk', flat=True))
+        if emptied:
+            FoodItem.objects.filter(pk__in=emptied).update(is_active=False)
+            refresh_availability(food_item_ids=emptied)
+
+
+def sold_out_updates(amount):
+    """take() extras for FoodItem.stock_quantity: deactivate the item when the sale empties it."""
+    from django.utils import timezone
+    return {
+        'is_active': Case(When(stock_quantity__lte=amount, then=Value(False)), default=F('is_active')),
+        'updated_at': timezone.now(),
+    }
+
+
 def record_vendor_transaction(vendor, amount, transaction_type, reference, user, notes=''):
     """
     Record a credit/debit transaction for a vendor and update balance.
@@ -52,39 +256,44 @@ def process_purchase_order(po_id, user):
     """
     Mark PO as received, update stock, and credit vendor account.
     """
-    try:
-        po = PurchaseOrder.objects.get(id=po_id)
-    except PurchaseOrder.DoesNotExist:
-        return
-        
-    if po.status == 'RECEIVED':
-        return # Already processed
-
     from django.utils import timezone
     with transaction.atomic():
+        locks = StockLockManager()
+        try:
+            po = locks.lock_one(PurchaseOrder, pk=po_id)
+        except PurchaseOrder.DoesNotExist:
+            return
+
+        if po.status == 'RECEIVED':
+            return # Already processed
+
         po.status = 'RECEIVED'
         po.received_at = timezone.now()
         po.save()
 
         # Update Stock for each item
-        for item in po.items.all():
-            ingredient = item.ingredient
+        items = list(po.items.all())
+
+        # Safe vendor name access
+        vendor_name = po.vendor.name if po.vendor else 'Cash Purchase'
+        received = {}
+        movements = []
+        for item in items:
             qty = item.received_quantity if item.received_quantity > 0 else item.quantity
             qty = Decimal(str(qty)) # Ensure Decimal for arithmetic
-            ingredient.current_quantity += qty
-            ingredient.save()
-
-            # Safe vendor name access
-            vendor_name = po.vendor.name if po.vendor else 'Cash Purchase'
-            StockMovement.objects.create(
-                ingredient=ingredient,
+            received[item.ingredient_id] = received.get(item.ingredient_id, 0) + qty
+            movements.append(StockMovement(
+                ingredient_id=item.ingredient_id,
                 quantity=qty,
                 movement_type='IN',
                 reason='PURCHASE',
                 reference=f'PO #{po.id}',
                 user=user,
                 notes=f'Received from {vendor_name} ({po.payment_method})'
-            )
+            ))
+        locks.give(Ingredient, 'current_quantity', received, updated_at=timezone.now())
+        StockMovement.objects.bulk_create(movements)
+        stock_changed(ingredient_ids=received, locks=locks)
 
         # Credit Vendor Ledger only if Credit and Vendor is selected
         if po.total_amount > 0 and po.payment_method == 'CREDIT' and po.vendor:
@@ -115,100 +324,349 @@ def process_purchase_order(po_id, user):
             )
 
 
-def deduct_stock_for_transaction(tx_line):
+def _food_item_id(value):
+    """Accept either a FoodItem instance or a raw primary key."""
+    return value.id if hasattr(value, 'id') else int(value)
+
+
+def load_basket_stock(food_item_ids):
     """
-    Deduct ingredients from stock based on a TransactionLine.
-    If FoodItem tracks stock (stock_quantity is not None), deduct from that instead.
-    If a recipe exists for the FoodItem, deduct the required ingredients.
+    Read the FoodItems of a basket and the recipes of its made-to-order items.
+    Nothing is locked here: stock is taken afterwards with conditional UPDATEs.
+    Returns (food_items, recipes) where recipes maps a made-to-order food item
+    id to a list of (ingredient_id, quantity_per_unit).
     """
-    # CRITICAL: Re-fetch food_item with lock to ensure we use latest DB state
-    # This uses the lock acquired in create_transaction_atomic if called from there
     from menu.models import FoodItem
-    from .models import Recipe, Ingredient, StockMovement
-    
-    food_item = FoodItem.objects.select_for_update().get(id=tx_line.food_item.id)
-    quantity_sold = Decimal(str(tx_line.quantity))
-    
-    # Check if FoodItem tracks its own stock (Batch Production / Pre-made)
-    if food_item.stock_quantity is not None:
-        food_item.stock_quantity -= int(quantity_sold)
-        if food_item.stock_quantity <= 0:
-            food_item.stock_quantity = 0
-            food_item.is_active = False # Auto-deactivate when sold out
-        food_item.save()
-        return # Skip ingredient deduction as it was done during production
 
-    try:
-        recipe = Recipe.objects.get(food_item=food_item)
-    except Recipe.DoesNotExist:
-        # No recipe defined, skip deduction
+    food_item_ids = {_food_item_id(fi) for fi in food_item_ids}
+    food_items = FoodItem.objects.in_bulk(food_item_ids)
+    if len(food_items) != len(food_item_ids):
+        raise FoodItem.DoesNotExist(f"FoodItem(s) not found: {sorted(food_item_ids - set(food_items))}")
+
+    # Pre-made items carry their own stock; only made-to-order items consume ingredients
+    recipes = {}
+    made_to_order = [fid for fid, fi in food_items.items() if fi.stock_quantity is None]
+    if made_to_order:
+        rows = RecipeIngredient.objects.filter(
+            recipe__food_item_id__in=made_to_order
+        ).values_list('recipe__food_item_id', 'ingredient_id', 'quantity')
+        for fid, ingredient_id, qty in rows:
+            recipes.setdefault(fid, []).append((ingredient_id, qty))
+    return food_items, recipes
+
+
+def take_basket_stock(basket, stock, locks=None):
+    """
+    Take the stock a basket needs. basket is a list of (food_item_id, quantity);
+    stock is the pair returned by load_basket_stock. Demand is summed per row and
+    taken with one conditional UPDATE per pre-made item, then one per ingredient
+    (the global lock order), so stock can never go below zero; sharded items
+    are taken from one of their shards. Raises ValueError
+    naming the first line that cannot be served; the caller's transaction undoes
+    whatever was already taken.
+    Returns the ingredient consumption as (food_item, quantity, ingredient_id, deduction_qty).
+    """
+    from django.utils import timezone
+    from menu.models import FoodItem
+
+    locks = locks or StockLockManager()
+    food_items, recipes = stock
+    pre_made, sharded, ingredient_demand, consumption = {}, {}, {}, []
+    for fid, quantity in basket:
+        food_item = food_items[fid]
+        quantity = int(quantity)
+        if food_item.stock_quantity is not None:
+            demand = sharded if food_item.is_sharded() else pre_made
+            demand[fid] = demand.get(fid, 0) + quantity
+            continue
+        # No recipe = nothing to deduct
+        for ingredient_id, qty in recipes.get(fid, []):
+            deduction_qty = qty * Decimal(quantity)
+            ingredient_demand[ingredient_id] = ingredient_demand.get(ingredient_id, 0) + deduction_qty
+            consumption.append((food_item, quantity, ingredient_id, deduction_qty))
+
+    short = locks.take(FoodItem, 'stock_quantity', pre_made, extra=sold_out_updates)
+    if short is not None:
+        taken = {pk: amount for pk, amount in pre_made.items() if pk < short}
+        raise _shortfall_error(basket, stock, taken, {})
+    short = locks.take_sharded(sharded, {fid: food_items[fid].stock_shards for fid in sharded})
+    if short is not None:
+        taken = {pk: amount for pk, amount in sharded.items() if pk < short}
+        raise _shortfall_error(basket, stock, {**pre_made, **taken}, {})
+    now = timezone.now()
+    short = locks.take(Ingredient, 'current_quantity', ingredient_demand, extra=lambda amount: {'updated_at': now})
+    if short is not None:
+        taken = {pk: amount for pk, amount in ingredient_demand.items() if pk < short}
+        raise _shortfall_error(basket, stock, {**pre_made, **sharded}, taken)
+    if sharded:
+        ids = list(sharded)
+        transaction.on_commit(lambda: deactivate_sold_out_shards(ids))
+    return consumption
+
+
+def _shortfall_error(basket, stock, taken_food_items, taken_ingredients):
+    """
+    Build the ValueError for a basket that could not be served, worded as if its
+    lines were checked one by one: re-read the stock, add back what this basket
+    already took ({pk: amount} per table) and replay the lines in order.
+    """
+    from menu.models import FoodItem
+
+    food_items, recipes = stock
+    current = FoodItem.objects.with_stock_on_hand().in_bulk(food_items)
+    ingredients = Ingredient.objects.in_bulk({i for rows in recipes.values() for i, _ in rows})
+    for food_item in current.values():
+        food_item.stock_quantity = food_item.stock_on_hand
+    for pk, amount in taken_food_items.items():
+        current[pk].stock_quantity += amount
+    for pk, amount in taken_ingredients.items():
+        ingredients[pk].current_quantity += amount
+
+    for fid, quantity in basket:
+        food_item = current[fid]
+        quantity = int(quantity)
+
+        # Check pre-made stock
+        if food_item.stock_quantity is not None:
+            if food_item.stock_quantity < quantity:
+                return ValueError(
+                    f"Insufficient stock for {food_item.name}. "
+                    f"Available: {food_item.stock_quantity}, Requested: {quantity}"
+                )
+            food_item.stock_quantity -= quantity
+            continue
+
+        # Check recipe ingredients for made-to-order items
+        rows = recipes.get(fid, [])
+        possible = [int(ingredients[i].current_quantity / qty) for i, qty in rows if qty > 0]
+        if possible and min(possible) < quantity:
+            return ValueError(
+                f"Cannot make {quantity} {food_item.name}. "
+                f"Only {min(possible)} can be made with current ingredients."
+            )
+        for ingredient_id, qty in rows:
+            ingredients[ingredient_id].current_quantity -= qty * Decimal(quantity)
+
+    # Another till took the stock between the UPDATE and this re-read
+    return ValueError("Insufficient stock for this order. Please refresh the menu and try again.")
+
+
+def stock_changed(ingredient_ids=(), food_item_ids=(), locks=None):
+    """
+    Follow-up for stock rows updated in place: low-stock events for the
+    ingredients and a refresh of every affected availability record, through
+    the operation's locks when given.
+    """
+    ingredient_ids = list(ingredient_ids)
+    if ingredient_ids:
+        publish_low_stock(Ingredient.objects.filter(pk__in=ingredient_ids, current_quantity__lte=F('reorder_level')))
+    refresh_availability(ingredient_ids=ingredient_ids, food_item_ids=food_item_ids, locks=locks)
+
+
+def refresh_availability(ingredient_ids=(), food_item_ids=(), locks=None):
+    """
+    Rewrite the FoodItemAvailability rows affected by a stock change, inside the
+    caller's transaction. Changed ingredients are expanded to every food item
+    whose recipe uses them through the RecipeIngredient (ingredient -> recipe)
+    index, so a shared ingredient running out 86's all of its dishes at once
+    and a restock brings them back. At most two queries whatever the number of
+    items; records whose figures did not change are not written. The records
+    rank after the stock rows in STOCK_LOCK_ORDER: pass the operation's locks.
+    Also moves the menu snapshot version and publishes the new figures to the
+    tills, since every menu change passes here.
+    """
+    from menu.models import FoodItem
+
+    ingredient_ids = list(ingredient_ids)
+    food_item_ids = list(food_item_ids)
+    if not ingredient_ids and not food_item_ids:
         return
 
-    with transaction.atomic():
-        for recipe_ingredient in recipe.ingredients.select_related('ingredient').all():
-            # Lock the ingredient row to prevent race conditions
-            ingredient = Ingredient.objects.select_for_update().get(id=recipe_ingredient.ingredient.id)
-            deduction_qty = recipe_ingredient.quantity * quantity_sold
-            
-            # Update current quantity 
-            if ingredient.current_quantity < deduction_qty:
-                raise ValueError(f"Insufficient stock for {ingredient.name} (Required: {deduction_qty}, Available: {ingredient.current_quantity})")
-                
-            ingredient.current_quantity -= deduction_qty
-            ingredient.save()
-            
-            # Log the movement
-            StockMovement.objects.create(
-                ingredient=ingredient,
+    affected = Q(pk__in=food_item_ids)
+    if ingredient_ids:
+        affected |= Q(pk__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).values('recipe__food_item_id'))
+
+    rows = FoodItem.objects.filter(affected).with_stock_on_hand().values_list(
+        'pk', 'stock_on_hand', 'is_active',
+        'recipe__ingredients__ingredient_id',
+        'recipe__ingredients__quantity',
+        'recipe__ingredients__ingredient__current_quantity',
+        'availability_record__can_make',
+        'availability_record__recipe_ingredient_count',
+        'availability_record__limiting_ingredient_id',
+        'availability_record__is_sold_out',
+    )
+    records, stored = {}, {}
+    for fid, stock_quantity, is_active, ingredient_id, qty, current, *existing in rows:
+        record = records.get(fid)
+        if record is None:
+            record = records[fid] = FoodItemAvailability(food_item_id=fid, can_make=None, recipe_ingredient_count=0)
+            record.stock_quantity = stock_quantity
+            record.is_active = is_active
+            stored[fid] = tuple(existing)
+        if ingredient_id is None:
+            continue
+        record.recipe_ingredient_count += 1
+        if qty > 0:
+            possible = int(current / qty)
+            if record.can_make is None or possible < record.can_make:
+                record.can_make = possible
+                record.limiting_ingredient_id = ingredient_id
+
+    for record in records.values():
+        if record.can_make is None:
+            record.can_make = 0
+        if record.stock_quantity is not None:
+            record.is_sold_out = record.stock_quantity <= 0
+        else:
+            record.is_sold_out = record.can_make < 1
+
+    # Only write records whose figures moved: a sale from a sharded item leaves
+    # its record alone until the item sells out, so tills don't queue on it
+    changed = [
+        r for r in records.values()
+        if stored[r.food_item_id] != (r.can_make, r.recipe_ingredient_count, r.limiting_ingredient_id, r.is_sold_out)
+    ]
+    if changed:
+        (locks or StockLockManager()).upsert(
+            FoodItemAvailability, changed, 'food_item',
+            ['can_make', 'recipe_ingredient_count', 'limiting_ingredient', 'is_sold_out', 'updated_at'],
+        )
+
+    from menu.snapshot import invalidate_menu_snapshot
+    invalidate_menu_snapshot()
+
+    deltas = [
+        {
+            'id': r.food_item_id,
+            'stock_quantity': r.stock_quantity,
+            'is_active': r.is_active,
+            'can_make': r.can_make,
+            'is_sold_out': r.is_sold_out,
+        }
+        for r in records.values()
+    ]
+    # Keep each event well under the 8000-byte NOTIFY payload limit
+    for start in range(0, len(deltas), AVAILABILITY_EVENT_BATCH):
+        events.publish('availability', items=deltas[start:start + AVAILABILITY_EVENT_BATCH])
+
+
+def publish_low_stock(ingredients):
+    """Tell the tills about ingredients at or below their reorder level."""
+    for ingredient in ingredients:
+        if ingredient.current_quantity <= ingredient.reorder_level:
+            events.publish(
+                'ingredient_low_stock',
+                id=ingredient.pk,
+                name=ingredient.name,
+                unit=ingredient.unit,
+                current_quantity=ingredient.current_quantity,
+                reorder_level=ingredient.reorder_level,
+            )
+
+
+def commit_basket_stock(stock, consumption, reference, user, locks=None):
+    """
+    Record a taken basket: one bulk INSERT of StockMovement rows, then the
+    low-stock events and availability refresh for everything it touched.
+    """
+    food_items, recipes = stock
+    if consumption:
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                ingredient_id=ingredient_id,
                 quantity=deduction_qty,
                 movement_type='OUT',
                 reason='CONSUMPTION',
-                reference=f'TX #{tx_line.transaction.id}',
-                user=tx_line.transaction.cashier,
-                notes=f'Sold {quantity_sold} {food_item.name}'
+                reference=reference,
+                user=user,
+                notes=f'Sold {quantity} {food_item.name}'
             )
+            for food_item, quantity, ingredient_id, deduction_qty in consumption
+        ])
+    stock_changed(
+        ingredient_ids={ingredient_id for _, _, ingredient_id, _ in consumption},
+        food_item_ids=[fid for fid, fi in food_items.items() if fi.stock_quantity is not None],
+        locks=locks,
+    )
 
-def reverse_stock_deduction(tx):
+
+def deduct_stock_for_transaction(tx_line):
+    """
+    Deduct ingredients from stock based on a TransactionLine.
+    If FoodItem tracks stock (stock_quantity is not None), deduct from that instead.
+    If a recipe exists for the FoodItem, deduct the required ingredients.
+    """
+    with transaction.atomic():
+        basket = [(tx_line.food_item_id, tx_line.quantity)]
+        stock = load_basket_stock([tx_line.food_item_id])
+        consumption = take_basket_stock(basket, stock)
+        commit_basket_stock(stock, consumption, f'TX #{tx_line.transaction.id}', tx_line.transaction.cashier)
+
+def reverse_stock_deduction(tx, locks=None):
     """
     Reverse stock deduction when a transaction is canceled.
+    Mirrors the deduction: pre-made counts are restored, recipe ingredients
+    are added back for made-to-order items.
     """
-    for line in tx.lines.all():
-        food_item = line.food_item
-        quantity_sold = Decimal(str(line.quantity))
-        
-        try:
-            recipe = Recipe.objects.get(food_item=food_item)
-        except Recipe.DoesNotExist:
-            continue
+    from django.utils import timezone
+    from menu.models import FoodItem
+
+    with transaction.atomic():
+        basket = [(line.food_item_id, line.quantity) for line in tx.lines.all()]
+        if not basket:
+            return
+        locks = locks or StockLockManager()
+        food_items, recipes = load_basket_stock([fid for fid, _ in basket])
+
+        restored, returned, movements = {}, {}, []
+        for fid, quantity in basket:
+            food_item = food_items[fid]
+            if food_item.stock_quantity is not None:
+                restored[fid] = restored.get(fid, 0) + quantity
+                continue
+
+            for ingredient_id, qty in recipes.get(fid, []):
+                reversal_qty = qty * Decimal(quantity)
 
-        with transaction.atomic():
-            for recipe_ingredient in recipe.ingredients.select_related('ingredient').all():
-                ingredient = Ingredient.objects.select_for_update().get(id=recipe_ingredient.ingredient.id)
-                reversal_qty = recipe_ingredient.quantity * quantity_sold
-                
                 # Add back to stock
-                ingredient.current_quantity += reversal_qty
-                ingredient.save()
-                
+                returned[ingredient_id] = returned.get(ingredient_id, 0) + reversal_qty
+
                 # Log the movement
-                StockMovement.objects.create(
-                    ingredient=ingredient,
+                movements.append(StockMovement(
+                    ingredient_id=ingredient_id,
                     quantity=reversal_qty,
                     movement_type='IN',
                     reason='AUDIT',
                     reference=f'TX #{tx.id} CANCELED',
                     user=None, # System reversal
-                    notes=f'Reversal for canceled sale of {quantity_sold} {food_item.name}'
-                )
+                    notes=f'Reversal for canceled sale of {quantity} {food_item.name}'
+                ))
+
+        now = timezone.now()
+        sharded = {fid: amount for fid, amount in restored.items() if food_items[fid].is_sharded()}
+        locks.give(FoodItem, 'stock_quantity', {
+            fid: amount for fid, amount in restored.items() if fid not in sharded
+        }, updated_at=now)
+        locks.give_sharded(sharded, {fid: food_items[fid].stock_shards for fid in sharded})
+        locks.give(Ingredient, 'current_quantity', returned, updated_at=now)
+        StockMovement.objects.bulk_create(movements)
+        stock_changed(ingredient_ids=returned, food_item_ids=restored, locks=locks)
+
 
 def produce_food_item(food_item, quantity, user):
     """
     Produce a batch of food items:
-    1. Validate Recipe (exists + >=2 ingredients)
-    2. Check stock availability
-    3. Deduct ingredients
-    4. Update FoodItem stock
+    1. Check a recipe exists
+    2. Validate Recipe (>=2 ingredients)
+    3. Take the ingredients (fails if any is short)
+    4. Add the batch to the FoodItem stock
     """
+    from django.utils import timezone
+    from menu.models import FoodItem
+
     quantity = int(quantity)
     if quantity <= 0:
         raise ValueError("Quantity must be positive")
@@ -218,31 +676,35 @@ def produce_food_item(food_item, quantity, user):
     except Recipe.DoesNotExist:
         raise ValueError("No recipe defined for this item")
 
-    ingredients = recipe.ingredients.all()
-    if ingredients.count() < 2:
+    rows = list(recipe.ingredients.order_by('pk').values_list('ingredient_id', 'quantity'))
+    if len(rows) < 2:
         raise ValueError("Recipe must have at least 2 ingredients to be valid for production")
+    required = {}
+    for ingredient_id, qty in rows:
+        required[ingredient_id] = required.get(ingredient_id, 0) + qty * Decimal(quantity)
 
     with transaction.atomic():
-        # Check stock first (fetch locked rows)
-        locked_ingredients = []
-        for recipe_ing in ingredients:
-            # Lock ingredient for update
-            ing = Ingredient.objects.select_for_update().get(id=recipe_ing.ingredient.id)
-            required_qty = recipe_ing.quantity * Decimal(quantity)
-            
-            if ing.current_quantity < required_qty:
-                raise ValueError(f"Cannot increase stock: Missing {ing.name} (Required: {required_qty}, Available: {ing.current_quantity})")
-            
-            locked_ingredients.append((ing, required_qty, recipe_ing))
+        # The produced item ranks before its ingredients in the global lock order
+        locks = StockLockManager()
+        now = timezone.now()
+        stock_quantity, shards = FoodItem.objects.values_list('stock_quantity', 'stock_shards').get(pk=food_item.pk)
+        if stock_quantity is not None and shards > 1:
+            # Sharded: the batch is spread over the shards, the item row is only reactivated
+            locks.acquire(FoodItem)
+            FoodItem.objects.filter(pk=food_item.pk).update(is_active=True, updated_at=now)
+            locks.give_sharded({food_item.pk: quantity}, {food_item.pk: shards}, spread=True)
+        else:
+            locks.give(FoodItem, 'stock_quantity', {food_item.pk: quantity}, is_active=True, updated_at=now)
 
+        # Check stock first
+        short = locks.take(Ingredient, 'current_quantity', required, extra=lambda amount: {'updated_at': now})
+        if short is not None:
+            ing = Ingredient.objects.get(pk=short)
+            raise ValueError(f"Cannot increase stock: Missing {ing.name} (Required: {required[short]}, Available: {ing.current_quantity})")
 
-        # Deduct Stock
-        for ing, deduction_qty, recipe_ing in locked_ingredients:
-            ing.current_quantity -= deduction_qty
-            ing.save()
-
-            StockMovement.objects.create(
-                ingredient=ing,
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                ingredient_id=ingredient_id,
                 quantity=deduction_qty,
                 movement_type='OUT',
                 reason='CONSUMPTION',
@@ -250,10 +712,10 @@ def produce_food_item(food_item, quantity, user):
                 user=user,
                 notes=f'Produced {quantity} {food_item.name}'
             )
+            for ingredient_id, deduction_qty in required.items()
+        ])
+        stock_changed(ingredient_ids=required, food_item_ids=[food_item.pk], locks=locks)
 
-        # Update Food Item
-        current_stock = food_item.stock_quantity or 0
-        food_item.stock_quantity = current_stock + quantity
-        food_item.is_active = True
-        food_item.save()
-
+        food_item.stock_quantity, food_item.is_active = FoodItem.objects.with_stock_on_hand().values_list(
+            'stock_on_hand', 'is_active'
+        ).get(pk=food_item.pk)
@@ -0,0 +1,135 @@
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import User
+from menu.models import FoodItem
+from inventory.models import Ingredient, Recipe, RecipeIngredient, FoodItemAvailability, PurchaseOrder, PurchaseOrderItem
+from inventory.services import process_purchase_order, produce_food_item
+from transactions.services import create_transaction_atomic, cancel_transaction_atomic
+
+
+class FoodItemAvailabilityTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+        # Momo and Chowmein share flour; only one portion of either can be made
+        self.flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=1000)
+        self.oil = Ingredient.objects.create(name='Oil', unit='ml', current_quantity=500)
+        self.momo = self._item('Momo', flour=600, oil=10)
+        self.chowmein = self._item('Chowmein', flour=600, oil=50)
+
+    def _item(self, name, flour, oil):
+        item = FoodItem.objects.create(name=name, price_full=100, available_portions=['full'])
+        recipe = Recipe.objects.create(food_item=item)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.flour, quantity=flour)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.oil, quantity=oil)
+        return item
+
+    def _record(self, item):
+        return FoodItemAvailability.objects.get(food_item=item)
+
+    def _sell(self, item, quantity=1):
+        return create_transaction_atomic(
+            cashier=self.cashier, payment_type='cash',
+            lines_data=[{'food_item': item.pk, 'quantity': quantity, 'portion_type': 'full', 'unit_price': 100}]
+        )
+
+    def assertMatchesLiveCalculation(self):
+        for item in FoodItem.objects.with_availability().select_related('availability_record'):
+            record = item.availability_record
+            self.assertEqual(record.can_make, item.max_available, item.name)
+            self.assertEqual(record.recipe_ingredient_count, item.recipe_ingredient_count, item.name)
+
+    def test_recipe_setup_creates_records(self):
+        record = self._record(self.momo)
+        self.assertEqual(record.can_make, 1)
+        self.assertEqual(record.recipe_ingredient_count, 2)
+        self.assertEqual(record.limiting_ingredient, self.flour)
+        self.assertFalse(record.is_sold_out)
+        self.assertTrue(self._record(FoodItem.objects.create(name='No Recipe', price_full=10)).is_sold_out)
+
+    def test_sale_86s_every_item_sharing_the_ingredient(self):
+        self._sell(self.momo)
+        for item in (self.momo, self.chowmein):
+            record = self._record(item)
+            self.assertEqual(record.can_make, 0)
+            self.assertTrue(record.is_sold_out)
+            self.assertEqual(record.limiting_ingredient, self.flour)
+        self.assertMatchesLiveCalculation()
+
+    def test_cancel_and_restock_un_86(self):
+        tx = self._sell(self.momo)
+        cancel_transaction_atomic(tx, self.manager)
+        self.assertFalse(self._record(self.chowmein).is_sold_out)
+
+        self._sell(self.chowmein)
+        self.assertTrue(self._record(self.momo).is_sold_out)
+        resp = self.client.post(f'/api/inventory/ingredients/{self.flour.pk}/adjust_stock/', {
+            'quantity': '1200', 'reason': 'PURCHASE', 'movement_type': 'IN'
+        }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._record(self.momo).can_make, 2)
+        self.assertFalse(self._record(self.momo).is_sold_out)
+        self.assertMatchesLiveCalculation()
+
+    def test_purchase_receipt_and_production_refresh_records(self):
+        self._sell(self.momo)
+        po = PurchaseOrder.objects.create(payment_method='CASH', total_amount=100, created_by=self.manager)
+        PurchaseOrderItem.objects.create(
+            purchase_order=po, ingredient=self.flour, quantity=Decimal('1800'),
+            unit_price=1, received_quantity=Decimal('1800')
+        )
+        process_purchase_order(po.id, self.manager)
+        self.assertEqual(self._record(self.chowmein).can_make, 3)
+
+        # Production of the pre-made item draws the shared flour down for the other dish
+        produce_food_item(self.momo, 2, self.manager)
+        self.assertFalse(self._record(self.momo).is_sold_out)
+        self.assertEqual(self._record(self.chowmein).can_make, 1)
+        self.assertMatchesLiveCalculation()
+
+    def test_recipe_change_refreshes_record(self):
+        recipe = self.momo.recipe
+        resp = self.client.post(f'/api/inventory/recipes/{recipe.pk}/set_ingredients/', {
+            'ingredients': [{'ingredient': self.oil.pk, 'quantity': '100'}]
+        }, format='json')
+        self.assertEqual(resp.status_code, 200)
+        record = self._record(self.momo)
+        self.assertEqual((record.can_make, record.recipe_ingredient_count), (5, 1))
+        self.assertEqual(record.limiting_ingredient, self.oil)
+
+    def test_cashier_menu_reads_stored_records(self):
+        self._sell(self.momo)
+        self.client.force_authenticate(user=self.cashier)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/food-items/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(any('inventory_recipeingredient' in q['sql'] for q in ctx.captured_queries))
+        chowmein = next(r for r in resp.data['results'] if r['id'] == self.chowmein.pk)
+        self.assertTrue(chowmein['availability']['is_sold_out'])
+        self.assertEqual(chowmein['availability']['limiting_ingredient'], 'Flour')
+        self.assertEqual(chowmein['max_daily_production'], 0)
+
+    def test_adjust_stock_out_cannot_overdraw(self):
+        resp = self.client.post(f'/api/inventory/ingredients/{self.oil.pk}/adjust_stock/', {
+            'quantity': '501', 'reason': 'WASTAGE', 'movement_type': 'OUT'
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.oil.refresh_from_db()
+        self.assertEqual(self.oil.current_quantity, 500)
+        self.assertFalse(self.oil.movements.exists())
+
+    def test_adjust_stock_rejects_non_finite_quantities(self):
+        for quantity in ('NaN', 'sNaN', 'Infinity', '-Infinity'):
+            resp = self.client.post(f'/api/inventory/ingredients/{self.oil.pk}/adjust_stock/', {
+                'quantity': quantity, 'reason': 'AUDIT', 'movement_type': 'ADJUST'
+            }, format='json')
+            self.assertEqual(resp.status_code, 400, quantity)
+        self.oil.refresh_from_db()
+        self.assertEqual(self.oil.current_quantity, 500)
+        self.assertFalse(self.oil.movements.exists())
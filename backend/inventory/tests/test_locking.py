@@ -1,5 +1,5 @@
-from django.test import TestCase, TransactionTestCase
-from django.db import transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.db import transaction, connection
 from decimal import Decimal
 from menu.models import FoodItem
 from inventory.models import Ingredient, Recipe, RecipeIngredient
@@ -8,6 +8,7 @@ from transactions.services import create_transaction_atomic
 from transactions.models import Transaction, TransactionLine
 from django.contrib.auth import get_user_model
 import threading
+import random
 
 User = get_user_model()
 
@@ -86,8 +87,160 @@ class InventoryLockingTests(TransactionTestCase):
         """Test exact error message for production"""
         self.flour.current_quantity = 500
         self.flour.save()
+        salt = Ingredient.objects.create(name='Salt', current_quantity=100, unit='g')
+        RecipeIngredient.objects.create(recipe=self.r_momo, ingredient=salt, quantity=5)
         
         with self.assertRaises(ValueError) as cm:
             produce_food_item(self.momo, 1, self.user)
             
         self.assertIn("Cannot increase stock: Missing Flour", str(cm.exception))
+
+    def test_production_rejects_recipe_before_taking_stock(self):
+        with self.assertRaises(ValueError) as cm:
+            produce_food_item(self.momo, 1, self.user)
+        self.assertIn("at least 2 ingredients", str(cm.exception))
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.current_quantity, 1000)
+        self.assertFalse(self.flour.movements.exists())
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_tills_random_baskets_no_deadlock(self):
+        """
+        N tills sell random baskets of items whose recipes share ingredients
+        listed in different orders. Every failure must be a stock shortfall,
+        never a deadlock, and no ingredient may go negative.
+        """
+        oil = Ingredient.objects.create(name='Oil', current_quantity=500, unit='ml')
+        salt = Ingredient.objects.create(name='Salt', current_quantity=300, unit='g')
+        self.flour.current_quantity = 6000
+        self.flour.save()
+
+        # Recipes list the shared ingredients in different orders
+        RecipeIngredient.objects.create(recipe=self.r_momo, ingredient=oil, quantity=20)
+        RecipeIngredient.objects.create(recipe=self.r_momo, ingredient=salt, quantity=5)
+        RecipeIngredient.objects.create(recipe=self.r_chow, ingredient=salt, quantity=5)
+        RecipeIngredient.objects.create(recipe=self.r_chow, ingredient=oil, quantity=30)
+        pakoda = FoodItem.objects.create(name='Pakoda', price_full=50, category='Snack')
+        r_pakoda = Recipe.objects.create(food_item=pakoda)
+        RecipeIngredient.objects.create(recipe=r_pakoda, ingredient=salt, quantity=2)
+        RecipeIngredient.objects.create(recipe=r_pakoda, ingredient=oil, quantity=40)
+        RecipeIngredient.objects.create(recipe=r_pakoda, ingredient=self.flour, quantity=100)
+        samosa = FoodItem.objects.create(name='Samosa', price_full=20, category='Snack', stock_quantity=15)
+
+        items = [self.momo.id, self.chowmein.id, pakoda.id, samosa.id]
+        tills = 8
+        sales_per_till = 5
+        errors = []
+        barrier = threading.Barrier(tills)
+
+        def till(seed):
+            rng = random.Random(seed)
+            barrier.wait()
+            try:
+                for _ in range(sales_per_till):
+                    basket = rng.sample(items, rng.randint(1, len(items)))
+                    lines = [
+                        {'food_item': fid, 'quantity': rng.randint(1, 2), 'portion_type': 'full', 'unit_price': 50}
+                        for fid in basket
+                    ]
+                    try:
+                        create_transaction_atomic(cashier=self.user, payment_type='cash', lines_data=lines)
+                    except ValueError:
+                        pass  # Legitimate stock shortfall
+                    except Exception as e:
+                        errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=till, args=(seed,)) for seed in range(tills)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [], f"Unexpected errors (deadlocks?): {errors}")
+        for ingredient in Ingredient.objects.all():
+            self.assertGreaterEqual(ingredient.current_quantity, 0, f"{ingredient.name} went negative")
+        samosa.refresh_from_db()
+        self.assertGreaterEqual(samosa.stock_quantity, 0)
+
+        # Stock consumed must match the movements recorded by successful sales
+        from inventory.models import StockMovement
+        from django.db.models import Sum
+        oil.refresh_from_db()
+        consumed = StockMovement.objects.filter(ingredient=oil, movement_type='OUT').aggregate(t=Sum('quantity'))['t'] or 0
+        self.assertEqual(oil.current_quantity, 500 - consumed)
+
+
+class StockLockManagerTests(TestCase):
+    def test_locks_follow_global_order(self):
+        from inventory.services import StockLockManager
+        flour = Ingredient.objects.create(name='Flour', current_quantity=10, unit='g')
+        item = FoodItem.objects.create(name='Momo', price_full=100)
+        with transaction.atomic():
+            locks = StockLockManager()
+            self.assertEqual(list(locks.lock(FoodItem, pk__in=[item.pk])), [item.pk])
+            self.assertEqual(list(locks.lock(Ingredient, pk__in=[flour.pk])), [flour.pk])
+            # Going back to an earlier table would invert the order
+            with self.assertRaises(RuntimeError):
+                locks.lock(FoodItem, pk__in=[item.pk])
+
+    def test_availability_records_lock_between_stock_and_accounts(self):
+        from accounts.models import CreditAccount
+        from inventory.models import FoodItemAvailability
+        from inventory.services import StockLockManager, refresh_availability
+        items = [FoodItem.objects.create(name=f'Item {i}', price_full=10, stock_quantity=5) for i in range(3)]
+        FoodItem.objects.filter(pk__in=[i.pk for i in items]).update(stock_quantity=0)
+        with transaction.atomic():
+            locks = StockLockManager()
+            locks.lock(Ingredient, pk__in=[])
+            refresh_availability(food_item_ids=[i.pk for i in reversed(items)], locks=locks)
+            locks.lock(CreditAccount, pk__in=[])
+            FoodItem.objects.filter(pk=items[0].pk).update(stock_quantity=2)
+            with self.assertRaises(RuntimeError):
+                refresh_availability(food_item_ids=[items[0].pk], locks=locks)
+        self.assertEqual(FoodItemAvailability.objects.filter(is_sold_out=True).count(), 3)
+
+    def test_take_is_conditional(self):
+        from inventory.services import StockLockManager
+        flour = Ingredient.objects.create(name='Flour', current_quantity=10, unit='g')
+        oil = Ingredient.objects.create(name='Oil', current_quantity=5, unit='ml')
+        with transaction.atomic():
+            locks = StockLockManager()
+            self.assertIsNone(locks.take(Ingredient, 'current_quantity', {flour.pk: Decimal('4')}))
+            self.assertEqual(locks.take(Ingredient, 'current_quantity', {flour.pk: 1, oil.pk: 6}), oil.pk)
+        flour.refresh_from_db()
+        oil.refresh_from_db()
+        self.assertEqual((flour.current_quantity, oil.current_quantity), (5, 5))
+        with self.assertRaises(RuntimeError):
+            locks.take(FoodItem, 'stock_quantity', {})
+
+    def test_stock_cannot_go_negative(self):
+        from django.db import IntegrityError
+        flour = Ingredient.objects.create(name='Flour', current_quantity=10, unit='g')
+        samosa = FoodItem.objects.create(name='Samosa', price_full=20, stock_quantity=3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ingredient.objects.filter(pk=flour.pk).update(current_quantity=-1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FoodItem.objects.filter(pk=samosa.pk).update(stock_quantity=-1)
+
+    def test_shortfall_message_ignores_rows_taken_by_the_failed_basket(self):
+        user = User.objects.create_user(username='cashier', password='password')
+        flour = Ingredient.objects.create(name='Flour', current_quantity=1000, unit='g')
+        oil = Ingredient.objects.create(name='Oil', current_quantity=30, unit='ml')
+        samosa = FoodItem.objects.create(name='Samosa', price_full=20, stock_quantity=10)
+        pakoda = FoodItem.objects.create(name='Pakoda', price_full=50)
+        recipe = Recipe.objects.create(food_item=pakoda)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=flour, quantity=100)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=oil, quantity=10)
+
+        lines = [
+            {'food_item': samosa.id, 'quantity': 2, 'portion_type': 'full', 'unit_price': 20},
+            {'food_item': pakoda.id, 'quantity': 4, 'portion_type': 'full', 'unit_price': 50},
+        ]
+        with self.assertRaises(ValueError) as cm:
+            create_transaction_atomic(cashier=user, payment_type='cash', lines_data=lines)
+        self.assertEqual(str(cm.exception), "Cannot make 4 Pakoda. Only 3 can be made with current ingredients.")
+        samosa.refresh_from_db()
+        flour.refresh_from_db()
+        self.assertEqual((samosa.stock_quantity, flour.current_quantity), (10, 1000))
@@ -0,0 +1,105 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from menu.models import FoodItem, FoodItemStockShard
+from inventory.models import FoodItemAvailability, Ingredient, Recipe, RecipeIngredient
+from inventory.services import produce_food_item
+from transactions.services import create_transaction_atomic, cancel_transaction_atomic
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+        self.samosa = FoodItem.objects.create(
+            name='Samosa', price_full=20, available_portions=['full'], stock_quantity=10, stock_shards=4
+        )
+
+    def _shards(self):
+        return list(self.samosa.stock_shard_rows.order_by('shard').values_list('quantity', flat=True))
+
+    def _sell(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_transaction_atomic(
+                cashier=self.cashier, payment_type='cash',
+                lines_data=[{'food_item': self.samosa.pk, 'quantity': quantity, 'portion_type': 'full', 'unit_price': 20}]
+            )
+
+    def _api_stock(self):
+        return self.client.get(f'/api/food-items/{self.samosa.pk}/').data['stock_quantity']
+
+    def test_stock_is_split_and_reported_as_one_sum(self):
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self._sell(2)
+        self.assertEqual(sum(self._shards()), 8)
+        self.assertEqual(self._api_stock(), 8)
+        self.assertEqual(FoodItem.objects.get(pk=self.samosa.pk).current_stock(), 8)
+
+    def test_sale_falls_back_across_shards(self):
+        # No single shard holds 5: the sale drains several
+        self._sell(5)
+        self.assertEqual(sum(self._shards()), 5)
+
+    def test_cannot_oversell_and_sells_out(self):
+        with self.assertRaisesMessage(ValueError, 'Available: 10, Requested: 11'):
+            self._sell(11)
+        self.assertEqual(sum(self._shards()), 10)
+        self._sell(10)
+        self.samosa.refresh_from_db()
+        self.assertFalse(self.samosa.is_active)
+        self.assertTrue(FoodItemAvailability.objects.get(food_item=self.samosa).is_sold_out)
+
+    def test_cancel_and_production_refill_shards(self):
+        tx = self._sell(4)
+        cancel_transaction_atomic(tx, self.manager)
+        self.assertEqual(sum(self._shards()), 10)
+
+        flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=1000)
+        oil = Ingredient.objects.create(name='Oil', unit='ml', current_quantity=1000)
+        recipe = Recipe.objects.create(food_item=self.samosa)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=flour, quantity=10)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=oil, quantity=5)
+        before = self._shards()
+        produce_food_item(self.samosa, 8, self.manager)
+        self.assertEqual([a - b for a, b in zip(self._shards(), before)], [2, 2, 2, 2])
+        self.assertEqual(self.samosa.stock_quantity, 18)
+
+    def test_correction_and_resharding_keep_the_total(self):
+        self._sell(3)
+        resp = self.client.post(f'/api/food-items/{self.samosa.pk}/update_stock/', {'quantity': 5}, format='json')
+        self.assertEqual(resp.data['stock_quantity'], 12)
+        self.assertEqual(self._shards(), [3, 3, 3, 3])
+
+        item = FoodItem.objects.get(pk=self.samosa.pk)
+        item.stock_shards = 1
+        item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.stock_quantity, 12)
+        self.assertFalse(FoodItemStockShard.objects.exists())
+
+    def test_resharding_locks_the_item_and_its_shards_first(self):
+        from unittest import mock
+        from django.db.models.query import QuerySet
+        from inventory.services import StockLockManager
+        self._sell(1)
+        calls = []
+        lock, aggregate = StockLockManager.lock, QuerySet.aggregate
+
+        def record_lock(manager, model, **lookup):
+            calls.append(model.__name__)
+            return lock(manager, model, **lookup)
+
+        def record_aggregate(queryset, *args, **kwargs):
+            calls.append('aggregate')
+            return aggregate(queryset, *args, **kwargs)
+
+        item = FoodItem.objects.get(pk=self.samosa.pk)
+        item.stock_shards = 2
+        with mock.patch.object(StockLockManager, 'lock', record_lock), \
+                mock.patch.object(QuerySet, 'aggregate', record_aggregate):
+            item.save()
+        self.assertEqual(calls[:3], ['FoodItem', 'FoodItemStockShard', 'aggregate'])
+        self.assertEqual(item.stock_quantity, 9)
+        self.assertEqual(self._shards(), [5, 4])
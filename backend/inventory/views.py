@@ -32,10 +32,27 @@ class IngredientViewSet(viewsets.ModelViewSet):
 
         try:
             quantity = Decimal(str(quantity))
-        except (ValueError, TypeError):
+            if not quantity.is_finite():
+                raise ValueError('NaN and Infinity are not quantities')
+        except (ValueError, TypeError, ArithmeticError):
             return Response({'quantity': ['Invalid quantity']}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 0:
+            return Response({'quantity': ['Quantity cannot be negative']}, status=status.HTTP_400_BAD_REQUEST)
 
         with transaction.atomic():
+            # Update current quantity in place; OUT never takes more than is on hand
+            now = timezone.now()
+            locks = StockLockManager()
+            if movement_type == 'IN':
+                locks.give(Ingredient, 'current_quantity', {ingredient.pk: quantity}, updated_at=now)
+            elif movement_type == 'OUT':
+                if locks.take(Ingredient, 'current_quantity', {ingredient.pk: quantity}, extra=lambda amount: {'updated_at': now}) is not None:
+                    ingredient.refresh_from_db(fields=['current_quantity'])
+                    return Response({'quantity': [f'Only {ingredient.current_quantity} {ingredient.unit} in stock']}, status=status.HTTP_400_BAD_REQUEST)
+            elif movement_type == 'ADJUST':
+                # Set absolute value for audit correction
+                Ingredient.objects.filter(pk=ingredient.pk).update(current_quantity=quantity, updated_at=now)
+
             # Create movement
             StockMovement.objects.create(
                 ingredient=ingredient,
@@ -45,16 +62,9 @@ class IngredientViewSet(viewsets.ModelViewSet):
                 user=request.user if request.user.is_authenticated else None,
                 notes=notes
             )
-            # Update current quantity
-            if movement_type == 'IN':
-                ingredient.current_quantity += quantity
-            elif movement_type == 'OUT':
-                ingredient.current_quantity -= quantity
-            elif movement_type == 'ADJUST':
-                ingredient.current_quantity = quantity # Set absolute value for audit correction
-            
-            ingredient.save()
+            stock_changed(ingredient_ids=[ingredient.pk], locks=locks)
 
+        ingredient.refresh_from_db()
         return Response(IngredientSerializer(ingredient).data)
 
 class StockMovementViewSet(viewsets.ReadOnlyModelViewSet):
@@ -75,19 +85,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
         
         with transaction.atomic():
             recipe.ingredients.all().delete()
-            for item in ingredients_data:
-                RecipeIngredient.objects.create(
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
                     recipe=recipe,
                     ingredient_id=item['ingredient'],
                     quantity=item['quantity']
                 )
+                for item in ingredients_data
+            ])
+            refresh_availability(food_item_ids=[recipe.food_item_id])
         
         return Response(RecipeSerializer(recipe).data)
 
-from .services import process_purchase_order, record_vendor_transaction
-from django.http import HttpResponse
+from .services import process_purchase_order, record_vendor_transaction, refresh_availability, stock_changed, StockLockManager
 from decimal import Decimal
-import csv
+from core import exports
+from django_filters import rest_framework as filters
 
 # ... (Keep existing viewsets)
 
@@ -133,38 +146,23 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
 
         return Response(PurchaseOrderSerializer(po).data)
 
+class VendorTransactionFilter(filters.FilterSet):
+    class Meta:
+        model = VendorTransaction
+        fields = ['vendor', 'transaction_type']
+
+
 class VendorTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = VendorTransaction.objects.all().order_by('-date')
     serializer_class = VendorTransactionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filterset_fields = ['vendor', 'transaction_type']
+    filterset_class = VendorTransactionFilter
     
     @action(detail=False, methods=['get'])
     def export_ledger(self, request):
-        """Export vendor ledger as CSV"""
-        vendor_id = request.query_params.get('vendor')
+        """Export vendor ledger as CSV, streamed (?compress=gzip for a .csv.gz)"""
         queryset = self.filter_queryset(self.get_queryset())
-        
-        response = HttpResponse(content_type='text/csv')
-        filename = f"vendor_ledger_{vendor_id if vendor_id else 'all'}.csv"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Vendor', 'Type', 'Amount', 'Reference', 'Balance After', 'Notes', 'Created By'])
-        
-        for tx in queryset:
-            writer.writerow([
-                tx.date.strftime('%Y-%m-%d %H:%M'),
-                tx.vendor.name,
-                tx.transaction_type,
-                tx.amount,
-                tx.reference,
-                tx.balance_after,
-                tx.notes,
-                tx.created_by.username if tx.created_by else 'System'
-            ])
-            
-        return response
+        return vendor_ledger_csv(queryset, request.query_params.get('vendor'), gzip=exports.wants_gzip(request))
 
     @action(detail=False, methods=['post'])
     def record_payment(self, request):
@@ -193,3 +191,32 @@ class VendorTransactionViewSet(viewsets.ReadOnlyModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+
+def filtered_vendor_transactions(params):
+    """Vendor transactions matching VendorTransactionFilter params, newest first. ValueError for invalid params."""
+    filterset = VendorTransactionFilter(params, queryset=VendorTransactionViewSet.queryset)
+    if not filterset.is_valid():
+        raise ValueError(f'Invalid filters: {dict(filterset.errors)}')
+    return filterset.qs
+
+
+def vendor_ledger_csv(queryset, vendor_id=None, gzip=False):
+    """Streamed CSV download of the vendor transactions in queryset."""
+    queryset = queryset.select_related('vendor', 'created_by')
+    filename = f"vendor_ledger_{vendor_id if vendor_id else 'all'}.csv"
+
+    def rows():
+        yield ['Date', 'Vendor', 'Type', 'Amount', 'Reference', 'Balance After', 'Notes', 'Created By']
+        for tx in exports.iterate(queryset):
+            yield [
+                tx.date.strftime('%Y-%m-%d %H:%M'),
+                tx.vendor.name,
+                tx.transaction_type,
+                tx.amount,
+                tx.reference,
+                tx.balance_after,
+                tx.notes,
+                tx.created_by.username if tx.created_by else 'System'
+            ]
+
+    return exports.stream_csv(filename, rows(), gzip=gzip)
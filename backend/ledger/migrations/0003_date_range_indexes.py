@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0002_alter_cashbookentry_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashbookentry',
+            index=models.Index(fields=['date', 'entry_type'], name='cashbook_date_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date'], name='expense_date_idx'),
+        ),
+    ]
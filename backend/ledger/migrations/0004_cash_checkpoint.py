@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0003_date_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('income', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('expense', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cash_expenses', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
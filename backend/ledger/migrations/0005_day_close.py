@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:04
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ledger', '0004_cash_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_sales', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('transaction_count', models.IntegerField()),
+                ('cash_sales', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('credit_sales', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('mixed_sales', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cashbook_income', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cashbook_expense', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('expenses', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cash_expenses', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('credit_charges', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('credit_payments', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cashier_totals', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('top_items', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('reopened_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('reopened_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dayclose',
+            constraint=models.UniqueConstraint(condition=models.Q(('reopened_at__isnull', True)), fields=('date',), name='one_active_day_close'),
+        ),
+    ]
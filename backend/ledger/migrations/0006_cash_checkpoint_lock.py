@@ -0,0 +1,19 @@
+# Generated by Django 4.2.27 on 2026-10-17 09:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0005_day_close'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashCheckpointLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+    ]
@@ -1,26 +1,141 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from .periods import PeriodLocked
 from transactions.models import Transaction
 
 
-class CashBookEntry(models.Model):
+class CashTotalsMixin(PeriodLocked):
+    """Writes also drop the cash checkpoints from their day on (see CashCheckpoint)."""
+
+    def report_dates_written(self, *timestamps):
+        super().report_dates_written(*timestamps)
+        from .services import invalidate_cash_checkpoints
+        invalidate_cash_checkpoints(*timestamps)
+
+
+class CashBookEntry(CashTotalsMixin, models.Model):
     ENTRY_TYPE = (('income', 'Income'), ('expense', 'Expense'))
 
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now)
     entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     description = models.TextField(blank=True)
     related_transaction = models.ForeignKey(Transaction, null=True, blank=True, on_delete=models.SET_NULL)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['date', 'entry_type'], name='cashbook_date_type_idx')]
+
     def __str__(self):
         return f"{self.entry_type} {self.amount}"
 
 
-class Expense(models.Model):
+class Expense(CashTotalsMixin, models.Model):
     date = models.DateTimeField(auto_now_add=True)
     description = models.TextField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     category = models.CharField(max_length=100, blank=True)
     paid_by = models.CharField(max_length=50, default='cash')
     attached_receipt = models.FileField(upload_to='receipts/', null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['date'], name='expense_date_idx')]
+
+
+class CashCheckpoint(models.Model):
+    """
+    Running cash totals through the end of a past local day: every cashbook
+    income and expense entry, and every expense paid in cash, dated on or
+    before date. Cash on hand is the latest checkpoint plus what is dated
+    after it (ledger.services). A write dated on or before a checkpoint's
+    day deletes it and every later one; they are rebuilt on the next read.
+    """
+    date = models.DateField(unique=True)
+    income = models.DecimalField(max_digits=14, decimal_places=2)
+    expense = models.DecimalField(max_digits=14, decimal_places=2)
+    cash_expenses = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cash through {self.date}: +{self.income} -{self.expense} -{self.cash_expenses}"
+
+
+class CashCheckpointLock(models.Model):
+    """
+    Single row locked by whoever writes or drops CashCheckpoints, so a
+    checkpoint cannot be built from totals that miss a backdated entry
+    committing at the same moment. Created on first use.
+    """
+
+    def __str__(self):
+        return "Cash checkpoint lock"
+
+
+class DayClose(models.Model):
+    """
+    End-of-day snapshot of a past local day, written by ledger.services.close_day.
+    While it is active (not reopened) the day is locked (ledger.periods) and
+    its daily report is served from here. The figures are never edited: an
+    admin reopens the day, which retires this record, and a new close takes
+    a fresh snapshot.
+    """
+    date = models.DateField()
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2)
+    transaction_count = models.IntegerField()
+    cash_sales = models.DecimalField(max_digits=14, decimal_places=2)
+    credit_sales = models.DecimalField(max_digits=14, decimal_places=2)
+    mixed_sales = models.DecimalField(max_digits=14, decimal_places=2)
+    cashbook_income = models.DecimalField(max_digits=14, decimal_places=2)
+    cashbook_expense = models.DecimalField(max_digits=14, decimal_places=2)
+    expenses = models.DecimalField(max_digits=14, decimal_places=2)
+    cash_expenses = models.DecimalField(max_digits=14, decimal_places=2)
+    credit_charges = models.DecimalField(max_digits=14, decimal_places=2)
+    credit_payments = models.DecimalField(max_digits=14, decimal_places=2)
+    cashier_totals = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    top_items = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    closed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    closed_at = models.DateTimeField(auto_now_add=True)
+    reopened_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reopened_at = models.DateTimeField(null=True, blank=True)
+
+    REOPEN_FIELDS = {'reopened_by', 'reopened_at'}
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date'], condition=models.Q(reopened_at__isnull=True), name='one_active_day_close'
+            ),
+        ]
+
+    def __str__(self):
+        state = 'reopened' if self.reopened_at else 'closed'
+        return f"Day {self.date} ({state})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None and set(kwargs.get('update_fields') or ()) != self.REOPEN_FIELDS:
+            raise ValueError('A day close cannot be edited; reopen the day and close it again')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('A day close cannot be deleted; reopen the day instead')
+
+    def summary(self):
+        """The daily report figures (reports.views.DailySummaryView) of the closed day."""
+        count = self.transaction_count
+        return {
+            'date': str(self.date),
+            'total_sales': float(self.total_sales),
+            'transaction_count': count,
+            'cash_sales': float(self.cash_sales),
+            'credit_sales': float(self.credit_sales),
+            'mixed_sales': float(self.mixed_sales),
+            'top_items': self.top_items,
+            'expenses': float(self.expenses),
+            'cashbook_income': float(self.cashbook_income),
+            'cashbook_expense': float(self.cashbook_expense),
+            'net_cash': float(self.cashbook_income - self.cashbook_expense),
+            'avg_transaction': float(self.total_sales / count) if count > 0 else 0,
+            'closed': True,
+        }
@@ -0,0 +1,38 @@
+"""
+Period locks. A day with an active DayClose is read-only: saving or deleting
+a Transaction, CashBookEntry or Expense dated on it raises PeriodClosed until
+an admin reopens the day. Only days that are over can be closed, so writes
+dated today (every live sale) never need the check.
+"""
+from django.core.exceptions import PermissionDenied
+from django.utils import timezone
+from reports.cache import InvalidatesReports
+
+
+class PeriodClosed(PermissionDenied, ValueError):
+    """A write into a closed day. The API answers 403; services treat it as a ValueError."""
+
+
+def ensure_open(*timestamps):
+    """Raise PeriodClosed if any of timestamps (some may be None) falls on a closed day."""
+    today = timezone.localdate()
+    days = {timezone.localdate(ts) for ts in timestamps if ts is not None}
+    days = [day for day in days if day < today]
+    if not days:
+        return
+    from .models import DayClose
+    closed = DayClose.objects.filter(date__in=days, reopened_at__isnull=True).order_by('date').first()
+    if closed is not None:
+        raise PeriodClosed(f'{closed.date} is closed; an admin must reopen it first')
+
+
+class PeriodLocked(InvalidatesReports):
+    """Model mixin: refuse saves and deletes that touch a closed day (see InvalidatesReports)."""
+
+    def save(self, *args, **kwargs):
+        ensure_open(getattr(self, self.report_date_field), getattr(self, '_loaded_report_date', None))
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        ensure_open(getattr(self, self.report_date_field))
+        return super().delete(*args, **kwargs)
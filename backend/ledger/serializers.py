@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import CashBookEntry, Expense
+from .models import CashBookEntry, DayClose, Expense
 
 
 class CashBookEntrySerializer(serializers.ModelSerializer):
@@ -27,3 +27,13 @@ class ExpenseSerializer(serializers.ModelSerializer):
         if value <= 0:
             raise serializers.ValidationError('Amount must be positive')
         return value
+
+
+class DayCloseSerializer(serializers.ModelSerializer):
+    closed_by_name = serializers.CharField(source='closed_by.username', read_only=True, default=None)
+    reopened_by_name = serializers.CharField(source='reopened_by.username', read_only=True, default=None)
+    
+    class Meta:
+        model = DayClose
+        fields = '__all__'
+        read_only_fields = [f.name for f in DayClose._meta.fields]
@@ -0,0 +1,182 @@
+"""
+Cash on hand from checkpoints, and day closes.
+
+Summing every cashbook entry and expense ever recorded grows with the age of
+the ledger. Instead a CashCheckpoint holds the running totals through a past
+day, and the current figures are the latest checkpoint plus the entries dated
+after it: the checkpoint for yesterday is written by the first read of the
+day, so a read scans at most a day or so of entries however old the ledger.
+
+Checkpoints only cover days that are over. A write dated on or before one
+(a backdated entry, an edit, a deletion) deletes it and every later one, in
+the writer's transaction; the next read rebuilds from the checkpoint before.
+Both sides hold the CashCheckpointLock row while they do, so a checkpoint
+is never built from totals that miss a backdated write committing alongside.
+
+close_day snapshots a past day into a DayClose, which locks it
+(ledger.periods) until reopen_day.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from accounts.credit_ledger import OPENING_DESCRIPTION
+from accounts.models import CreditLedgerEntry
+from audit.models import AuditLog
+from core.dates import date_range_q
+from reports import queries
+from reports.cache import invalidate_report_days
+from transactions.models import Transaction
+from .models import CashBookEntry, CashCheckpoint, CashCheckpointLock, DayClose, Expense
+
+
+def _lock_checkpoints():
+    """Hold the CashCheckpointLock row until the surrounding transaction ends."""
+    CashCheckpointLock.objects.select_for_update().get_or_create(pk=1)
+
+
+def invalidate_cash_checkpoints(*timestamps):
+    """Delete the checkpoints that cover any of timestamps (some may be None)."""
+    days = [timezone.localdate(ts) for ts in timestamps if ts is not None]
+    if not days or min(days) >= timezone.localdate():
+        return  # No checkpoint covers today or later
+    with transaction.atomic():
+        _lock_checkpoints()
+        CashCheckpoint.objects.filter(date__gte=min(days)).delete()
+
+
+def _totals_between(date_from, date_to, **periods):
+    """Cashbook income/expense and cash expenses dated date_from..date_to; None leaves an end open."""
+    since = date_range_q('date', date_from, date_to)
+    totals = queries.cashbook_figures(CashBookEntry.objects.filter(since), **periods)
+    totals['cash_expenses'] = queries.expense_total(Expense.objects.filter(since, paid_by='cash'))
+    return totals
+
+
+def close_cash_day(day):
+    """
+    Write the checkpoint of day (a past local day) from the one before it,
+    replacing any already there. Returns the CashCheckpoint.
+    """
+    if day >= timezone.localdate():
+        raise ValueError('A day can only be checkpointed once it is over')
+    with transaction.atomic():
+        # Wait for any backdated write dropping checkpoints to commit, so the
+        # totals below include it
+        _lock_checkpoints()
+        previous = CashCheckpoint.objects.filter(date__lt=day).order_by('-date').first()
+        totals = _totals_between(previous.date + timedelta(days=1) if previous else None, day)
+        checkpoint, _ = CashCheckpoint.objects.update_or_create(date=day, defaults={
+            name: totals[name] + (getattr(previous, name) if previous else 0)
+            for name in ('income', 'expense', 'cash_expenses')
+        })
+        return checkpoint
+
+
+def cash_totals():
+    """
+    All-time cashbook income and expense, cash expenses, and today's cashbook
+    income and expense, as {'income', 'expense', 'cash_expenses',
+    'today_income', 'today_expense'}.
+    """
+    today = timezone.localdate()
+    yesterday = today - timedelta(days=1)
+    checkpoint = CashCheckpoint.objects.order_by('-date').first()
+    if checkpoint is None or checkpoint.date < yesterday:
+        checkpoint = close_cash_day(yesterday)
+
+    totals = _totals_between(checkpoint.date + timedelta(days=1), None, today=date_range_q('date', today, today))
+    for name in ('income', 'expense', 'cash_expenses'):
+        totals[name] += getattr(checkpoint, name)
+    return totals
+
+
+def _credit_account_movements(day):
+    """Manual charges and payments on credit accounts during day, from the credit ledger."""
+    totals = dict(
+        CreditLedgerEntry.objects.filter(
+            date_range_q('created_at', day, day), kind__in=('charge', 'payment'), transaction__isnull=True
+        ).exclude(description=OPENING_DESCRIPTION).values_list('kind').annotate(total=Sum('amount'))
+    )
+    return totals.get('charge') or Decimal('0'), -(totals.get('payment') or Decimal('0'))
+
+
+def close_day(day, user):
+    """
+    Snapshot a past local day into a DayClose and lock it, checkpointing its
+    cash totals on the way. Raises ValueError if the day is not over yet or
+    already closed.
+    """
+    if day >= timezone.localdate():
+        raise ValueError('A day can only be closed once it is over')
+    on_day = date_range_q('date', day, day)
+    with transaction.atomic():
+        if DayClose.objects.filter(date=day, reopened_at__isnull=True).exists():
+            raise ValueError(f'{day} is already closed')
+
+        txs = Transaction.objects.filter(date_range_q('timestamp', day, day), is_canceled=False)
+        sales = queries.sales_figures(txs)
+        cashier_totals = [
+            {'cashier': row['cashier'], 'username': row['cashier__username'],
+             'total': row['total'], 'count': row['count']}
+            for row in txs.values('cashier', 'cashier__username').annotate(
+                total=Sum('total_amount'), count=Count('id')
+            ).order_by('cashier__username')
+        ]
+        cashbook = queries.cashbook_figures(CashBookEntry.objects.filter(on_day))
+        # The cash part of mixed sales went to the cashbook; the rest was charged
+        mixed_cash = queries.cashbook_figures(CashBookEntry.objects.filter(
+            related_transaction__in=txs.filter(payment_type='mixed')
+        ))['income']
+        charges, payments = _credit_account_movements(day)
+
+        try:
+            with transaction.atomic():
+                close = DayClose.objects.create(
+                    date=day,
+                    total_sales=sales['total_sales'],
+                    transaction_count=sales['transaction_count'],
+                    cash_sales=sales['cash_sales'],
+                    credit_sales=sales['credit_sales'],
+                    mixed_sales=sales['mixed_sales'],
+                    cashbook_income=cashbook['income'],
+                    cashbook_expense=cashbook['expense'],
+                    expenses=queries.expense_total(Expense.objects.filter(on_day)),
+                    cash_expenses=queries.expense_total(Expense.objects.filter(on_day, paid_by='cash')),
+                    credit_charges=sales['credit_sales'] + sales['mixed_sales'] - mixed_cash + charges,
+                    credit_payments=payments,
+                    cashier_totals=cashier_totals,
+                    top_items=queries.top_items(txs, 10),
+                    closed_by=user,
+                )
+        except IntegrityError:
+            raise ValueError(f'{day} is already closed')
+        close_cash_day(day)
+        AuditLog.objects.create(
+            who=user,
+            action='close',
+            model='DayClose',
+            new_data={'id': close.id, 'date': str(day), 'total_sales': str(close.total_sales)}
+        )
+        invalidate_report_days(day)
+        return close
+
+
+def reopen_day(close, user):
+    """Retire an active DayClose so its day accepts writes again."""
+    with transaction.atomic():
+        close = DayClose.objects.select_for_update().get(pk=close.pk)
+        if close.reopened_at is not None:
+            raise ValueError(f'{close.date} is not closed')
+        close.reopened_at = timezone.now()
+        close.reopened_by = user
+        close.save(update_fields=['reopened_at', 'reopened_by'])
+        AuditLog.objects.create(
+            who=user,
+            action='reopen',
+            model='DayClose',
+            previous_data={'id': close.id, 'date': str(close.date)}
+        )
+        invalidate_report_days(close.date)
+        return close
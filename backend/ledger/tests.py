@@ -0,0 +1,198 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+from .models import CashBookEntry, CashCheckpoint, CashCheckpointLock, DayClose, Expense
+from .services import cash_totals, close_cash_day
+
+
+def _at(day, hour=12):
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+class CashCheckpointTests(TestCase):
+    """Cash on hand is the latest checkpoint plus the entries dated after it."""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+
+    def _entry(self, days_ago, entry_type, amount):
+        return CashBookEntry.objects.create(
+            entry_type=entry_type, amount=Decimal(amount), date=_at(self.today - timedelta(days=days_ago))
+        )
+
+    def _expense(self, days_ago, amount, paid_by='cash'):
+        expense = Expense.objects.create(description='Gas', amount=Decimal(amount), paid_by=paid_by)
+        expense.date = _at(self.today - timedelta(days=days_ago))
+        expense.save()
+        return expense
+
+    def _cash_on_hand(self):
+        totals = cash_totals()
+        return totals['income'] - totals['expense'] - totals['cash_expenses']
+
+    def test_totals_are_checkpoint_plus_recent_entries(self):
+        for days_ago in range(1, 30):
+            self._entry(days_ago, 'income', '10')
+        self._entry(3, 'expense', '25')
+        self._expense(2, '5')
+        self._expense(2, '100', paid_by='bank')
+        self._entry(0, 'income', '7')
+
+        totals = cash_totals()
+        self.assertEqual((totals['income'], totals['expense'], totals['cash_expenses']), (297, 25, 5))
+        self.assertEqual((totals['today_income'], totals['today_expense']), (7, 0))
+        checkpoint = CashCheckpoint.objects.get()
+        self.assertEqual((checkpoint.date, checkpoint.income), (self.today - timedelta(days=1), 290))
+
+        # Once yesterday is checkpointed, the history is not read again
+        CashBookEntry.objects.filter(date__lt=_at(self.today, 0)).update(amount=0)
+        with self.assertNumQueries(3):
+            self.assertEqual(cash_totals()['income'], 297)
+
+    def test_backdated_write_drops_later_checkpoints(self):
+        self._entry(10, 'income', '100')
+        close_cash_day(self.today - timedelta(days=8))
+        close_cash_day(self.today - timedelta(days=4))
+        self.assertEqual(self._cash_on_hand(), 100)
+
+        expense = self._expense(6, '30')
+        self.assertEqual(list(CashCheckpoint.objects.values_list('date', flat=True)), [self.today - timedelta(days=8)])
+        self.assertEqual(self._cash_on_hand(), 70)
+
+        # Moving it further back drops the checkpoints from its old day and its new one
+        expense.date = _at(self.today - timedelta(days=9))
+        expense.save()
+        self.assertFalse(CashCheckpoint.objects.exists())
+        self.assertEqual(self._cash_on_hand(), 70)
+
+        expense.delete()
+        self.assertEqual(self._cash_on_hand(), 100)
+
+    def test_checkpoint_writes_and_drops_hold_the_lock_row(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def tables(run):
+            with CaptureQueriesContext(connection) as ctx:
+                run()
+            return [q['sql'].split(' FROM ')[1].split()[0].strip('"') for q in ctx.captured_queries
+                    if q['sql'].startswith('SELECT') and ' FROM ' in q['sql']]
+
+        # The lock comes before the totals are read
+        self.assertEqual(tables(lambda: close_cash_day(self.today - timedelta(days=2)))[0], 'ledger_cashcheckpointlock')
+        self.assertIn('ledger_cashcheckpointlock', tables(lambda: self._entry(3, 'income', '10')))
+        self.assertEqual(CashCheckpointLock.objects.count(), 1)
+
+    def test_todays_writes_leave_checkpoints_alone(self):
+        close_cash_day(self.today - timedelta(days=1))
+        with self.assertNumQueries(1):
+            self._entry(0, 'income', '10')
+        self.assertTrue(CashCheckpoint.objects.exists())
+
+    def test_close_day_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='mgr', password='pass', role='manager'))
+        self._entry(2, 'income', '40')
+        resp = client.post('/api/cashbook/close_day/', {'date': str(self.today - timedelta(days=2))}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['cash_on_hand'], 40)
+        resp = client.post('/api/cashbook/close_day/', {'date': str(self.today)}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(client.get('/api/cashbook/summary/').data['total_income'], 40)
+
+
+class DayCloseTests(TestCase):
+    """A closed day is snapshotted, read-only until an admin reopens it, and reported from the snapshot."""
+
+    def setUp(self):
+        from accounts.models import CreditAccount, CreditLedgerEntry
+        from menu.models import FoodItem
+        from transactions.services import create_transaction_atomic
+        self.today = timezone.localdate()
+        self.day = self.today - timedelta(days=1)
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.admin = User.objects.create_user(username='boss', password='pass', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+        self.student = CreditAccount.objects.create(account_id='S1', name='Student', account_type='student')
+        tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+
+        def sell(payment_type, quantity, **kwargs):
+            return create_transaction_atomic(
+                cashier=self.manager, payment_type=payment_type, timestamp=_at(self.day),
+                lines_data=[{'food_item': tea.pk, 'quantity': quantity, 'portion_type': 'full', 'unit_price': 20}],
+                **kwargs
+            )
+        self.sale = sell('cash', 3)
+        sell('credit', 2, linked_account_id='S1')
+        sell('mixed', 5, linked_account_id='S1', cash_amount=30)
+        expense = Expense.objects.create(description='Gas', amount=Decimal('15'))
+        expense.date = _at(self.day)
+        expense.save()
+        CreditLedgerEntry.objects.create(account=self.student, kind='payment', amount=Decimal('-25'),
+                                         balance_after=Decimal('85'), created_at=_at(self.day))
+
+    def _close(self, day=None):
+        return self.client.post('/api/day-closes/close/', {'date': str(day or self.day)}, format='json')
+
+    def test_close_snapshots_the_day(self):
+        resp = self._close()
+        self.assertEqual(resp.status_code, 201)
+        data = resp.data
+        self.assertEqual((data['total_sales'], data['transaction_count']), ('200.00', 3))
+        self.assertEqual((data['cash_sales'], data['credit_sales'], data['mixed_sales']), ('60.00', '40.00', '100.00'))
+        self.assertEqual((data['cashbook_income'], data['expenses']), ('90.00', '15.00'))
+        self.assertEqual((data['credit_charges'], data['credit_payments']), ('110.00', '25.00'))
+        self.assertEqual(data['cashier_totals'][0]['count'], 3)
+        self.assertEqual(CashCheckpoint.objects.get().date, self.day)
+
+        self.assertEqual(self._close().status_code, 400)
+        self.assertEqual(self._close(self.today).status_code, 400)
+        with self.assertRaises(ValueError):
+            DayClose.objects.get().save()
+
+    def test_closed_day_rejects_writes_until_reopened(self):
+        from ledger.periods import PeriodClosed
+        self._close()
+        with self.assertRaises(PeriodClosed):
+            CashBookEntry.objects.create(entry_type='income', amount=Decimal('5'), date=_at(self.day))
+        expense = Expense.objects.get()
+        self.assertEqual(self.client.patch(f'/api/expenses/{expense.pk}/', {'amount': '20'}).status_code, 403)
+
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.post(f'/api/transactions/{self.sale.pk}/cancel/').status_code, 403)
+        # Today stays writable
+        CashBookEntry.objects.create(entry_type='income', amount=Decimal('5'))
+
+        day_close = DayClose.objects.get()
+        self.client.force_authenticate(user=self.manager)
+        self.assertEqual(self.client.post(f'/api/day-closes/{day_close.pk}/reopen/').status_code, 403)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.post(f'/api/day-closes/{day_close.pk}/reopen/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/transactions/{self.sale.pk}/cancel/').status_code, 200)
+
+        resp = self._close()
+        self.assertEqual((resp.status_code, resp.data['transaction_count']), (201, 2))
+        self.assertEqual(DayClose.objects.count(), 2)
+
+    def test_offline_sale_into_closed_day_is_rejected(self):
+        from menu.models import FoodItem
+        self._close()
+        resp = self.client.post('/api/transactions/bulk/', {'device': 'till-1', 'sales': [{
+            'client_id': 'till-1', 'timestamp': _at(self.day).isoformat(), 'payment_type': 'cash',
+            'lines': [{'food_item': FoodItem.objects.get().pk, 'quantity': 1, 'portion_type': 'full', 'unit_price': 20}],
+        }]}, format='json')
+        self.assertEqual(resp.data['results'][0]['status'], 'rejected')
+
+    def test_daily_report_of_closed_day_reads_the_snapshot(self):
+        from django.core.cache import caches
+        self._close()
+        caches['reports'].clear()
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/reports/daily/', {'date': str(self.day)})
+        self.assertTrue(resp.data['closed'])
+        self.assertEqual((resp.data['total_sales'], resp.data['expenses']), (200, 15))
+        self.assertEqual(resp.data['top_items'][0]['quantity_sold'], 10)
@@ -3,16 +3,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
 from django.db.models import Sum
-from .models import CashBookEntry, Expense
-from .serializers import CashBookEntrySerializer, ExpenseSerializer
-from accounts.permissions import IsCashierOrHigher, IsManagerOrAdmin
+from django.utils import timezone
+from datetime import date, timedelta
+from core.dates import LocalDateFilter
+from .models import CashBookEntry, DayClose, Expense
+from .services import cash_totals, close_cash_day, close_day, reopen_day
+from .serializers import CashBookEntrySerializer, DayCloseSerializer, ExpenseSerializer
+from accounts.permissions import IsAdmin, IsCashierOrHigher, IsManagerOrAdmin
 from audit.models import AuditLog
 
 
 class CashBookFilter(filters.FilterSet):
-    date = filters.DateFilter(field_name='date', lookup_expr='date')
-    date_from = filters.DateFilter(field_name='date', lookup_expr='date__gte')
-    date_to = filters.DateFilter(field_name='date', lookup_expr='date__lte')
+    date = LocalDateFilter(field_name='date', lookup_expr='exact')
+    date_from = LocalDateFilter(field_name='date', lookup_expr='gte')
+    date_to = LocalDateFilter(field_name='date', lookup_expr='lte')
     entry_type = filters.CharFilter(field_name='entry_type')
     
     class Meta:
@@ -27,7 +31,7 @@ class CashBookViewSet(viewsets.ModelViewSet):
     filterset_class = CashBookFilter
     
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'close_day']:
             return [IsManagerOrAdmin()]
         return [IsCashierOrHigher()]
     
@@ -43,25 +47,44 @@ class CashBookViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Get cashbook summary."""
-        total_income = CashBookEntry.objects.filter(
-            entry_type='income'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        total_expense = CashBookEntry.objects.filter(
-            entry_type='expense'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        cash = cash_totals()
+        total_income, total_expense = cash['income'], cash['expense']
         
         return Response({
             'total_income': float(total_income),
             'total_expense': float(total_expense),
             'balance': float(total_income - total_expense)
         })
+    
+    @action(detail=False, methods=['post'])
+    def close_day(self, request):
+        """Checkpoint the cash totals through a past day. Body: {"date": "YYYY-MM-DD"} (default: yesterday)."""
+        date_str = request.data.get('date')
+        try:
+            day = date.fromisoformat(date_str) if date_str else timezone.localdate() - timedelta(days=1)
+            checkpoint = close_cash_day(day)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        AuditLog.objects.create(
+            who=request.user,
+            action='close_day',
+            model='CashCheckpoint',
+            new_data={'date': str(day), 'income': str(checkpoint.income), 'expense': str(checkpoint.expense)}
+        )
+        return Response({
+            'date': str(checkpoint.date),
+            'income': float(checkpoint.income),
+            'expense': float(checkpoint.expense),
+            'cash_expenses': float(checkpoint.cash_expenses),
+            'cash_on_hand': float(checkpoint.income - checkpoint.expense - checkpoint.cash_expenses)
+        })
 
 
 class ExpenseFilter(filters.FilterSet):
-    date = filters.DateFilter(field_name='date', lookup_expr='date')
-    date_from = filters.DateFilter(field_name='date', lookup_expr='date__gte')
-    date_to = filters.DateFilter(field_name='date', lookup_expr='date__lte')
+    date = LocalDateFilter(field_name='date', lookup_expr='exact')
+    date_from = LocalDateFilter(field_name='date', lookup_expr='gte')
+    date_to = LocalDateFilter(field_name='date', lookup_expr='lte')
     category = filters.CharFilter(field_name='category', lookup_expr='icontains')
     paid_by = filters.CharFilter(field_name='paid_by')
     
@@ -118,3 +141,37 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             'total': float(total),
             'by_category': list(by_category)
         })
+
+
+class DayCloseViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    End-of-day closes. POST close/ {"date": "YYYY-MM-DD"} (default: yesterday)
+    snapshots and locks a past day; an admin POSTs <id>/reopen/ to unlock it.
+    """
+    queryset = DayClose.objects.select_related('closed_by', 'reopened_by').order_by('-date', '-closed_at')
+    serializer_class = DayCloseSerializer
+    permission_classes = [IsManagerOrAdmin]
+    filterset_fields = ['date']
+    
+    def get_permissions(self):
+        if self.action == 'reopen':
+            return [IsAdmin()]
+        return [IsManagerOrAdmin()]
+    
+    @action(detail=False, methods=['post'])
+    def close(self, request):
+        date_str = request.data.get('date')
+        try:
+            day = date.fromisoformat(date_str) if date_str else timezone.localdate() - timedelta(days=1)
+            day_close = close_day(day, request.user)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(DayCloseSerializer(day_close).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def reopen(self, request, pk=None):
+        try:
+            day_close = reopen_day(self.get_object(), request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(DayCloseSerializer(day_close).data)
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+def clamp_negative_stock(apps, schema_editor):
+    FoodItem = apps.get_model('menu', 'FoodItem')
+    FoodItem.objects.filter(stock_quantity__lt=0).update(stock_quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_fooditem_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fooditem',
+            constraint=models.CheckConstraint(check=models.Q(('stock_quantity__gte', 0)), name='fooditem_stock_non_negative'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=1, help_text="Split pre-made stock across this many counters so busy tills don't queue on one row"),
+        ),
+        migrations.CreateModel(
+            name='FoodItemStockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shard_rows', to='menu.fooditem')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fooditemstockshard',
+            constraint=models.UniqueConstraint(fields=('food_item', 'shard'), name='fooditem_stock_shard_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='fooditemstockshard',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='fooditem_stock_shard_non_negative'),
+        ),
+    ]
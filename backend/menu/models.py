@@ -1,7 +1,54 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Min, OuterRef, Q, IntegerField, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce, Floor
 from accounts.models import User
 
 
+class FoodItemQuerySet(models.QuerySet):
+    def with_stock_on_hand(self):
+        """
+        Annotate stock_on_hand: the pre-made count, summed over the
+        FoodItemStockShard rows for items in sharded mode.
+        """
+        shard_total = FoodItemStockShard.objects.filter(
+            food_item=OuterRef('pk')
+        ).values('food_item').annotate(total=Sum('quantity')).values('total')
+        return self.annotate(stock_on_hand=Case(
+            When(stock_shards__gt=1, stock_quantity__isnull=False, then=Coalesce(Subquery(shard_total), 0)),
+            default=F('stock_quantity'),
+        ))
+
+    def with_availability(self):
+        """
+        Annotate recipe size and how many portions current ingredient stock can
+        make, in the same query that loads the items:
+        max_available = MIN(FLOOR(current_quantity / quantity)) over the recipe.
+        """
+        per_ingredient = Floor(
+            F('recipe__ingredients__ingredient__current_quantity') / F('recipe__ingredients__quantity')
+        )
+        return self.annotate(
+            recipe_ingredient_count=Count('recipe__ingredients'),
+            max_available=Coalesce(
+                Cast(Min(per_ingredient, filter=Q(recipe__ingredients__quantity__gt=0)), IntegerField()),
+                0
+            ),
+        )
+
+    def with_stored_availability(self):
+        """
+        Same annotations as with_availability(), read from the FoodItemAvailability
+        rows that inventory.services keeps current, plus the sold-out flag and the
+        ingredient that limits production. No recipe joins or aggregation.
+        """
+        return self.annotate(
+            recipe_ingredient_count=Coalesce(F('availability_record__recipe_ingredient_count'), 0),
+            max_available=Coalesce(F('availability_record__can_make'), 0),
+            is_sold_out=Coalesce(F('availability_record__is_sold_out'), True),
+            limiting_ingredient_name=F('availability_record__limiting_ingredient__name'),
+        )
+
+
 class FoodItem(models.Model):
     PORTION_CHOICES = (('full', 'Full'), ('half', 'Half'))
 
@@ -14,15 +61,98 @@ class FoodItem(models.Model):
     category = models.CharField(max_length=100, blank=True)
     image = models.ImageField(upload_to='menu_items/', null=True, blank=True)
     stock_quantity = models.IntegerField(null=True, blank=True, help_text="Pre-made stock count (optional)")
+    stock_shards = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Split pre-made stock across this many counters so busy tills don't queue on one row"
+    )
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='created_fooditems')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FoodItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # NULL (made-to-order) passes the check
+            models.CheckConstraint(check=Q(stock_quantity__gte=0), name='fooditem_stock_non_negative'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = (instance.__dict__.get('stock_quantity'), instance.__dict__.get('stock_shards'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Setting stock_quantity or stock_shards lays the stock out again; other
+        # edits leave the shards alone (in sharded mode the column is not the live count)
+        from .pricing import invalidate_price_table
+        from inventory.services import StockLockManager, refresh_availability, rebuild_stock_shards
+        from core import events
+
+        loaded = getattr(self, '_loaded_stock', None)
+        relayout = loaded != (self.stock_quantity, self.stock_shards) and (
+            self.is_sharded() or (loaded is not None and loaded[0] is not None and loaded[1] > 1)
+        )
+        with transaction.atomic():
+            locks = StockLockManager()
+            if relayout and self.pk is not None:
+                # Hold the item and its shards until the new layout commits, so a
+                # sale cannot land between reading the shards and replacing them
+                locks.lock(FoodItem, pk=self.pk)
+                locks.lock(FoodItemStockShard, food_item_id=self.pk)
+            if relayout and loaded is not None and loaded[1] > 1 and loaded[0] == self.stock_quantity:
+                # Only the shard count changed: carry over what the shards hold
+                self.stock_quantity = self.stock_shard_rows.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+            super().save(*args, **kwargs)
+            self._loaded_stock = (self.stock_quantity, self.stock_shards)
+
+            if relayout:
+                rebuild_stock_shards(self)
+            if relayout or not self.is_sharded():
+                self.stock_on_hand = self.stock_quantity
+            invalidate_price_table()
+            refresh_availability(food_item_ids=[self.pk], locks=locks)
+        events.publish(
+            'food_item',
+            id=self.pk,
+            name=self.name,
+            category=self.category,
+            is_active=self.is_active,
+            available_portions=self.available_portions,
+            price_full=self.price_full,
+            price_half=self.price_half,
+        )
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        from .pricing import invalidate_price_table
+        from .snapshot import invalidate_menu_snapshot
+        from core import events
+        invalidate_price_table()
+        invalidate_menu_snapshot()
+        events.publish('food_item_deleted', id=pk)
+        return result
+
+    def is_sharded(self):
+        return self.stock_quantity is not None and self.stock_shards > 1
+
+    def current_stock(self):
+        """Pre-made stock on hand (None for made-to-order), summing the shards in sharded mode."""
+        if hasattr(self, 'stock_on_hand'):
+            return self.stock_on_hand
+        if not self.is_sharded():
+            return self.stock_quantity
+        return self.stock_shard_rows.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+
     def has_valid_recipe(self):
         """Check if item has a recipe with at least 2 ingredients"""
+        if hasattr(self, 'recipe_ingredient_count'):
+            return self.recipe_ingredient_count >= 2
         try:
             recipe = self.recipe
             return recipe.ingredients.count() >= 2
@@ -31,6 +161,8 @@ class FoodItem(models.Model):
 
     def calculate_max_available(self):
         """Calculate how many items can be made from current ingredient stock"""
+        if hasattr(self, 'max_available'):
+            return self.max_available
         try:
             recipe = self.recipe
             if not recipe:
@@ -59,19 +191,43 @@ class FoodItem(models.Model):
         """Get detailed availability info"""
         if self.stock_quantity is not None:
             # Pre-made item
-            return {
+            stock = self.current_stock()
+            status = {
                 'type': 'pre_made',
-                'available': self.stock_quantity > 0,
-                'quantity': self.stock_quantity,
+                'available': stock > 0,
+                'quantity': stock,
                 'can_make': 0
             }
         else:
             # Made-to-order item
             can_make = self.calculate_max_available()
-            return {
+            status = {
                 'type': 'made_to_order',
                 'available': can_make > 0,
                 'quantity': 0,
                 'can_make': can_make
             }
+        status['is_sold_out'] = getattr(self, 'is_sold_out', not status['available'])
+        if hasattr(self, 'limiting_ingredient_name'):
+            status['limiting_ingredient'] = self.limiting_ingredient_name
+        return status
+
 
+
+class FoodItemStockShard(models.Model):
+    """
+    One slice of a pre-made item's stock when FoodItem.stock_shards > 1. A sale
+    decrements a single shard, so concurrent tills mostly touch different rows.
+    """
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='stock_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['food_item', 'shard'], name='fooditem_stock_shard_unique'),
+            models.CheckConstraint(check=Q(quantity__gte=0), name='fooditem_stock_shard_non_negative'),
+        ]
+
+    def __str__(self):
+        return f"{self.food_item.name} shard {self.shard}: {self.quantity}"
@@ -0,0 +1,71 @@
+"""
+In-process price and portion table used to validate and price checkout lines
+without touching the database.
+
+The table is rebuilt from FoodItem whenever its version changes. The version
+lives in Django's default cache, shared by every worker in production
+(settings.SHARED_CACHE), so a FoodItem save in one worker invalidates the
+table in all of them; the saving process also drops its own copy immediately.
+"""
+import threading
+from collections import namedtuple
+from django.db import transaction
+from .versioning import current_version, bump_version
+
+VERSION_KEY = 'menu:price_table_version'
+
+PriceEntry = namedtuple('PriceEntry', ['name', 'portions', 'prices'])
+
+_table = None
+_lock = threading.Lock()
+
+
+class PriceTable:
+    """Snapshot of every FoodItem's portions and prices at one version."""
+
+    def __init__(self, version, entries):
+        self.version = version
+        self.entries = entries
+
+    def __contains__(self, food_item_id):
+        return food_item_id in self.entries
+
+    def get(self, food_item_id):
+        return self.entries.get(food_item_id)
+
+    def price(self, food_item_id, portion):
+        """Unit price of a portion, or None if the item has no price for it."""
+        return self.entries[food_item_id].prices.get(portion)
+
+
+def _build(version):
+    from .models import FoodItem
+    rows = FoodItem.objects.values_list('id', 'name', 'available_portions', 'price_full', 'price_half')
+    entries = {
+        pk: PriceEntry(name, list(portions or []), {'full': price_full, 'half': price_half})
+        for pk, name, portions, price_full, price_half in rows
+    }
+    return PriceTable(version, entries)
+
+
+def get_price_table():
+    """Return the current price table, rebuilding it only when the version moved."""
+    global _table
+    version = current_version(VERSION_KEY)
+    table = _table
+    if table is None or table.version != version:
+        with _lock:
+            table = _table
+            if table is None or table.version != version:
+                table = _table = _build(version)
+    return table
+
+
+def invalidate_price_table():
+    """
+    Drop this process's table now and bump the shared version once the
+    surrounding transaction commits, so other workers rebuild from committed data.
+    """
+    global _table
+    _table = None
+    transaction.on_commit(lambda: bump_version(VERSION_KEY))
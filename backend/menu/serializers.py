@@ -6,15 +6,31 @@ class FoodItemSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(required=False, allow_null=True, use_url=True)
     
     max_daily_production = serializers.SerializerMethodField()
+    has_valid_recipe = serializers.SerializerMethodField()
+    availability = serializers.SerializerMethodField()
     
     class Meta:
         model = FoodItem
         fields = '__all__'
-        extra_fields = ['max_daily_production']
+        extra_fields = ['max_daily_production', 'has_valid_recipe', 'availability']
+        extra_kwargs = {'stock_quantity': {'min_value': 0}}
         
+    # These read the with_availability() annotations when present (no extra queries)
     def get_max_daily_production(self, obj):
         return obj.calculate_max_available()
 
+    def get_has_valid_recipe(self, obj):
+        return obj.has_valid_recipe()
+
+    def get_availability(self, obj):
+        return obj.get_availability_status()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded items report the sum of their shards
+        data['stock_quantity'] = instance.current_stock()
+        return data
+
     def validate(self, data):
         portions = data.get('available_portions', [])
         if 'full' in portions and not data.get('price_full'):
@@ -0,0 +1,42 @@
+"""
+Versioned menu snapshot for POS polling.
+
+The version moves whenever a FoodItem, a recipe or an ingredient's stock
+changes (inventory.services.refresh_availability runs on all of those). Tills
+send the ETag they hold and get a 304 while it is current; a changed menu is
+serialized once per version and role and then served from the cache. Version
+and bodies live in the default cache, which every worker shares in production
+(settings.SHARED_CACHE), so no worker answers 304 against a menu another one
+has already changed.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from .versioning import current_version, bump_version
+
+VERSION_KEY = 'menu:snapshot_version'
+
+# Old versions are never read again, so their bodies only need to outlive a burst of polls
+BODY_TIMEOUT = 60 * 60
+
+
+def snapshot_version():
+    return current_version(VERSION_KEY)
+
+
+def snapshot_etag(version, role):
+    return f'"menu-{version}-{role}"'
+
+
+def get_snapshot_body(version, role, build):
+    """Return the cached body for (version, role), calling build() on a miss."""
+    key = f'menu:snapshot:{version}:{role}'
+    body = cache.get(key)
+    if body is None:
+        body = build()
+        cache.set(key, body, BODY_TIMEOUT)
+    return body
+
+
+def invalidate_menu_snapshot():
+    """Bump the snapshot version once the surrounding transaction commits."""
+    transaction.on_commit(lambda: bump_version(VERSION_KEY))
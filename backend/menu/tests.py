@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from accounts.models import User
+from inventory.models import Ingredient, Recipe, RecipeIngredient
+from .models import FoodItem
+
+
+class MenuAvailabilityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client.force_authenticate(user=self.manager)
+        self.flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=1000)
+        self.oil = Ingredient.objects.create(name='Oil', unit='ml', current_quantity=250)
+
+    def _item(self, name, flour, oil):
+        item = FoodItem.objects.create(name=name, price_full=100, available_portions=['full'])
+        recipe = Recipe.objects.create(food_item=item)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.flour, quantity=flour)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.oil, quantity=oil)
+        return item
+
+    def test_annotation_matches_python_calculation(self):
+        items = [self._item('Momo', 300, 20), self._item('Pakoda', 100, 100), self._item('Roti', 0, 50)]
+        FoodItem.objects.create(name='No Recipe', price_full=10)
+        for item in FoodItem.objects.with_availability():
+            fresh = FoodItem.objects.get(pk=item.pk)
+            self.assertEqual(item.calculate_max_available(), fresh.calculate_max_available(), item.name)
+            self.assertEqual(item.has_valid_recipe(), fresh.has_valid_recipe(), item.name)
+        self.assertEqual(FoodItem.objects.with_availability().get(pk=items[0].pk).max_available, 3)
+
+    def test_menu_list_is_one_query(self):
+        for i in range(5):
+            self._item(f'Item {i}', 100, 10)
+        # One query for the page count, one for the annotated page
+        with self.assertNumQueries(2):
+            resp = self.client.get('/api/food-items/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0]['max_daily_production'], 10)
+        self.assertTrue(resp.data['results'][0]['has_valid_recipe'])
+
+    def test_availability_action_uses_annotation(self):
+        item = self._item('Momo', 300, 20)
+        with self.assertNumQueries(1):
+            resp = self.client.get(f'/api/food-items/{item.pk}/availability/')
+        self.assertEqual(resp.data['can_make'], 3)
+        self.assertTrue(resp.data['has_recipe'])
+
+
+class MenuSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.cashier = User.objects.create_user(username='cashier', password='pass', role='cashier')
+        self.client.force_authenticate(user=self.cashier)
+        self.flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=1000)
+        self.momo = FoodItem.objects.create(name='Momo', price_full=100, available_portions=['full'])
+        recipe = Recipe.objects.create(food_item=self.momo)
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=self.flour, quantity=100)
+        FoodItem.objects.create(name='Hidden', price_full=10, is_active=False)
+
+    def test_unchanged_menu_is_304_without_queries(self):
+        resp = self.client.get('/api/food-items/snapshot/')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        self.assertEqual([i['name'] for i in resp.data['items']], ['Momo'])
+
+        with self.assertNumQueries(0):
+            resp = self.client.get('/api/food-items/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+    def test_stock_change_moves_version(self):
+        etag = self.client.get('/api/food-items/snapshot/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flour.current_quantity = 50
+            self.flour.save()
+        resp = self.client.get('/api/food-items/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.data['items'][0]['availability']['can_make'], 0)
+
+    def test_body_is_cached_per_role(self):
+        self.client.get('/api/food-items/snapshot/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/food-items/snapshot/')
+
+        self.client.force_authenticate(user=self.manager)
+        resp = self.client.get('/api/food-items/snapshot/')
+        self.assertEqual(len(resp.data['items']), 2)
+
+
+class SharedVersionTests(TestCase):
+    """A version bumped by one worker is seen by the others through the shipped shared cache."""
+
+    def setUp(self):
+        shared = override_settings(CACHES={'default': settings.SHARED_CACHE})
+        shared.enable()
+        self.addCleanup(shared.disable)
+        cache.clear()
+
+    def other_worker(self):
+        # Another backend instance on the same storage, as a second process has
+        return caches.create_connection('default')
+
+    def test_price_change_reaches_every_worker(self):
+        from .pricing import VERSION_KEY, get_price_table
+        from .versioning import bump_version
+        tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        self.assertEqual(get_price_table().price(tea.pk, 'full'), 20)
+
+        FoodItem.objects.filter(pk=tea.pk).update(price_full=25)
+        bump_version(VERSION_KEY, self.other_worker())
+        self.assertEqual(get_price_table().price(tea.pk, 'full'), 25)
+
+    def test_menu_change_reaches_every_worker(self):
+        from .snapshot import VERSION_KEY
+        from .versioning import bump_version
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='cashier', password='pass', role='cashier'))
+        FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        etag = client.get('/api/food-items/snapshot/')['ETag']
+
+        FoodItem.objects.create(name='Coffee', price_full=40, available_portions=['full'])
+        bump_version(VERSION_KEY, self.other_worker())
+        resp = client.get('/api/food-items/snapshot/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sorted(i['name'] for i in resp.data['items']), ['Coffee', 'Tea'])
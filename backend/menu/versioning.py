@@ -0,0 +1,36 @@
+"""
+Version counters kept in Django's cache. A bump in one worker is seen by every
+worker that shares the cache backend. Each function works on the default cache
+unless given another backend.
+"""
+import time
+from django.core.cache import cache
+
+
+def _reset_version(key, backend=None):
+    # Seed from the clock so a version lost from the cache never matches an old one
+    (backend or cache).add(key, int(time.time() * 1000), timeout=None)
+
+
+def current_version(key, backend=None):
+    backend = backend or cache
+    version = backend.get(key)
+    if version is None:
+        _reset_version(key, backend)
+        version = backend.get(key, 0)
+    return version
+
+
+def current_versions(keys, backend=None):
+    """current_version of each key, read with one get_many."""
+    backend = backend or cache
+    found = backend.get_many(keys)
+    return [found[key] if key in found else current_version(key, backend) for key in keys]
+
+
+def bump_version(key, backend=None):
+    backend = backend or cache
+    try:
+        backend.incr(key)
+    except ValueError:
+        _reset_version(key, backend)
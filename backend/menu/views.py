@@ -1,8 +1,11 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 from django_filters import rest_framework as filters
+from django.utils.http import parse_etags
 from .models import FoodItem
+from .snapshot import snapshot_version, snapshot_etag, get_snapshot_body
 from .serializers import FoodItemSerializer
 from accounts.permissions import IsManagerOrAdminForWrite
 from audit.models import AuditLog
@@ -28,10 +31,12 @@ class FoodItemViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         qs = super().get_queryset()
-        # Cashiers should only see active items
+        # Cashiers should only see active items. The POS reads the stored
+        # availability rows; managers get it computed live from the recipes.
+        # Either way listing the menu is a single query.
         if self.request.user.role == 'cashier':
-            qs = qs.filter(is_active=True)
-        return qs
+            return qs.with_stored_availability().with_stock_on_hand().filter(is_active=True)
+        return qs.with_availability().with_stock_on_hand()
     
     def perform_create(self, serializer):
         item = serializer.save(created_by=self.request.user)
@@ -83,6 +88,27 @@ class FoodItemViewSet(viewsets.ModelViewSet):
         """Get list of unique categories."""
         categories = FoodItem.objects.filter(is_active=True).values_list('category', flat=True).distinct()
         return Response([c for c in categories if c])
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        The whole menu as this role sees it, tagged with the menu version.
+        Send the ETag back in If-None-Match: an unchanged menu is a 304 with no
+        database work, a changed one is serialized once per version and role.
+        """
+        role = request.user.role
+        version = snapshot_version()
+        etag = snapshot_etag(version, role)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        def build():
+            items = self.get_serializer(self.get_queryset(), many=True).data
+            return {'version': version, 'items': list(items)}
+
+        return Response(get_snapshot_body(version, role, build), headers=headers)
     
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
@@ -145,11 +171,13 @@ class FoodItemViewSet(viewsets.ModelViewSet):
             from inventory.services import produce_food_item
             try:
                 produce_food_item(item, quantity, request.user)
+                # Production consumed ingredients, so re-read the availability annotation
+                refreshed = FoodItem.objects.with_availability().get(pk=item.pk)
                 return Response({
                     'status': 'Stock produced',
                     'stock_quantity': item.stock_quantity,
                     'is_active': item.is_active,
-                    'can_make_more': item.calculate_max_available()
+                    'can_make_more': refreshed.calculate_max_available()
                 })
             except ValueError as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -161,37 +189,46 @@ class FoodItemViewSet(viewsets.ModelViewSet):
                     'error': 'This item does not track stock (made-to-order)'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            if quantity > item.stock_quantity:
+            if quantity <= 0:
+                return Response({'error': 'Quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Decrement in place: only succeeds if the stock is still there
+            from inventory.services import StockLockManager, deactivate_sold_out_shards, sold_out_updates, stock_changed
+            with transaction.atomic():
+                locks = StockLockManager()
+                if item.is_sharded():
+                    short = locks.take_sharded({item.pk: quantity}, {item.pk: item.stock_shards})
+                    if short is None:
+                        transaction.on_commit(lambda: deactivate_sold_out_shards([item.pk]))
+                else:
+                    short = locks.take(FoodItem, 'stock_quantity', {item.pk: quantity}, extra=sold_out_updates)
+                if short is None:
+                    stock_changed(food_item_ids=[item.pk], locks=locks)
+            item = FoodItem.objects.with_stock_on_hand().get(pk=item.pk)
+            stock = item.current_stock()
+
+            if short is not None:
                 return Response({
-                    'error': f'Insufficient stock. Available: {item.stock_quantity}'
+                    'error': f'Insufficient stock. Available: {stock}'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            old_stock = item.stock_quantity
-            item.stock_quantity -= quantity
-            
-            if item.stock_quantity <= 0:
-                item.stock_quantity = 0
-                item.is_active = False
-                
-            item.save()
-            
             AuditLog.objects.create(
                 who=request.user,
                 action='stock_sale',
                 model='FoodItem',
-                previous_data={'stock': old_stock},
-                new_data={'stock': item.stock_quantity, 'sold': quantity}
+                previous_data={'stock': stock + quantity},
+                new_data={'stock': stock, 'sold': quantity}
             )
             
             return Response({
-                'stock_quantity': item.stock_quantity,
+                'stock_quantity': stock,
                 'is_active': item.is_active
             })
         
         else: # correct
             # Manual correction (add/subtract) - typically used for audit
-            old_stock = item.stock_quantity
-            item.stock_quantity = (item.stock_quantity or 0) + quantity
+            old_stock = item.current_stock()
+            item.stock_quantity = (old_stock or 0) + quantity
             if item.stock_quantity <= 0:
                  item.stock_quantity = 0
                  item.is_active = False
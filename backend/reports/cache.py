@@ -0,0 +1,148 @@
+"""
+Report result cache.
+
+A report's figures are cached under (report, normalized params, data version
+of every local day it covers). Saving or deleting a Transaction, CashBookEntry
+or Expense bumps the version of its day once the write commits, so a cached
+result is never served after the data under it changed, and reports over
+other days stay cached. Reports over past days are kept for
+REPORT_CACHE_PAST_TTL (default: until evicted); any report that covers today
+or later, or every day, for REPORT_CACHE_RECENT_TTL.
+
+Results, versions and the hit/miss counters live in the REPORT_CACHE cache
+alias, a per-process local-memory cache unless settings point it at a shared
+backend. A local-memory cache only sees the bumps of its own process: with
+several workers another one may keep serving a past day after a correction,
+so there past reports are only kept for REPORT_CACHE_LOCAL_PAST_TTL.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+from menu.versioning import bump_version, current_version, current_versions
+
+ALL_DAYS_KEY = 'reports:version:all'
+
+# A report over more days than this is versioned like one over every day
+# rather than reading a version per day
+MAX_VERSIONED_DAYS = 400
+
+
+def _backend():
+    return caches[getattr(settings, 'REPORT_CACHE', 'reports')]
+
+
+def _past_ttl(backend):
+    """Seconds a report over past days is kept in backend (None: until evicted)."""
+    if isinstance(backend, LocMemCache):
+        return getattr(settings, 'REPORT_CACHE_LOCAL_PAST_TTL', 300)
+    return getattr(settings, 'REPORT_CACHE_PAST_TTL', None)
+
+
+def _day_key(day):
+    return f'reports:version:{day.isoformat()}'
+
+
+def days_between(date_from, date_to):
+    return [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+
+
+def invalidate_report_days(*days):
+    """Bump the version of each local day (and of all-days reports) once the transaction commits."""
+    days = {day for day in days if day is not None}
+
+    def bump():
+        backend = _backend()
+        for day in sorted(days):
+            bump_version(_day_key(day), backend)
+        bump_version(ALL_DAYS_KEY, backend)
+    transaction.on_commit(bump)
+
+
+def invalidate_report_timestamps(*timestamps):
+    """invalidate_report_days for the local days of some aware datetimes."""
+    invalidate_report_days(*(timezone.localdate(ts) for ts in timestamps if ts is not None))
+
+
+class InvalidatesReports:
+    """
+    Model mixin: saving or deleting a row invalidates the cached reports of
+    its local day, and of the day it was loaded with if the save moved it.
+    report_date_field names the row's DateTimeField.
+    """
+    report_date_field = 'date'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_report_date = instance.__dict__.get(cls.report_date_field)
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        current = getattr(self, self.report_date_field)
+        self.report_dates_written(current, getattr(self, '_loaded_report_date', None))
+        self._loaded_report_date = current
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.report_dates_written(getattr(self, self.report_date_field))
+        return result
+
+    def report_dates_written(self, *timestamps):
+        """Called after a save or delete with the timestamps (some may be None) it touched."""
+        invalidate_report_timestamps(*timestamps)
+
+
+def _count(report, outcome):
+    backend = _backend()
+    key = f'reports:stats:{report}:{outcome}'
+    if not backend.add(key, 1, timeout=None):
+        try:
+            backend.incr(key)
+        except ValueError:
+            backend.add(key, 1, timeout=None)
+
+
+def cached_report(report, params, days, build):
+    """
+    Return (figures, hit): the cached figures of report for params, or build()
+    stored for next time. days lists the local days the figures are computed
+    from; None means every day.
+    """
+    backend = _backend()
+    if days is not None and len(days) > MAX_VERSIONED_DAYS:
+        days = None
+    if days is None:
+        versions = [current_version(ALL_DAYS_KEY, backend)]
+        recent = True
+    else:
+        versions = current_versions([_day_key(day) for day in days], backend)
+        recent = not days or max(days) >= timezone.localdate()
+
+    payload = json.dumps([params, versions], sort_keys=True, default=str)
+    key = f'reports:result:{report}:{hashlib.sha256(payload.encode()).hexdigest()}'
+    figures = backend.get(key)
+    if figures is not None:
+        _count(report, 'hits')
+        return figures, True
+
+    _count(report, 'misses')
+    figures = build()
+    timeout = getattr(settings, 'REPORT_CACHE_RECENT_TTL', 30) if recent else _past_ttl(backend)
+    backend.set(key, figures, timeout)
+    return figures, False
+
+
+def cache_stats(reports):
+    """{report: {'hits': n, 'misses': n}} since the counters were last cleared."""
+    keys = [f'reports:stats:{report}:{outcome}' for report in reports for outcome in ('hits', 'misses')]
+    found = _backend().get_many(keys)
+    return {
+        report: {outcome: found.get(f'reports:stats:{report}:{outcome}', 0) for outcome in ('hits', 'misses')}
+        for report in reports
+    }
@@ -1,71 +1,102 @@
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
-from django.http import HttpResponse
+from django.http import FileResponse
 from datetime import datetime
-from io import BytesIO
-
-def create_styled_workbook(title):
-    """Create a new workbook with basic styling"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = title
-    return wb, ws
-
-def style_header_row(ws, row_num, columns):
-    """Apply styling to header row"""
-    header_fill = PatternFill(start_color="4F46E5", end_color="4F46E5", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    alignment = Alignment(horizontal="center", vertical="center")
-    
-    for col_num, column_name in enumerate(columns, 1):
-        cell = ws.cell(row=row_num, column=col_num)
-        cell.value = column_name
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = alignment
-
-def add_school_header(ws, title, subtitle=None):
-    """Add school branding header to worksheet"""
-    ws.merge_cells('A1:F1')
-    ws['A1'] = 'EECOHM School of Excellence - Canteen Management'
-    ws['A1'].font = Font(bold=True, size=14, color="1E293B")
-    ws['A1'].alignment = Alignment(horizontal="center")
-    
-    ws.merge_cells('A2:F2')
-    ws['A2'] = title
-    ws['A2'].font = Font(bold=True, size=12, color="4F46E5")
-    ws['A2'].alignment = Alignment(horizontal="center")
-    
-    if subtitle:
-        ws.merge_cells('A3:F3')
-        ws['A3'] = subtitle
-        ws['A3'].font = Font(size=10, color="64748B")
-        ws['A3'].alignment = Alignment(horizontal="center")
-        return 5  # Data starts at row 5
-    
-    return 4  # Data starts at row 4
-
-def auto_size_columns(ws):
-    """Auto-size columns based on content"""
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        
-        for cell in column:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
+import tempfile
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows held back to size the columns: a write-only sheet must set its column
+# widths before the first row goes out
+WIDTH_SAMPLE_ROWS = 500
+
+
+class SheetWriter:
+    """
+    One-sheet workbook in openpyxl write-only mode: rows go to disk as they are
+    appended, so memory stays flat however many rows are written. Column widths
+    are measured on the rows as they are appended (the first WIDTH_SAMPLE_ROWS
+    of them) instead of by walking every cell afterwards.
+    """
+
+    def __init__(self, title):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(title)
+        self.widths = {}
+        self._pending = []  # None once the widths are set
+
+    def cell(self, value, font=None, fill=None, alignment=None, number_format=None):
+        cell = WriteOnlyCell(self.ws, value=value)
+        if font:
+            cell.font = font
+        if fill:
+            cell.fill = fill
+        if alignment:
+            cell.alignment = alignment
+        if number_format:
+            cell.number_format = number_format
+        return cell
+
+    def append(self, values, measure=True):
+        if self._pending is None:
+            self.ws.append(values)
+            return
+        if measure:
+            for col_num, value in enumerate(values, 1):
+                value = getattr(value, 'value', value)
+                if value is not None and value != '':
+                    self.widths[col_num] = max(self.widths.get(col_num, 0), len(str(value)))
+        self._pending.append(values)
+        if len(self._pending) >= WIDTH_SAMPLE_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        for col_num, max_length in self.widths.items():
+            self.ws.column_dimensions[get_column_letter(col_num)].width = min(max_length + 2, 50)
+        pending, self._pending = self._pending, None
+        for values in pending:
+            self.ws.append(values)
+
+    def add_school_header(self, title, subtitle=None):
+        """Add school branding header (merged across A:F), followed by a blank row"""
+        rows = [
+            ('EECOHM School of Excellence - Canteen Management', Font(bold=True, size=14, color="1E293B")),
+            (title, Font(bold=True, size=12, color="4F46E5")),
+        ]
+        if subtitle:
+            rows.append((subtitle, Font(size=10, color="64748B")))
+        for row_num, (text, font) in enumerate(rows, 1):
+            self.ws.merged_cells.add(f'A{row_num}:F{row_num}')
+            self.append([self.cell(text, font=font, alignment=Alignment(horizontal="center"))], measure=False)
+        self.append([], measure=False)
+
+    def add_header_row(self, columns):
+        """Styled column header row"""
+        header_fill = PatternFill(start_color="4F46E5", end_color="4F46E5", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=11)
+        alignment = Alignment(horizontal="center", vertical="center")
+        self.append([self.cell(name, font=header_font, fill=header_fill, alignment=alignment) for name in columns])
+
+    def response(self, filename):
+        """Save to a temporary file and serve it; the file is removed once sent."""
+        self._flush()
+        output = tempfile.TemporaryFile()
+        self.wb.save(output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
 
 def generate_transactions_excel(transactions, filters=None):
-    """Generate Excel file for transactions list"""
-    wb, ws = create_styled_workbook("Transactions")
-    
+    """
+    Generate Excel file for transactions list. transactions is iterated once;
+    each row needs a line_count annotation and the cashier (select_related).
+    """
+    sheet = SheetWriter("Transactions")
+
     # Add header
     filter_text = ""
     if filters:
@@ -77,57 +108,43 @@ def generate_transactions_excel(transactions, filters=None):
         if filters.get('payment_type'):
             parts.append(f"Payment: {filters['payment_type']}")
         filter_text = " | ".join(parts) if parts else "All Transactions"
-    
-    start_row = add_school_header(ws, "Transaction Report", filter_text)
-    
+
+    sheet.add_school_header("Transaction Report", filter_text)
+
     # Headers
-    columns = ['ID', 'Date', 'Time', 'Cashier', 'Payment Type', 'Items', 'Total Amount', 'Status']
-    style_header_row(ws, start_row, columns)
-    
+    sheet.add_header_row(['ID', 'Date', 'Time', 'Cashier', 'Payment Type', 'Items', 'Total Amount', 'Status'])
+
     # Data
-    row_num = start_row + 1
     for tx in transactions:
-        ws.cell(row=row_num, column=1, value=tx.id)
-        ws.cell(row=row_num, column=2, value=tx.timestamp.strftime('%Y-%m-%d'))
-        ws.cell(row=row_num, column=3, value=tx.timestamp.strftime('%H:%M:%S'))
-        ws.cell(row=row_num, column=4, value=tx.cashier.full_name)
-        ws.cell(row=row_num, column=5, value=tx.payment_type.upper())
-        ws.cell(row=row_num, column=6, value=tx.lines.count())
-        ws.cell(row=row_num, column=7, value=float(tx.total_amount))
-        ws.cell(row=row_num, column=8, value='CANCELED' if tx.is_canceled else 'ACTIVE')
-        row_num += 1
-    
-    # Format currency column
-    for row in range(start_row + 1, row_num):
-        ws.cell(row=row, column=7).number_format = 'Rs. #,##0.00'
-    
-    auto_size_columns(ws)
-    
-    # Return as HTTP response
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+        sheet.append([
+            tx.id,
+            tx.timestamp.strftime('%Y-%m-%d'),
+            tx.timestamp.strftime('%H:%M:%S'),
+            tx.cashier.full_name if tx.cashier else 'N/A',
+            tx.payment_type.upper(),
+            tx.line_count,
+            sheet.cell(float(tx.total_amount), number_format='Rs. #,##0.00'),
+            'CANCELED' if tx.is_canceled else 'ACTIVE',
+        ])
+
     filename = f'transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+    return sheet.response(filename)
+
+
+def _summary_excel(sheet_title, report_title, subtitle, metrics, filename):
+    sheet = SheetWriter(sheet_title)
+    sheet.add_school_header(report_title, subtitle)
+
+    # Summary section
+    sheet.append([sheet.cell("Metric", font=Font(bold=True)), sheet.cell("Value", font=Font(bold=True))])
+    for metric, value in metrics:
+        sheet.append([metric, value])
+
+    return sheet.response(filename)
+
 
 def generate_daily_summary_excel(date, summary_data):
     """Generate Excel file for daily summary report"""
-    wb, ws = create_styled_workbook("Daily Summary")
-    
-    # Add header
-    start_row = add_school_header(ws, "Daily Summary Report", f"Date: {date}")
-    
-    # Summary section
-    ws.cell(row=start_row, column=1, value="Metric").font = Font(bold=True)
-    ws.cell(row=start_row, column=2, value="Value").font = Font(bold=True)
-    
     metrics = [
         ("Total Sales", f"Rs. {summary_data.get('total_sales', 0):.2f}"),
         ("Total Transactions", summary_data.get('transaction_count', 0)),
@@ -135,39 +152,14 @@ def generate_daily_summary_excel(date, summary_data):
         ("Credit Sales", f"Rs. {summary_data.get('credit_sales', 0):.2f}"),
         ("Average Transaction", f"Rs. {summary_data.get('avg_transaction', 0):.2f}"),
     ]
-    
-    for idx, (metric, value) in enumerate(metrics, start_row + 1):
-        ws.cell(row=idx, column=1, value=metric)
-        ws.cell(row=idx, column=2, value=value)
-    
-    auto_size_columns(ws)
-    
-    # Return as HTTP response
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return _summary_excel(
+        "Daily Summary", "Daily Summary Report", f"Date: {date}", metrics, f'daily_summary_{date}.xlsx'
     )
-    filename = f'daily_summary_{date}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+
 
 def generate_monthly_summary_excel(year, month, summary_data):
     """Generate Excel file for monthly summary report"""
-    wb, ws = create_styled_workbook("Monthly Summary")
-    
-    # Add header
     month_name = datetime(year, month, 1).strftime('%B %Y')
-    start_row = add_school_header(ws, "Monthly Summary Report", month_name)
-    
-    # Summary section
-    ws.cell(row=start_row, column=1, value="Metric").font = Font(bold=True)
-    ws.cell(row=start_row, column=2, value="Value").font = Font(bold=True)
-    
     metrics = [
         ("Total Sales", f"Rs. {summary_data.get('total_sales', 0):.2f}"),
         ("Total Transactions", summary_data.get('transaction_count', 0)),
@@ -176,23 +168,7 @@ def generate_monthly_summary_excel(year, month, summary_data):
         ("Total Expenses", f"Rs. {summary_data.get('total_expenses', 0):.2f}"),
         ("Net Profit", f"Rs. {summary_data.get('net_profit', 0):.2f}"),
     ]
-    
-    for idx, (metric, value) in enumerate(metrics, start_row + 1):
-        ws.cell(row=idx, column=1, value=metric)
-        ws.cell(row=idx, column=2, value=value)
-    
-    auto_size_columns(ws)
-    
-    # Return as HTTP response
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return _summary_excel(
+        "Monthly Summary", "Monthly Summary Report", month_name, metrics,
+        f'monthly_summary_{year}_{month:02d}.xlsx'
     )
-    filename = f'monthly_summary_{year}_{month:02d}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
@@ -0,0 +1,64 @@
+import resource
+import sys
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.db import connection
+from accounts.models import User
+from menu.models import FoodItem
+from transactions.models import Transaction, TransactionLine
+from transactions.views import filtered_transactions, transactions_excel
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the transactions Excel export and measure its memory on N generated '
+        'rows (default 100k), in a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--trace-heap', action='store_true',
+                            help='Also report the Python heap peak (tracemalloc slows the run several times)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            manager = User.objects.create_user(username='bench-manager', password='bench', role='manager')
+            item = FoodItem.objects.create(name='Bench Tea', price_full=20, available_portions=['full'])
+            for start in range(0, rows, 5000):
+                txs = Transaction.objects.bulk_create([
+                    Transaction(cashier=manager, payment_type='cash', total_amount=40)
+                    for _ in range(min(5000, rows - start))
+                ])
+                TransactionLine.objects.bulk_create([
+                    TransactionLine(transaction=tx, food_item=item, portion_type='full',
+                                    unit_price=20, quantity=2, line_total=40)
+                    for tx in txs
+                ])
+
+            rss_before = self._peak_rss_mb()
+            if options['trace_heap']:
+                tracemalloc.start()
+            began = time.perf_counter()
+            response = transactions_excel(filtered_transactions({}), {})
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            response.close()
+            elapsed = time.perf_counter() - began
+
+            self.stdout.write(f'rows:            {rows}')
+            self.stdout.write(f'file size:       {size / 1024 / 1024:.1f} MB')
+            self.stdout.write(f'time:            {elapsed:.2f} s')
+            if options['trace_heap']:
+                _, heap_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(f'python heap peak: {heap_peak / 1024 / 1024:.1f} MB')
+            self.stdout.write(f'process peak RSS: {self._peak_rss_mb():.1f} MB (before export: {rss_before:.1f} MB)')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _peak_rss_mb(self):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
@@ -0,0 +1,24 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from reports.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups of a date range (inclusive) from the transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='First day, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', help='Last day, YYYY-MM-DD (default: today)')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from'])
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('Invalid date format. Use YYYY-MM-DD')
+        if date_from > date_to:
+            raise CommandError('--from must not be after --to')
+
+        days, items = rebuild_rollups(date_from, date_to)
+        self.stdout.write(f'Rebuilt {date_from}..{date_to}: {days} day row(s), {items} item row(s)')
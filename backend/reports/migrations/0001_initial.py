@@ -0,0 +1,80 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:52
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    TransactionLine = apps.get_model('transactions', 'TransactionLine')
+    DailySales = apps.get_model('reports', 'DailySales')
+    DailyItemSales = apps.get_model('reports', 'DailyItemSales')
+
+    txs = Transaction.objects.filter(is_canceled=False)
+    DailySales.objects.bulk_create([
+        DailySales(
+            date=row['day'], payment_type=row['payment_type'],
+            total_amount=row['total'], transaction_count=row['count'],
+        )
+        for row in txs.values('payment_type', day=TruncDate('timestamp')).annotate(
+            total=Sum('total_amount'), count=Count('id')
+        ).order_by()
+    ], batch_size=1000)
+    DailyItemSales.objects.bulk_create([
+        DailyItemSales(
+            date=row['day'], food_item_id=row['food_item'], portion_type=row['portion_type'],
+            quantity=row['quantity'], revenue=row['revenue'],
+        )
+        for row in TransactionLine.objects.filter(transaction__is_canceled=False).values(
+            'food_item', 'portion_type', day=TruncDate('transaction__timestamp')
+        ).annotate(quantity=Sum('quantity'), revenue=Sum('line_total')).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('menu', '0004_stock_shards'),
+        ('transactions', '0003_alter_transaction_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('portion_type', models.CharField(max_length=10)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_type', models.CharField(max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('date', 'payment_type'), name='daily_sales_unique'),
+        ),
+        migrations.AddField(
+            model_name='dailyitemsales',
+            name='food_item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='menu.fooditem'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyitemsales',
+            constraint=models.UniqueConstraint(fields=('date', 'food_item', 'portion_type'), name='daily_item_sales_unique'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import models
+from menu.models import FoodItem
+
+
+class DailySales(models.Model):
+    """
+    Non-canceled sales per local day and payment type. Kept up to date by the
+    checkout and cancellation (reports.rollups); rebuild_sales_rollups
+    recomputes any range from the transactions.
+    """
+    date = models.DateField()
+    payment_type = models.CharField(max_length=20)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'payment_type'], name='daily_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.payment_type}: {self.total_amount} ({self.transaction_count})"
+
+
+class DailyItemSales(models.Model):
+    """Quantity and revenue of non-canceled sales per local day, food item and portion."""
+    date = models.DateField()
+    food_item = models.ForeignKey(FoodItem, on_delete=models.PROTECT, related_name='+')
+    portion_type = models.CharField(max_length=10)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'food_item', 'portion_type'], name='daily_item_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.food_item_id} {self.portion_type}: {self.quantity}"
@@ -0,0 +1,109 @@
+"""
+Report query layer. Each function computes a group of report figures in a
+single query using conditional aggregation (Sum(..., filter=Q(...))) instead
+of one aggregate query per figure.
+
+The rollup_* functions compute the same figures from the DailySales and
+DailyItemSales rollups (see reports.rollups), whose size grows with the
+number of days rather than the number of sales.
+"""
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from transactions.models import TransactionLine
+
+PAYMENT_TYPES = ('cash', 'credit', 'mixed')
+
+SALES_FIGURES = ('total_sales', 'transaction_count') + tuple(f'{p}_sales' for p in PAYMENT_TYPES)
+
+
+def _zero():
+    return Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _money(field, **condition):
+    return Coalesce(Sum(field, filter=Q(**condition) if condition else None), _zero())
+
+
+def _sales_aggregates(count=None):
+    figures = {'total_sales': _money('total_amount'), 'transaction_count': count or Count('id')}
+    for payment_type in PAYMENT_TYPES:
+        figures[f'{payment_type}_sales'] = _money('total_amount', payment_type=payment_type)
+    return figures
+
+
+def _rollup_count():
+    return Coalesce(Sum('transaction_count'), 0)
+
+
+def sales_figures(transactions):
+    """Total, count and per payment type sales of a Transaction queryset, in one query."""
+    return transactions.aggregate(**_sales_aggregates())
+
+
+def rollup_sales_figures(rollups):
+    """sales_figures from a DailySales queryset."""
+    return rollups.aggregate(**_sales_aggregates(_rollup_count()))
+
+
+def daily_sales_figures(transactions):
+    """
+    The sales figures of each day, in one grouped query, and the figures for
+    the whole period added up from them. Returns (days, totals); each day
+    carries a 'day' date.
+    """
+    return _with_totals(
+        transactions.values(day=TruncDate('timestamp')).annotate(**_sales_aggregates()).order_by('day')
+    )
+
+
+def rollup_daily_sales_figures(rollups):
+    """daily_sales_figures from a DailySales queryset; days without sales are left out."""
+    return _with_totals(
+        rollups.values(day=F('date')).annotate(
+            **_sales_aggregates(_rollup_count())
+        ).filter(transaction_count__gt=0).order_by('day')
+    )
+
+
+def _with_totals(days):
+    days = list(days)
+    totals = {name: sum((d[name] for d in days), Decimal('0')) for name in SALES_FIGURES}
+    totals['transaction_count'] = int(totals['transaction_count'])
+    return days, totals
+
+
+def top_items(transactions, limit):
+    """Best sellers by quantity among the lines of a Transaction queryset."""
+    return list(TransactionLine.objects.filter(
+        transaction__in=transactions
+    ).values('food_item__name').annotate(
+        quantity_sold=Sum('quantity'),
+        revenue=Sum('line_total')
+    ).order_by('-quantity_sold')[:limit])
+
+
+def rollup_top_items(item_rollups, limit):
+    """top_items from a DailyItemSales queryset."""
+    return list(item_rollups.values('food_item__name').annotate(
+        quantity_sold=Sum('quantity'),
+        revenue=Sum('revenue')
+    ).filter(quantity_sold__gt=0).order_by('-quantity_sold')[:limit])
+
+
+def cashbook_figures(entries, **periods):
+    """
+    Income and expense totals of a CashBookEntry queryset in one query. Each
+    keyword names an extra period (a Q or lookup dict on the entries), adding
+    '<name>_income' and '<name>_expense' figures computed in the same scan.
+    """
+    figures = {'income': _money('amount', entry_type='income'), 'expense': _money('amount', entry_type='expense')}
+    for name, condition in periods.items():
+        condition = condition if isinstance(condition, Q) else Q(**condition)
+        figures[f'{name}_income'] = Coalesce(Sum('amount', filter=condition & Q(entry_type='income')), _zero())
+        figures[f'{name}_expense'] = Coalesce(Sum('amount', filter=condition & Q(entry_type='expense')), _zero())
+    return entries.aggregate(**figures)
+
+
+def expense_total(expenses):
+    return expenses.aggregate(total=_money('amount'))['total']
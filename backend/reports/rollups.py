@@ -0,0 +1,111 @@
+"""
+Sales rollups: DailySales and DailyItemSales, kept current inside the
+checkout and cancellation transactions so reports read a few rows per day
+instead of every sale.
+
+Each sale adds its figures with one INSERT ... ON CONFLICT DO UPDATE per table
+(valid on PostgreSQL and SQLite), rows in key order so two tills updating the
+same day never wait on each other in opposite orders. It runs last in the
+checkout so the shared per-day rows stay locked as briefly as possible.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from core.dates import date_range_q
+from transactions.models import Transaction, TransactionLine
+from .cache import days_between, invalidate_report_days
+from .models import DailySales, DailyItemSales
+
+
+def _add(model, key_fields, rows):
+    """
+    Upsert rows ({field: value} dicts) into model, adding the non-key fields
+    to those of an existing row with the same key_fields. One statement.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    meta = model._meta
+    table = qn(meta.db_table)
+    fields = [meta.get_field(name) for name in rows[0]]
+    columns = [qn(f.column) for f in fields]
+    added = [qn(f.column) for f in fields if f.name not in key_fields]
+    keys = [qn(meta.get_field(name).column) for name in key_fields]
+    values = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([values] * len(rows))} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ', '.join(f'{c} = {table}.{c} + EXCLUDED.{c}' for c in added)
+    )
+    params = [f.get_db_prep_value(row[f.name], connection) for row in rows for f in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record_sale(tx, lines, locks=None, sign=1):
+    """
+    Add a sale (sign=1) or take a canceled one back out (sign=-1) of the
+    rollups of its local day. lines are the sale's TransactionLines.
+    """
+    if locks is not None:
+        locks.acquire(DailySales)
+    day = timezone.localdate(tx.timestamp)
+    _add(DailySales, ('date', 'payment_type'), [{
+        'date': day,
+        'payment_type': tx.payment_type,
+        'total_amount': sign * tx.total_amount,
+        'transaction_count': sign,
+    }])
+
+    items = {}
+    for line in lines:
+        key = (line.food_item_id, line.portion_type)
+        quantity, revenue = items.get(key, (0, 0))
+        items[key] = (quantity + line.quantity, revenue + line.line_total)
+    if locks is not None:
+        locks.acquire(DailyItemSales)
+    _add(DailyItemSales, ('date', 'food_item', 'portion_type'), [
+        {
+            'date': day,
+            'food_item': food_item_id,
+            'portion_type': portion_type,
+            'quantity': sign * items[food_item_id, portion_type][0],
+            'revenue': sign * items[food_item_id, portion_type][1],
+        }
+        for food_item_id, portion_type in sorted(items)
+    ])
+
+
+def rebuild_rollups(date_from, date_to):
+    """
+    Recompute the rollups of local days date_from..date_to (inclusive) from
+    the transactions. Returns (day rows, item rows) written. Sales committed
+    while it runs may be missed; run it when the tills are quiet.
+    """
+    txs = Transaction.objects.filter(date_range_q('timestamp', date_from, date_to), is_canceled=False)
+
+    with transaction.atomic():
+        invalidate_report_days(*days_between(date_from, date_to))
+        DailySales.objects.filter(date__range=(date_from, date_to)).delete()
+        DailyItemSales.objects.filter(date__range=(date_from, date_to)).delete()
+
+        days = DailySales.objects.bulk_create([
+            DailySales(
+                date=row['day'], payment_type=row['payment_type'],
+                total_amount=row['total'], transaction_count=row['count'],
+            )
+            for row in txs.values('payment_type', day=TruncDate('timestamp')).annotate(
+                total=Sum('total_amount'), count=Count('id')
+            ).order_by()
+        ], batch_size=1000)
+        items = DailyItemSales.objects.bulk_create([
+            DailyItemSales(
+                date=row['day'], food_item_id=row['food_item'], portion_type=row['portion_type'],
+                quantity=row['quantity'], revenue=row['revenue'],
+            )
+            for row in TransactionLine.objects.filter(transaction__in=txs).values(
+                'food_item', 'portion_type', day=TruncDate('transaction__timestamp')
+            ).annotate(quantity=Sum('quantity'), revenue=Sum('line_total')).order_by()
+        ], batch_size=1000)
+    return len(days), len(items)
@@ -1,3 +1,4 @@
+from django.core.cache import caches
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
@@ -19,3 +20,249 @@ class ReportsPermissionTests(TestCase):
         self.client.force_authenticate(user=self.manager)
         resp = self.client.get(reverse('daily-summary'))
         self.assertEqual(resp.status_code, 200)
+
+    def test_daily_summary_excel(self):
+        self.client.force_authenticate(user=self.manager)
+        resp = self.client.get(reverse('daily-summary'), {'export': 'excel'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Disposition'].endswith('.xlsx"'))
+        self.assertTrue(b''.join(resp.streaming_content).startswith(b'PK'))
+
+
+class ReportQueryTests(TestCase):
+    """Each report computes its figures in a fixed handful of queries."""
+
+    def setUp(self):
+        from datetime import timedelta
+        from decimal import Decimal
+        from django.utils import timezone
+        from ledger.models import CashBookEntry, Expense
+        from menu.models import FoodItem
+        from transactions.models import Transaction, TransactionLine
+        from .rollups import rebuild_rollups
+
+        caches['reports'].clear()
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client.force_authenticate(user=self.manager)
+        self.now = timezone.now()
+        tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        sales = [('cash', 100), ('cash', 50), ('credit', 70), ('mixed', 30)]
+        for payment_type, amount in sales:
+            tx = Transaction.objects.create(payment_type=payment_type, total_amount=amount, cashier=self.manager)
+            TransactionLine.objects.create(transaction=tx, food_item=tea, portion_type='full', unit_price=amount, quantity=1)
+        Transaction.objects.create(payment_type='cash', total_amount=999, is_canceled=True)
+        Transaction.objects.create(payment_type='cash', total_amount=40, timestamp=self.now - timedelta(days=40))
+        CashBookEntry.objects.create(entry_type='income', amount=Decimal('150'))
+        CashBookEntry.objects.create(entry_type='expense', amount=Decimal('20'))
+        CashBookEntry.objects.create(entry_type='income', amount=Decimal('500'), date=self.now - timedelta(days=40))
+        Expense.objects.create(description='Gas', amount=Decimal('15'), paid_by='cash')
+        # The sales were written straight to the table, bypassing the checkout
+        rebuild_rollups(timezone.localdate() - timedelta(days=41), timezone.localdate())
+
+    def _get(self, name, queries, **params):
+        with self.assertNumQueries(queries):
+            resp = self.client.get(reverse(name), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def test_daily_summary(self):
+        data = self._get('daily-summary', 4)
+        self.assertEqual(data['total_sales'], 250)
+        self.assertEqual(data['transaction_count'], 4)
+        self.assertEqual((data['cash_sales'], data['credit_sales'], data['mixed_sales']), (150, 70, 30))
+        self.assertEqual((data['cashbook_income'], data['cashbook_expense'], data['expenses']), (150, 20, 15))
+        self.assertEqual(data['top_items'][0]['quantity_sold'], 4)
+
+    def test_monthly_summary(self):
+        data = self._get('monthly-summary', 3, year=self.now.year, month=self.now.month)
+        self.assertEqual((data['total_sales'], data['transaction_count'], data['cash_sales']), (250, 4, 150))
+        self.assertEqual(data['daily_breakdown'], [{'date': str(self.now.date()), 'total': 250, 'count': 4}])
+        self.assertEqual(data['net_profit'], 235)
+
+    def test_custom_range(self):
+        today = str(self.now.date())
+        data = self._get('custom-report', 2, date_from=today, date_to=today, payment_type='cash')
+        self.assertEqual((data['total_sales'], data['transaction_count'], data['credit_sales']), (150, 2, 0))
+
+    def test_custom_range_from_rollups(self):
+        today = str(self.now.date())
+        data = self._get('custom-report', 2, date_from='2000-01-01', date_to=today)
+        self.assertEqual((data['total_sales'], data['transaction_count'], data['mixed_sales']), (290, 5, 30))
+        self.assertEqual(data['top_items'], [{'food_item__name': 'Tea', 'quantity_sold': 4, 'revenue': 250}])
+
+    def test_cash_on_hand(self):
+        # The first read checkpoints yesterday; later ones read it plus today's entries
+        self.client.get(reverse('cash-on-hand'))
+        caches['reports'].clear()
+        data = self._get('cash-on-hand', 3)
+        self.assertEqual((data['total_income'], data['today_income'], data['today_expense']), (650, 150, 20))
+        self.assertEqual(data['cash_on_hand'], 615)
+
+
+class SalesRollupTests(TestCase):
+    """The checkout and cancellation keep DailySales and DailyItemSales in step with the sales."""
+
+    def setUp(self):
+        from menu.models import FoodItem
+        caches['reports'].clear()
+        self.cashier = User.objects.create_user(username='till', password='pass', role='cashier')
+        self.tea = FoodItem.objects.create(name='Tea', price_full=20, price_half=12, available_portions=['full', 'half'])
+        self.samosa = FoodItem.objects.create(name='Samosa', price_full=25, available_portions=['full'])
+
+    def _sell(self, payment_type='cash', **quantities):
+        from transactions.services import create_transaction_atomic
+        prices = {'tea': 20, 'samosa': 25}
+        return create_transaction_atomic(
+            cashier=self.cashier, payment_type=payment_type, cash_amount=None,
+            lines_data=[
+                {'food_item': getattr(self, name).pk, 'quantity': qty, 'portion_type': 'full', 'unit_price': prices[name]}
+                for name, qty in quantities.items()
+            ],
+        )
+
+    def _figures(self):
+        from .models import DailySales, DailyItemSales
+        return (
+            sorted(DailySales.objects.values_list('date', 'payment_type', 'total_amount', 'transaction_count')),
+            sorted(DailyItemSales.objects.values_list('date', 'food_item', 'portion_type', 'quantity', 'revenue')),
+        )
+
+    def test_checkout_and_cancel_update_rollups(self):
+        from decimal import Decimal
+        from django.utils import timezone
+        from transactions.services import cancel_transaction_atomic
+
+        self._sell(tea=2, samosa=1)
+        tx = self._sell(tea=1)
+        today = timezone.localdate()
+        days, items = self._figures()
+        self.assertEqual(days, [(today, 'cash', Decimal('85.00'), 2)])
+        self.assertIn((today, self.tea.pk, 'full', 3, Decimal('60.00')), items)
+        self.assertIn((today, self.samosa.pk, 'full', 1, Decimal('25.00')), items)
+
+        cancel_transaction_atomic(tx, self.cashier)
+        days, items = self._figures()
+        self.assertEqual(days, [(today, 'cash', Decimal('65.00'), 1)])
+        self.assertIn((today, self.tea.pk, 'full', 2, Decimal('40.00')), items)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from transactions.services import cancel_transaction_atomic
+
+        self._sell(tea=2, samosa=1)
+        cancel_transaction_atomic(self._sell(samosa=3), self.cashier)
+        self._sell(tea=1)
+        incremental = self._figures()
+
+        today = timezone.localdate().isoformat()
+        call_command('rebuild_sales_rollups', '--from', today, '--to', today, stdout=StringIO())
+        days, items = self._figures()
+        self.assertEqual(days, incremental[0])
+        # A fully canceled item keeps a zero row incrementally but none after a rebuild
+        self.assertEqual(items, [row for row in incremental[1] if row[3]])
+
+    def test_report_queries_do_not_depend_on_sales(self):
+        from rest_framework.test import APIClient
+        manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        client = APIClient()
+        client.force_authenticate(user=manager)
+        for _ in range(5):
+            self._sell(tea=1, samosa=2)
+        with self.assertNumQueries(4):
+            resp = client.get(reverse('daily-summary'))
+        self.assertEqual(resp.data['transaction_count'], 5)
+        self.assertEqual(resp.data['top_items'][0]['quantity_sold'], 10)
+
+
+class ReportCacheTests(TestCase):
+    """Report results are served from the cache until a write touches one of their days."""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        caches['reports'].clear()
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='pass', role='manager')
+        self.client.force_authenticate(user=self.manager)
+        self.today = timezone.localdate()
+        self.past_day = self.today - timedelta(days=10)
+
+    def _get(self, name, **params):
+        resp = self.client.get(reverse(name), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+    def _expense(self, day, amount):
+        from datetime import datetime, time
+        from decimal import Decimal
+        from django.utils import timezone
+        from ledger.models import Expense
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = Expense.objects.create(description='Gas', amount=Decimal(amount))
+            expense.date = timezone.make_aware(datetime.combine(day, time(12)))
+            expense.save()
+
+    def test_repeat_request_is_served_from_cache(self):
+        self.assertEqual(self._get('daily-summary')['X-Report-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            resp = self._get('daily-summary')
+        self.assertEqual(resp['X-Report-Cache'], 'hit')
+        self.assertEqual(self._get('daily-summary', date=str(self.past_day))['X-Report-Cache'], 'miss')
+
+    def test_write_invalidates_only_its_days(self):
+        self._get('daily-summary', date=str(self.past_day))
+        self._get('daily-summary')
+
+        self._expense(self.today, '15')
+        self.assertEqual(self._get('daily-summary', date=str(self.past_day))['X-Report-Cache'], 'hit')
+        resp = self._get('daily-summary')
+        self.assertEqual((resp['X-Report-Cache'], resp.data['expenses']), ('miss', 15))
+
+        self._expense(self.past_day, '7')
+        resp = self._get('daily-summary', date=str(self.past_day))
+        self.assertEqual((resp['X-Report-Cache'], resp.data['expenses']), ('miss', 7))
+
+    def test_past_reports_expire_in_a_local_memory_cache(self):
+        from unittest import mock
+        from django.core.cache.backends.filebased import FileBasedCache
+        from .cache import _past_ttl
+        backend = caches['reports']
+        with mock.patch.object(backend, 'set', wraps=backend.set) as store:
+            self._get('daily-summary', date=str(self.past_day))
+        self.assertEqual(store.call_args.args[2], 300)
+        # A shared backend sees every worker's invalidations: kept until evicted
+        self.assertIsNone(_past_ttl(FileBasedCache('unused', {})))
+
+    def test_moving_a_row_invalidates_both_days(self):
+        from datetime import datetime, time
+        from django.utils import timezone
+        from ledger.models import Expense
+        self._expense(self.past_day, '7')
+        self.assertEqual(self._get('daily-summary', date=str(self.past_day)).data['expenses'], 7)
+
+        expense = Expense.objects.get()
+        expense.date = timezone.make_aware(datetime.combine(self.today, time(9)))
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.save()
+        self.assertEqual(self._get('daily-summary', date=str(self.past_day)).data['expenses'], 0)
+
+    def test_sale_invalidates_reports_and_counts_are_kept(self):
+        from menu.models import FoodItem
+        from transactions.services import create_transaction_atomic
+        tea = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        month = {'year': self.today.year, 'month': self.today.month}
+        self._get('monthly-summary', **month)
+        self._get('monthly-summary', **month)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_transaction_atomic(
+                cashier=self.manager, payment_type='cash',
+                lines_data=[{'food_item': tea.pk, 'quantity': 2, 'portion_type': 'full', 'unit_price': 20}],
+            )
+        resp = self._get('monthly-summary', **month)
+        self.assertEqual((resp['X-Report-Cache'], resp.data['total_sales']), ('miss', 40))
+
+        stats = self._get('report-cache-stats').data
+        self.assertEqual(stats['monthly'], {'hits': 1, 'misses': 2})
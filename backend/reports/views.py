@@ -1,14 +1,21 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
 from rest_framework.response import Response
-from django.http import HttpResponse
-from transactions.models import Transaction, TransactionLine
-from ledger.models import CashBookEntry, Expense
+from transactions.models import Transaction
+from ledger.models import CashBookEntry, DayClose, Expense
 from accounts.models import CreditAccount
 from django.utils import timezone
-from django.db.models import Sum, Count, F
+from django.db.models import Sum
 from datetime import datetime, timedelta
-import csv
+from core import exports
+from core.dates import date_range_q, month_days
+from ledger.services import cash_totals
+from . import cache as report_cache, queries
+from .models import DailySales, DailyItemSales
+
+
+# Reports served through reports.cache
+CACHED_REPORTS = ('daily', 'monthly', 'custom', 'cash_on_hand')
 
 
 class IsManagerOrAdmin(permissions.BasePermission):
@@ -16,6 +23,20 @@ class IsManagerOrAdmin(permissions.BasePermission):
         return request.user and request.user.is_authenticated and request.user.role in ('manager', 'admin')
 
 
+def _report_response(data, hit):
+    response = Response(data)
+    response['X-Report-Cache'] = 'hit' if hit else 'miss'
+    return response
+
+
+class ReportCacheStatsView(APIView):
+    """Hit and miss counts of the report cache, per report."""
+    permission_classes = [IsManagerOrAdmin]
+    
+    def get(self, request):
+        return Response(report_cache.cache_stats(CACHED_REPORTS))
+
+
 class DailySummaryView(APIView):
     permission_classes = [IsManagerOrAdmin]
     
@@ -30,59 +51,56 @@ class DailySummaryView(APIView):
             except ValueError:
                 return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         else:
-            target_date = timezone.now().date()
+            target_date = timezone.localdate()
+        
+        summary_data, hit = daily_summary(target_date)
         
-        txs = Transaction.objects.filter(timestamp__date=target_date, is_canceled=False)
+        # Return Excel if requested
+        if export_format == 'excel':
+            from .excel_utils import generate_daily_summary_excel
+            return generate_daily_summary_excel(str(target_date), summary_data)
         
-        total_sales = txs.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_count = txs.aggregate(count=Count('id'))['count'] or 0
+        return _report_response(summary_data, hit)
+    
+    def summarize(self, target_date):
+        # A closed day's figures were snapshotted when it was closed
+        if target_date < timezone.localdate():
+            day_close = DayClose.objects.filter(date=target_date, reopened_at__isnull=True).first()
+            if day_close is not None:
+                return day_close.summary()
         
-        # Cash vs credit breakdown
-        cash_total = txs.filter(payment_type='cash').aggregate(total=Sum('total_amount'))['total'] or 0
-        credit_total = txs.filter(payment_type='credit').aggregate(total=Sum('total_amount'))['total'] or 0
-        mixed_total = txs.filter(payment_type='mixed').aggregate(total=Sum('total_amount'))['total'] or 0
+        # Sales figures, cash vs credit breakdown included
+        sales = queries.rollup_sales_figures(DailySales.objects.filter(date=target_date))
+        total_sales, total_count = sales['total_sales'], sales['transaction_count']
         
         # Top selling items
-        top_items = TransactionLine.objects.filter(
-            transaction__in=txs
-        ).values('food_item__name').annotate(
-            quantity_sold=Sum('quantity'),
-            revenue=Sum('line_total')
-        ).order_by('-quantity_sold')[:10]
+        top_items = queries.rollup_top_items(DailyItemSales.objects.filter(date=target_date), 10)
         
         # Expenses for the day
-        day_expenses = Expense.objects.filter(date__date=target_date).aggregate(total=Sum('amount'))['total'] or 0
+        day_expenses = queries.expense_total(Expense.objects.filter(date_range_q('date', target_date, target_date)))
         
         # Cashbook balance for the day
-        cashbook_income = CashBookEntry.objects.filter(
-            date__date=target_date, entry_type='income'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        cashbook_expense = CashBookEntry.objects.filter(
-            date__date=target_date, entry_type='expense'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        cashbook = queries.cashbook_figures(
+            CashBookEntry.objects.filter(date_range_q('date', target_date, target_date))
+        )
+        cashbook_income, cashbook_expense = cashbook['income'], cashbook['expense']
         
         summary_data = {
             'date': str(target_date),
             'total_sales': float(total_sales),
             'transaction_count': total_count,
-            'cash_sales': float(cash_total),
-            'credit_sales': float(credit_total),
-            'mixed_sales': float(mixed_total),
-            'top_items': list(top_items),
+            'cash_sales': float(sales['cash_sales']),
+            'credit_sales': float(sales['credit_sales']),
+            'mixed_sales': float(sales['mixed_sales']),
+            'top_items': top_items,
             'expenses': float(day_expenses),
             'cashbook_income': float(cashbook_income),
             'cashbook_expense': float(cashbook_expense),
             'net_cash': float(cashbook_income - cashbook_expense),
-            'avg_transaction': float(total_sales / total_count) if total_count > 0 else 0
+            'avg_transaction': float(total_sales / total_count) if total_count > 0 else 0,
+            'closed': False
         }
-        
-        # Return Excel if requested
-        if export_format == 'excel':
-            from .excel_utils import generate_daily_summary_excel
-            return generate_daily_summary_excel(str(target_date), summary_data)
-        
-        return Response(summary_data)
+        return summary_data
 
 
 class MonthlySummaryView(APIView):
@@ -92,66 +110,55 @@ class MonthlySummaryView(APIView):
         # Check if export requested
         export_format = request.query_params.get('export')
         
-        year = int(request.query_params.get('year', timezone.now().year))
-        month = int(request.query_params.get('month', timezone.now().month))
+        today = timezone.localdate()
+        year = int(request.query_params.get('year', today.year))
+        month = int(request.query_params.get('month', today.month))
+        if not (1 <= month <= 12 and 1 <= year <= 9999):
+            return Response({'error': 'Invalid year or month'}, status=status.HTTP_400_BAD_REQUEST)
         
-        txs = Transaction.objects.filter(
-            timestamp__year=year,
-            timestamp__month=month,
-            is_canceled=False
-        )
+        summary_data, hit = monthly_summary(year, month)
         
-        total_sales = txs.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_count = txs.aggregate(count=Count('id'))['count'] or 0
+        # Return Excel if requested
+        if export_format == 'excel':
+            from .excel_utils import generate_monthly_summary_excel
+            return generate_monthly_summary_excel(year, month, summary_data)
         
-        # Breakdown by payment type
-        cash_total = txs.filter(payment_type='cash').aggregate(total=Sum('total_amount'))['total'] or 0
-        credit_total = txs.filter(payment_type='credit').aggregate(total=Sum('total_amount'))['total'] or 0
-        mixed_total = txs.filter(payment_type='mixed').aggregate(total=Sum('total_amount'))['total'] or 0
+        return _report_response(summary_data, hit)
+    
+    def summarize(self, year, month, month_start, month_end):
+        # Daily breakdown; the month's figures are added up from it
+        daily_sales, sales = queries.rollup_daily_sales_figures(
+            DailySales.objects.filter(date__range=(month_start, month_end))
+        )
+        total_sales = sales['total_sales']
         
         # Top selling items for month
-        top_items = TransactionLine.objects.filter(
-            transaction__in=txs
-        ).values('food_item__name').annotate(
-            quantity_sold=Sum('quantity'),
-            revenue=Sum('line_total')
-        ).order_by('-quantity_sold')[:10]
-        
-        # Daily breakdown
-        daily_sales = txs.values('timestamp__date').annotate(
-            total=Sum('total_amount'),
-            count=Count('id')
-        ).order_by('timestamp__date')
+        top_items = queries.rollup_top_items(
+            DailyItemSales.objects.filter(date__range=(month_start, month_end)), 10
+        )
         
         # Expenses for the month
-        month_expenses = Expense.objects.filter(
-            date__year=year,
-            date__month=month
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        month_expenses = queries.expense_total(
+            Expense.objects.filter(date_range_q('date', month_start, month_end))
+        )
         
         summary_data = {
             'year': year,
             'month': month,
             'total_sales': float(total_sales),
-            'transaction_count': total_count,
-            'cash_sales': float(cash_total),
-            'credit_sales': float(credit_total),
-            'mixed_sales': float(mixed_total),
-            'top_items': list(top_items),
+            'transaction_count': sales['transaction_count'],
+            'cash_sales': float(sales['cash_sales']),
+            'credit_sales': float(sales['credit_sales']),
+            'mixed_sales': float(sales['mixed_sales']),
+            'top_items': top_items,
             'daily_breakdown': [
-                {'date': str(d['timestamp__date']), 'total': float(d['total']), 'count': d['count']}
+                {'date': str(d['day']), 'total': float(d['total_sales']), 'count': d['transaction_count']}
                 for d in daily_sales
             ],
             'total_expenses': float(month_expenses),
             'net_profit': float(total_sales - month_expenses)
         }
-        
-        # Return Excel if requested
-        if export_format == 'excel':
-            from .excel_utils import generate_monthly_summary_excel
-            return generate_monthly_summary_excel(year, month, summary_data)
-        
-        return Response(summary_data)
+        return summary_data
 
 
 class CustomRangeReportView(APIView):
@@ -173,45 +180,45 @@ class CustomRangeReportView(APIView):
         except ValueError:
             return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         
-        txs = Transaction.objects.filter(
-            timestamp__date__gte=from_date,
-            timestamp__date__lte=to_date,
-            is_canceled=False
-        )
-        
-        if cashier:
-            txs = txs.filter(cashier__id=cashier)
-        
-        if payment_type:
-            txs = txs.filter(payment_type=payment_type)
-        
-        if food_item:
-            txs = txs.filter(lines__food_item__id=food_item).distinct()
-        
-        total_sales = txs.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_count = txs.aggregate(count=Count('id'))['count'] or 0
-        
-        cash_total = txs.filter(payment_type='cash').aggregate(total=Sum('total_amount'))['total'] or 0
-        credit_total = txs.filter(payment_type='credit').aggregate(total=Sum('total_amount'))['total'] or 0
-        mixed_total = txs.filter(payment_type='mixed').aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        top_items = TransactionLine.objects.filter(
-            transaction__in=txs
-        ).values('food_item__name').annotate(
-            quantity_sold=Sum('quantity'),
-            revenue=Sum('line_total')
-        ).order_by('-quantity_sold')[:15]
+        data, hit = custom_report(from_date, to_date, food_item, cashier, payment_type)
+        return _report_response(data, hit)
+    
+    def summarize(self, from_date, to_date, food_item, cashier, payment_type):
+        if cashier or payment_type or food_item:
+            # The rollups are per day and payment type only; filtered reports
+            # read the transactions
+            txs = Transaction.objects.filter(
+                date_range_q('timestamp', from_date, to_date),
+                is_canceled=False
+            )
+            
+            if cashier:
+                txs = txs.filter(cashier__id=cashier)
+            
+            if payment_type:
+                txs = txs.filter(payment_type=payment_type)
+            
+            if food_item:
+                txs = txs.filter(lines__food_item__id=food_item).distinct()
+            
+            sales = queries.sales_figures(txs)
+            top_items = queries.top_items(txs, 15)
+        else:
+            sales = queries.rollup_sales_figures(DailySales.objects.filter(date__range=(from_date, to_date)))
+            top_items = queries.rollup_top_items(
+                DailyItemSales.objects.filter(date__range=(from_date, to_date)), 15
+            )
         
-        return Response({
+        return {
             'date_from': str(from_date),
             'date_to': str(to_date),
-            'total_sales': float(total_sales),
-            'transaction_count': total_count,
-            'cash_sales': float(cash_total),
-            'credit_sales': float(credit_total),
-            'mixed_sales': float(mixed_total),
-            'top_items': list(top_items)
-        })
+            'total_sales': float(sales['total_sales']),
+            'transaction_count': sales['transaction_count'],
+            'cash_sales': float(sales['cash_sales']),
+            'credit_sales': float(sales['credit_sales']),
+            'mixed_sales': float(sales['mixed_sales']),
+            'top_items': top_items
+        }
 
 
 class OutstandingCreditView(APIView):
@@ -252,45 +259,33 @@ class CashOnHandView(APIView):
     permission_classes = [IsManagerOrAdmin]
     
     def get(self, request):
-        total_income = CashBookEntry.objects.filter(
-            entry_type='income'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        total_expense = CashBookEntry.objects.filter(
-            entry_type='expense'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        today = timezone.localdate()
+        data, hit = report_cache.cached_report('cash_on_hand', {'today': str(today)}, None, self.summarize)
+        return _report_response(data, hit)
+    
+    def summarize(self):
+        # Latest checkpoint plus the entries dated after it, today's included
+        cash = cash_totals()
+        total_income, total_expense = cash['income'], cash['expense']
+        today_income, today_expense = cash['today_income'], cash['today_expense']
         
         # Also add direct expenses
-        direct_expenses = Expense.objects.filter(
-            paid_by='cash'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        direct_expenses = cash['cash_expenses']
         
         cash_on_hand = float(total_income) - float(total_expense) - float(direct_expenses)
         
-        # Today's movement
-        today = timezone.now().date()
-        today_income = CashBookEntry.objects.filter(
-            date__date=today,
-            entry_type='income'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        today_expense = CashBookEntry.objects.filter(
-            date__date=today,
-            entry_type='expense'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        return Response({
+        return {
             'cash_on_hand': cash_on_hand,
             'total_income': float(total_income),
             'total_expense': float(total_expense),
             'direct_expenses': float(direct_expenses),
             'today_income': float(today_income),
             'today_expense': float(today_expense)
-        })
+        }
 
 
 class ExportAccountStatementView(APIView):
-    """Export account statement as CSV."""
+    """Export account statement as CSV, streamed (?compress=gzip for a .csv.gz)."""
     permission_classes = [IsManagerOrAdmin]
     
     def get(self, request, account_id):
@@ -299,43 +294,57 @@ class ExportAccountStatementView(APIView):
         except CreditAccount.DoesNotExist:
             return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="statement_{account_id}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Account Statement'])
-        writer.writerow(['Account ID', account.account_id])
-        writer.writerow(['Name', account.name])
-        writer.writerow(['Type', account.account_type])
-        writer.writerow(['Current Balance', str(account.balance)])
-        writer.writerow([])
-        writer.writerow(['Date', 'Type', 'Amount', 'Description'])
-        
-        # Get transactions
-        transactions = Transaction.objects.filter(
-            payment_reference__icontains=account.account_id
-        ).order_by('-timestamp')[:100]
-        
-        for tx in transactions:
-            writer.writerow([
-                tx.timestamp.strftime('%Y-%m-%d %H:%M'),
-                'Charge',
-                str(tx.total_amount),
-                f'Transaction #{tx.id}'
-            ])
-        
-        # Get payments
-        payments = CashBookEntry.objects.filter(
-            description__icontains=account.account_id
-        ).order_by('-date')[:100]
-        
-        for p in payments:
-            if 'payment' in p.description.lower():
-                writer.writerow([
-                    p.date.strftime('%Y-%m-%d %H:%M'),
-                    'Payment',
-                    str(p.amount),
-                    p.description
-                ])
-        
-        return response
+        return account_statement_csv(account, gzip=exports.wants_gzip(request))
+
+
+def daily_summary(target_date):
+    """(summary, cache hit) of one local day."""
+    return report_cache.cached_report(
+        'daily', {'date': str(target_date)}, [target_date], lambda: DailySummaryView().summarize(target_date)
+    )
+
+
+def monthly_summary(year, month):
+    """(summary, cache hit) of one month."""
+    month_start, month_end = month_days(year, month)
+    return report_cache.cached_report(
+        'monthly', {'year': year, 'month': month}, report_cache.days_between(month_start, month_end),
+        lambda: MonthlySummaryView().summarize(year, month, month_start, month_end)
+    )
+
+
+def custom_report(from_date, to_date, food_item=None, cashier=None, payment_type=None):
+    """(report, cache hit) of local days from_date..to_date, optionally filtered."""
+    params = {
+        'date_from': str(from_date), 'date_to': str(to_date),
+        'food_item': food_item, 'cashier': cashier, 'payment_type': payment_type,
+    }
+    return report_cache.cached_report(
+        'custom', params, report_cache.days_between(from_date, to_date),
+        lambda: CustomRangeReportView().summarize(from_date, to_date, food_item, cashier, payment_type)
+    )
+
+
+def account_statement_csv(account, gzip=False):
+    """Streamed CSV statement of a credit account, newest entries first."""
+    # Straight down the (account, created_at) index
+    entries = account.ledger_entries.order_by('-created_at', '-id')
+
+    def rows():
+        yield ['Account Statement']
+        yield ['Account ID', account.account_id]
+        yield ['Name', account.name]
+        yield ['Type', account.account_type]
+        yield ['Current Balance', str(account.balance)]
+        yield []
+        yield ['Date', 'Type', 'Amount', 'Balance', 'Description']
+        for entry in exports.iterate(entries):
+            yield [
+                timezone.localtime(entry.created_at).strftime('%Y-%m-%d %H:%M'),
+                entry.get_kind_display(),
+                str(entry.amount),
+                str(entry.balance_after),
+                entry.description
+            ]
+
+    return exports.stream_csv(f'statement_{account.account_id}.csv', rows(), gzip=gzip)
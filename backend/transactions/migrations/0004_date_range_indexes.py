@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_alter_transaction_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp', 'is_canceled'], name='tx_timestamp_canceled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashier', 'timestamp'], name='tx_cashier_timestamp_idx'),
+        ),
+    ]
@@ -1,12 +1,15 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from menu.models import FoodItem
+from ledger.periods import PeriodLocked
 
 
-class Transaction(models.Model):
+class Transaction(PeriodLocked, models.Model):
     PAYMENT_CHOICES = (('cash', 'Cash'), ('credit', 'Credit'), ('mixed', 'Mixed'))
 
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Offline sales keep the till's clock
     cashier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='transactions')
     payment_type = models.CharField(max_length=20, choices=PAYMENT_CHOICES)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -16,6 +19,14 @@ class Transaction(models.Model):
     notes = models.TextField(blank=True)
     is_canceled = models.BooleanField(default=False)
 
+    report_date_field = 'timestamp'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'is_canceled'], name='tx_timestamp_canceled_idx'),
+            models.Index(fields=['cashier', 'timestamp'], name='tx_cashier_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"TX {self.id} - {self.total_amount} by {self.cashier}"
 
@@ -43,3 +54,21 @@ class Receipt(models.Model):
 
     def __str__(self):
         return f"{self.token}"
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a POST sent with an Idempotency-Key header, kept until expires_at."""
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the request body")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        # Keys are chosen by clients: each user has their own key space
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_per_user')]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
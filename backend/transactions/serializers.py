@@ -1,14 +1,37 @@
 from rest_framework import serializers
 from .models import Transaction, TransactionLine
-from menu.models import FoodItem
+from menu.pricing import get_price_table
+
+
+class PricedFoodItemField(serializers.Field):
+    """FoodItem primary key checked against the in-process price table instead of the database."""
+
+    default_error_messages = {
+        'invalid': 'Incorrect type. Expected pk value.',
+        'does_not_exist': 'Invalid pk "{pk_value}" - object does not exist.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+        if pk not in get_price_table():
+            self.fail('does_not_exist', pk_value=data)
+        return pk
+
+    def to_representation(self, value):
+        return value.pk
 
 
 class TransactionLineSerializer(serializers.ModelSerializer):
+    food_item = PricedFoodItemField()
     food_item_name = serializers.ReadOnlyField(source='food_item.name')
     class Meta:
         model = TransactionLine
         fields = ('id', 'food_item', 'food_item_name', 'portion_type', 'unit_price', 'quantity', 'line_total')
-        read_only_fields = ('id', 'line_total')
+        # Prices come from the menu, never from the client
+        read_only_fields = ('id', 'unit_price', 'line_total')
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -23,11 +46,17 @@ class TransactionSerializer(serializers.ModelSerializer):
         lines = data.get('lines', [])
         if not lines:
             raise serializers.ValidationError('Transaction must include at least one line')
-        # Validate that portion types are allowed on the food item
+        # Validate portions and price every line from the price table (no queries)
+        table = get_price_table()
         for l in lines:
-            fi = FoodItem.objects.get(pk=l['food_item'].id if isinstance(l['food_item'], FoodItem) else l['food_item'])
-            if l['portion_type'] not in fi.available_portions:
+            fi = table.get(l['food_item'])
+            if l['portion_type'] not in fi.portions:
                 raise serializers.ValidationError(f"Portion {l['portion_type']} not available for {fi.name}")
+            unit_price = table.price(l['food_item'], l['portion_type'])
+            if unit_price is None:
+                raise serializers.ValidationError(f"No {l['portion_type']} price set for {fi.name}")
+            l['unit_price'] = unit_price
+            l['line_total'] = unit_price * l.get('quantity', 1)
         return data
 
     def create(self, validated_data):
@@ -35,7 +64,7 @@ class TransactionSerializer(serializers.ModelSerializer):
         tx = Transaction.objects.create(**validated_data)
         total = 0
         for l in lines_data:
-            line = TransactionLine.objects.create(transaction=tx, **l)
+            line = TransactionLine.objects.create(transaction=tx, food_item_id=l.pop('food_item'), **l)
             total += line.line_total
         tx.total_amount = total + tx.tax - tx.discount
         tx.save()
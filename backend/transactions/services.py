@@ -1,11 +1,17 @@
-from django.db import transaction
-from .models import Transaction, TransactionLine, Receipt
+from django.db import transaction, IntegrityError
+from django.conf import settings
+from .models import Transaction, TransactionLine, Receipt, IdempotencyKey
+from accounts.credit_ledger import post_entry
+from accounts.limits import charge_sale, refund_sale
 from accounts.models import CreditAccount
 from ledger.models import CashBookEntry
 from audit.models import AuditLog
 from core.models import Organization
 from django.utils import timezone
 from decimal import Decimal
+from datetime import timedelta
+import hashlib
+import json
 
 
 def _generate_token(tx: Transaction) -> str:
@@ -14,10 +20,12 @@ def _generate_token(tx: Transaction) -> str:
     return f"EECOHM-{year}-{tx.id:06d}"
 
 
-def _generate_receipt_payload(tx: Transaction, cashier, linked_account=None, cash_amount=None, credit_amount=None):
+def _generate_receipt_payload(tx: Transaction, cashier, linked_account=None, cash_amount=None, credit_amount=None, lines=None, org=None):
     """Generate immutable receipt payload."""
+    if lines is None:
+        lines = tx.lines.select_related('food_item')
     items = []
-    for line in tx.lines.all():
+    for line in lines:
         items.append({
             'name': line.food_item.name,
             'portion': line.portion_type,
@@ -45,7 +53,7 @@ def _generate_receipt_payload(tx: Transaction, cashier, linked_account=None, cas
             'type': linked_account.account_type
         }
 
-    org = Organization.get_instance()
+    org = org or Organization.get_instance()
     payload = {
         'institution': {'name': org.name, 'address': org.address},
         'transaction_id': tx.id,
@@ -70,73 +78,90 @@ def _generate_receipt_payload(tx: Transaction, cashier, linked_account=None, cas
 
 def create_transaction_atomic(cashier, payment_type, lines_data, tax=0, discount=0, 
                                linked_account_id=None, cash_amount=None, credit_amount=None,
-                               payment_reference=None, notes=''):
+                               payment_reference=None, notes='', timestamp=None):
     """
     Create a transaction atomically with all related updates.
     This ensures balance updates, cashbook entries, and receipt creation all succeed or fail together.
+
+    The checkout is set-based: the basket is read with one query per table, its
+    stock taken with one conditional UPDATE per stock row (never per line) and
+    the rest written with bulk inserts, so the number of round trips per sale
+    does not grow with the number of lines.
+    timestamp backdates a sale recorded offline; it defaults to now.
     """
+    from inventory.services import (
+        StockLockManager, _food_item_id, load_basket_stock, take_basket_stock, commit_basket_stock
+    )
+
     with transaction.atomic():
-        # CRITICAL: Validate stock availability BEFORE creating transaction
-        from menu.models import FoodItem
-        
-        for l in lines_data:
-            # Handle serializer providing instance vs raw ID
-            fi_input = l['food_item']
-            fi_id = fi_input.id if hasattr(fi_input, 'id') else fi_input
-
-            # Use select_for_update to lock the row and prevent race conditions
-            food_item = FoodItem.objects.select_for_update().get(id=fi_id)
-            quantity = int(l['quantity'])
-            
-            # Check pre-made stock
-            if food_item.stock_quantity is not None:
-                if food_item.stock_quantity < quantity:
-                    raise ValueError(
-                        f"Insufficient stock for {food_item.name}. "
-                        f"Available: {food_item.stock_quantity}, Requested: {quantity}"
-                    )
-            else:
-                # Check recipe ingredients for made-to-order items
-                max_available = food_item.calculate_max_available()
-                if max_available < quantity:
-                    raise ValueError(
-                        f"Cannot make {quantity} {food_item.name}. "
-                        f"Only {max_available} can be made with current ingredients."
-                    )
-        
-        # Create the transaction
-        tx = Transaction.objects.create(
-            cashier=cashier,
-            payment_type=payment_type,
-            tax=tax,
-            discount=discount,
-            payment_reference=(payment_reference or ''),
-            notes=(notes or ''),
-            total_amount=0
-        )
-        
-        # Create line items and calculate total
+        basket = [(_food_item_id(l['food_item']), int(l.get('quantity', 1))) for l in lines_data]
+
+        # CRITICAL: Take stock BEFORE creating the transaction. Every row lock goes
+        # through one manager so they follow the global lock order.
+        locks = StockLockManager()
+        stock = load_basket_stock([fid for fid, _ in basket])
+        consumption = take_basket_stock(basket, stock, locks)
+        food_items = stock[0]
+
+        # Build line items and calculate total in memory
+        lines = []
         total = Decimal('0.00')
-        from inventory.services import deduct_stock_for_transaction
-        for l in lines_data:
-            line = TransactionLine.objects.create(transaction=tx, **l)
-            total += Decimal(str(line.line_total))
-            # New: Deduct stock based on recipe
-            deduct_stock_for_transaction(line)
-        
-        tx.total_amount = total + Decimal(str(tx.tax)) - Decimal(str(tx.discount))
-        tx.save()
+        for l, (fid, quantity) in zip(lines_data, basket):
+            unit_price = Decimal(str(l['unit_price']))
+            line = TransactionLine(
+                food_item=food_items[fid],
+                portion_type=l['portion_type'],
+                unit_price=unit_price,
+                quantity=quantity,
+                line_total=unit_price * quantity
+            )
+            lines.append(line)
+            total += line.line_total
+        total_amount = total + Decimal(str(tax)) - Decimal(str(discount))
 
         # Calculate payment splits
         if payment_type == 'cash':
-            paid_amount = Decimal(str(tx.total_amount))
+            paid_amount = total_amount
             credit_amt = Decimal('0.00')
         elif payment_type == 'credit':
             paid_amount = Decimal('0.00')
-            credit_amt = Decimal(str(tx.total_amount))
+            credit_amt = total_amount
         else:  # mixed
             paid_amount = Decimal(str(cash_amount or 0.0))
-            credit_amt = Decimal(str(credit_amount if credit_amount is not None else (float(tx.total_amount) - float(paid_amount))))
+            credit_amt = Decimal(str(credit_amount if credit_amount is not None else (float(total_amount) - float(paid_amount))))
+
+        timestamp = timestamp or timezone.now()
+        org = Organization.get_instance()
+
+        charge_account = credit_amt > 0 and linked_account_id
+        if charge_account:
+            # Store reference for tracking
+            payment_reference = f"Credit: {linked_account_id}"
+
+        # Create the transaction (written once, with its final total)
+        tx = Transaction.objects.create(
+            cashier=cashier,
+            payment_type=payment_type,
+            tax=tax,
+            discount=discount,
+            payment_reference=(payment_reference or ''),
+            notes=(notes or ''),
+            total_amount=total_amount,
+            timestamp=timestamp
+        )
+        for line in lines:
+            line.transaction = tx
+        TransactionLine.objects.bulk_create(lines)
+
+        # Record the stock movements for the recipe / pre-made deductions
+        commit_basket_stock(stock, consumption, f'TX #{tx.id}', cashier, locks)
+
+        # The credit account ranks after the stock and availability rows in the
+        # lock order; hold the sale to its limits against the day's spend row
+        linked_account = None
+        if charge_account:
+            linked_account = locks.lock_one(CreditAccount, account_id=linked_account_id)
+            charge_sale(linked_account, credit_amt, timezone.localdate(timestamp), org.settings)
 
         # Handle cash portion - add to cashbook
         if paid_amount > 0:
@@ -145,27 +170,25 @@ def create_transaction_atomic(cashier, payment_type, lines_data, tax=0, discount
                 amount=paid_amount,
                 description=f'Transaction {tx.id} (cash portion)',
                 related_transaction=tx,
-                created_by=cashier
+                created_by=cashier,
+                date=tx.timestamp
             )
 
         # Handle credit portion - update account balance
-        linked_account = None
-        if credit_amt > 0 and linked_account_id:
-            acct = CreditAccount.objects.select_for_update().get(account_id=linked_account_id)
-            acct.balance = acct.balance + Decimal(str(credit_amt))
-            acct.save()
-            linked_account = acct
-            
-            # Store reference for tracking
-            tx.payment_reference = f"Credit: {acct.account_id}"
-            tx.save()
+        if linked_account:
+            linked_account.balance = linked_account.balance + credit_amt
+            linked_account.save(update_fields=['balance', 'updated_at'])
+            post_entry(linked_account, 'charge', credit_amt, transaction=tx,
+                       description=f'TX #{tx.id}', user=cashier)
 
         # Generate and persist receipt (immutable)
         payload = _generate_receipt_payload(
             tx, cashier, 
             linked_account=linked_account, 
             cash_amount=float(paid_amount), 
-            credit_amount=float(credit_amt)
+            credit_amount=float(credit_amt),
+            lines=lines,
+            org=org
         )
         token = _generate_token(tx)
         Receipt.objects.create(transaction=tx, token=token, payload=payload)
@@ -183,17 +206,38 @@ def create_transaction_atomic(cashier, payment_type, lines_data, tax=0, discount
             }
         )
 
+        # Sales rollups last: their per-day rows are shared by every till
+        from reports.rollups import record_sale
+        record_sale(tx, lines, locks)
+
         return tx
 
 
+def _legacy_credit_charge(tx):
+    """({account lookup}, credit amount) of a sale charged without a ledger entry."""
+    from accounts.credit_ledger import CREDIT_REFERENCE_PREFIX
+    if tx.payment_type not in ('credit', 'mixed') or not tx.payment_reference.startswith(CREDIT_REFERENCE_PREFIX):
+        return {}, Decimal('0')
+    account_id = tx.payment_reference[len(CREDIT_REFERENCE_PREFIX):].strip()
+    if tx.payment_type == 'credit':
+        return {'account_id': account_id}, tx.total_amount
+    # For mixed, the credit portion is on the receipt
+    receipt = getattr(tx, 'receipt', None)
+    credit = (receipt.payload if receipt else {}).get('payment', {}).get('credit_amount', 0)
+    return {'account_id': account_id}, Decimal(str(credit))
+
+
 def cancel_transaction_atomic(tx: Transaction, user):
     """
     Cancel a transaction and reverse all related balance updates.
     Uses atomic transaction to ensure data integrity.
     """
+    from ledger.periods import ensure_open
+
     with transaction.atomic():
         if tx.is_canceled:
             return tx
+        ensure_open(tx.timestamp)
         
         old_data = {
             'id': tx.id,
@@ -213,36 +257,35 @@ def cancel_transaction_atomic(tx: Transaction, user):
                 created_by=user
             )
         
-        # Reverse credit account balance if applicable
-        if tx.payment_type in ['credit', 'mixed'] and tx.payment_reference:
-            # Try to find and update the linked account
-            account_id = tx.payment_reference.replace('Credit: ', '').strip()
+        # Reverse stock deduction first: stock rows precede credit accounts in the global lock order
+        from inventory.services import StockLockManager, reverse_stock_deduction
+        locks = StockLockManager()
+        reverse_stock_deduction(tx, locks)
+
+        # Reverse the credit charged to an account, as its ledger recorded it
+        charge = tx.credit_entries.filter(kind='charge').first()
+        if charge is not None:
+            account_lookup, credit_amt = {'pk': charge.account_id}, charge.amount
+        else:
+            # A sale from before the ledger was backfilled: go by its reference
+            account_lookup, credit_amt = _legacy_credit_charge(tx)
+        if credit_amt > 0:
             try:
-                if tx.payment_type == 'credit':
-                    credit_amt = tx.total_amount
-                else:
-                    # For mixed, we need to figure out the credit portion
-                    # Use the receipt payload if available
-                    credit_amt = Decimal('0')
-                    if hasattr(tx, 'receipt'):
-                        credit_amt = Decimal(str(tx.receipt.payload.get('payment', {}).get('credit_amount', 0)))
-                
-                if credit_amt > 0:
-                    acct = CreditAccount.objects.select_for_update().get(account_id=account_id)
-                    acct.balance = acct.balance - credit_amt
-                    acct.save()
+                acct = locks.lock_one(CreditAccount, **account_lookup)
             except CreditAccount.DoesNotExist:
-                pass  # Account might have been deleted
-        
+                acct = None  # Account might have been deleted
+            if acct is not None:
+                acct.balance = acct.balance - credit_amt
+                acct.save()
+                refund_sale(acct, credit_amt, timezone.localdate(tx.timestamp))
+                post_entry(acct, 'reversal', -credit_amt, transaction=tx,
+                           description=f'TX #{tx.id} canceled', user=user)
+
         # Mark as canceled
         tx.is_canceled = True
         tx.notes = f"{tx.notes}\n[CANCELED by {user.username} at {timezone.now().isoformat()}]"
         tx.save()
         
-        # New: Reverse stock deduction
-        from inventory.services import reverse_stock_deduction
-        reverse_stock_deduction(tx)
-        
         # Audit log
         AuditLog.objects.create(
             who=user,
@@ -252,4 +295,69 @@ def cancel_transaction_atomic(tx: Transaction, user):
             new_data={'is_canceled': True}
         )
         
+        from reports.rollups import record_sale
+        record_sale(tx, tx.lines.all(), locks, sign=-1)
+        
         return tx
+
+
+def request_fingerprint(data):
+    """
+    Stable hash of a sale body, used to detect an Idempotency-Key reused for another request.
+    client_id and timestamp are ignored so an offline replay matches its original online attempt.
+    """
+    data = {k: v for k, v in data.items() if k not in ('client_id', 'timestamp')}
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _stored_response(key, user, fingerprint):
+    """
+    Return (status_code, body) stored for a live key, or None if the key is unused.
+    Expired keys are deleted so the request runs again.
+    """
+    try:
+        record = IdempotencyKey.objects.get(key=key, user=user)
+    except IdempotencyKey.DoesNotExist:
+        return None
+
+    if record.expires_at <= timezone.now():
+        record.delete()
+        return None
+    if record.fingerprint != fingerprint:
+        return 422, {'error': 'Idempotency-Key was already used for a different request'}
+    return record.status_code, record.response_body
+
+
+def run_idempotent(key, user, fingerprint, create):
+    """
+    Run create() at most once per Idempotency-Key of user and return (status_code, body, replayed).
+    create() must return (status_code, body) and is executed in the same database
+    transaction that claims the key, so a failed request leaves the key unused.
+    A concurrent duplicate blocks on the key's unique index until the first request
+    commits, then replays its stored response instead of racing it.
+    """
+    stored = _stored_response(key, user, fingerprint)
+    if stored is not None:
+        return stored + (True,)
+
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                key=key,
+                user=user,
+                fingerprint=fingerprint,
+                expires_at=timezone.now() + ttl
+            )
+            status_code, body = create()
+            record.status_code = status_code
+            record.response_body = body
+            record.save(update_fields=['status_code', 'response_body'])
+    except IntegrityError:
+        # Another request with this key committed first
+        stored = _stored_response(key, user, fingerprint)
+        if stored is None:
+            raise
+        return stored + (True,)
+    return status_code, body, False
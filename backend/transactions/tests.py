@@ -72,3 +72,308 @@ class TransactionServiceTests(TestCase):
         # Check NO cashbook entry
         entry = CashBookEntry.objects.filter(related_transaction=tx).first()
         self.assertIsNone(entry)
+
+
+class CheckoutQueryCountTests(TestCase):
+    """
+    The checkout's query count depends on the stock rows it touches (one
+    conditional UPDATE each), never on the number of lines in the basket.
+    """
+
+    def setUp(self):
+        from inventory.models import Ingredient, Recipe, RecipeIngredient
+        from core.models import Organization
+        Organization.get_instance()
+        self.cashier = User.objects.create_user(username='cashier', password='password', role='cashier')
+        self.flour = Ingredient.objects.create(name='Flour', unit='g', current_quantity=100000)
+        self.oil = Ingredient.objects.create(name='Oil', unit='ml', current_quantity=100000)
+        self.items = []
+        for i in range(6):
+            item = FoodItem.objects.create(name=f'Item {i}', price_full=50, available_portions=['full'])
+            recipe = Recipe.objects.create(food_item=item)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.flour, quantity=100)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.oil, quantity=10)
+            self.items.append(item)
+        self.samosa = FoodItem.objects.create(name='Samosa', price_full=20, available_portions=['full'], stock_quantity=50)
+
+    def _lines(self, items):
+        return [{
+            'food_item': item.id,
+            'portion_type': 'full',
+            'unit_price': Decimal('50.00'),
+            'quantity': 2,
+        } for item in items]
+
+    def _count(self, items):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            create_transaction_atomic(cashier=self.cashier, payment_type='cash', lines_data=self._lines(items))
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_fixed(self):
+        # savepoint, item + recipe reads, 1 pre-made + 2 ingredient UPDATEs, tx, lines,
+        # movements, low-stock read, availability read + upsert, cashbook, org,
+        # receipt, audit, 2 sales rollup upserts, release
+        with self.assertNumQueries(19):
+            create_transaction_atomic(
+                cashier=self.cashier,
+                payment_type='cash',
+                lines_data=self._lines(self.items[:1] + [self.samosa])
+            )
+
+    def test_query_count_independent_of_basket_size(self):
+        small = self._count(self.items[:1] + [self.samosa])
+        large = self._count(self.items + [self.samosa])
+        self.assertEqual(small, large)
+
+    def test_basket_validated_as_a_whole(self):
+        # Two lines of the same pre-made item must not oversell it together
+        lines = self._lines([self.samosa]) * 2
+        lines[0]['quantity'] = lines[1]['quantity'] = 30
+        with self.assertRaises(ValueError):
+            create_transaction_atomic(cashier=self.cashier, payment_type='cash', lines_data=lines)
+        self.samosa.refresh_from_db()
+        self.assertEqual(self.samosa.stock_quantity, 50)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.cashier = User.objects.create_user(username='cashier', password='password', role='cashier')
+        self.client.force_authenticate(user=self.cashier)
+        self.item = FoodItem.objects.create(name='Test Item', price_full=100, available_portions=['full'])
+        self.student = CreditAccount.objects.create(account_id='S100', name='Test Student', account_type='student')
+        self.payload = {
+            'payment_type': 'credit',
+            'linked_account': 'S100',
+            'lines': [{'food_item': self.item.id, 'portion_type': 'full', 'unit_price': '100.00', 'quantity': 1}],
+        }
+
+    def _post(self, key, payload=None):
+        return self.client.post('/api/transactions/', payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self._post('sale-1')
+        second = self._post('sale-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.balance, Decimal('100.00'))
+
+    def test_key_reused_for_different_request(self):
+        self._post('sale-1')
+        other = dict(self.payload, payment_type='cash', linked_account=None)
+        resp = self._post('sale-1', other)
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_expired_key_runs_again(self):
+        from django.utils import timezone
+        from transactions.models import IdempotencyKey
+        self._post('sale-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        resp = self._post('sale-1')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_keys_are_scoped_per_user(self):
+        other = User.objects.create_user(username='cashier2', password='password', role='cashier')
+        self._post('sale-1')
+        self.client.force_authenticate(user=other)
+        resp = self._post('sale-1')
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', resp)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class BulkSyncTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.cashier = User.objects.create_user(username='cashier', password='password', role='cashier')
+        self.client.force_authenticate(user=self.cashier)
+        self.samosa = FoodItem.objects.create(name='Samosa', price_full=20, available_portions=['full'], stock_quantity=1)
+
+    def _sale(self, client_id, timestamp):
+        return {
+            'client_id': client_id,
+            'timestamp': timestamp,
+            'payment_type': 'cash',
+            'lines': [{'food_item': self.samosa.id, 'portion_type': 'full', 'unit_price': '20.00', 'quantity': 1}],
+        }
+
+    def _sync(self, sales, device='till-1'):
+        return self.client.post('/api/transactions/bulk/', {'device': device, 'sales': sales}, format='json')
+
+    def test_sales_replayed_in_timestamp_order(self):
+        resp = self._sync([
+            self._sale('till1-2', '2026-01-05T12:30:00+05:45'),
+            self._sale('till1-1', '2026-01-05T12:00:00+05:45'),
+        ])
+        self.assertEqual(resp.status_code, 200)
+        later, earlier = resp.data['results']
+        self.assertEqual(earlier['status'], 'created')
+        self.assertEqual(later['status'], 'rejected')
+
+        tx = Transaction.objects.get(pk=earlier['transaction_id'])
+        self.assertEqual(tx.timestamp.isoformat(), '2026-01-05T06:15:00+00:00')
+        self.assertEqual(CashBookEntry.objects.get(related_transaction=tx).date, tx.timestamp)
+
+    def test_each_sale_commits_on_its_own(self):
+        from unittest import mock
+        from transactions.services import create_transaction_atomic
+        calls = []
+
+        def flaky(**kwargs):
+            calls.append(kwargs['timestamp'])
+            if len(calls) == 2:
+                raise RuntimeError('deadlock detected')
+            return create_transaction_atomic(**kwargs)
+
+        self.samosa.stock_quantity = 5
+        self.samosa.save()
+        sales = [self._sale(f'till1-{n}', f'2026-01-05T12:0{n}:00+05:45') for n in range(3)]
+        with mock.patch('transactions.views.create_transaction_atomic', side_effect=flaky):
+            with self.assertRaises(RuntimeError):
+                self._sync(sales)
+        # The sale before the failure stays committed; a resync picks up the rest
+        self.assertEqual(Transaction.objects.count(), 1)
+        results = self._sync(sales).data['results']
+        self.assertEqual([r['status'] for r in results], ['duplicate', 'created', 'created'])
+
+    def test_resync_reports_duplicates(self):
+        sale = self._sale('till1-1', '2026-01-05T12:00:00+05:45')
+        self._sync([sale])
+        resp = self._sync([sale])
+        self.assertEqual(resp.data['results'][0]['status'], 'duplicate')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_missing_client_id_is_invalid(self):
+        sale = self._sale(None, '2026-01-05T12:00:00+05:45')
+        resp = self._sync([sale])
+        self.assertEqual(resp.data['results'][0]['status'], 'invalid')
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_device_is_required(self):
+        resp = self._sync([self._sale(1, '2026-01-05T12:00:00+05:45')], device='')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_two_tills_number_sales_independently(self):
+        # Both tills share one login and recorded the same sale as their client_id 1
+        self.samosa.stock_quantity = 5
+        self.samosa.save()
+        sale = self._sale(1, '2026-01-05T12:00:00+05:45')
+        first = self._sync([sale], device='till-1')
+        second = self._sync([sale], device='till-2')
+        self.assertEqual(first.data['results'][0]['status'], 'created')
+        self.assertEqual(second.data['results'][0]['status'], 'created')
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        # A till on its own login, same client_id and device name
+        self.client.force_authenticate(user=User.objects.create_user(username='cashier2', password='password', role='cashier'))
+        third = self._sync([sale], device='till-1')
+        self.assertEqual(third.data['results'][0]['status'], 'created')
+        self.assertEqual(self._sync([sale], device='till-1').data['results'][0]['status'], 'duplicate')
+        self.assertEqual(Transaction.objects.count(), 3)
+
+
+class ServerPricingTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.cashier = User.objects.create_user(username='cashier', password='password', role='cashier')
+        self.client.force_authenticate(user=self.cashier)
+        self.items = [
+            FoodItem.objects.create(name=f'Item {i}', price_full=100, price_half=60, available_portions=['full', 'half'])
+            for i in range(5)
+        ]
+
+    def _post(self, lines):
+        return self.client.post('/api/transactions/', {'payment_type': 'cash', 'lines': lines}, format='json')
+
+    def test_client_prices_are_ignored(self):
+        resp = self._post([{'food_item': self.items[0].id, 'portion_type': 'half', 'unit_price': '1.00', 'quantity': 2}])
+        self.assertEqual(resp.status_code, 201)
+        line = TransactionLine.objects.get()
+        self.assertEqual(line.unit_price, Decimal('60.00'))
+        self.assertEqual(line.line_total, Decimal('120.00'))
+        self.assertEqual(Transaction.objects.get().total_amount, Decimal('120.00'))
+
+    def test_price_change_invalidates_table(self):
+        self._post([{'food_item': self.items[0].id, 'portion_type': 'full', 'quantity': 1}])
+        self.items[0].price_full = 150
+        self.items[0].save()
+        resp = self._post([{'food_item': self.items[0].id, 'portion_type': 'full', 'quantity': 1}])
+        self.assertEqual(resp.data['total_amount'], '150.00')
+
+    def test_validation_does_not_query_per_line(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def count(items):
+            lines = [{'food_item': item.id, 'portion_type': 'full', 'quantity': 1} for item in items]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._post(lines).status_code, 201)
+            return len(ctx.captured_queries)
+
+        count(self.items[:1])  # warm the price table
+        self.assertEqual(count(self.items[:1]), count(self.items))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='mgr', password='password', role='manager')
+        self.client.force_authenticate(user=self.manager)
+        self.item = FoodItem.objects.create(name='Tea', price_full=20, available_portions=['full'])
+        txs = Transaction.objects.bulk_create([
+            Transaction(cashier=self.manager, payment_type='cash' if i % 2 else 'credit', total_amount=20)
+            for i in range(1205)
+        ])
+        TransactionLine.objects.bulk_create([
+            TransactionLine(transaction=tx, food_item=self.item, portion_type='full', unit_price=20, quantity=1, line_total=20)
+            for tx in txs
+        ])
+
+    def _rows(self, resp):
+        import csv
+        import io
+        return list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode())))
+
+    def test_export_is_streamed_and_uncapped(self):
+        from unittest import mock
+        # Three chunks of 500: one cursor, then lines + food items prefetched per chunk
+        with mock.patch('core.exports.EXPORT_CHUNK_SIZE', 500), self.assertNumQueries(7):
+            resp = self.client.get('/api/transactions/export_csv/')
+            rows = self._rows(resp)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(len(rows), 1206)
+        self.assertEqual(rows[1][7], 'Tea (full) x1')
+
+    def test_filters_and_gzip(self):
+        import gzip
+        resp = self.client.get('/api/transactions/export_csv/', {'payment_type': 'cash', 'compress': 'gzip'})
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertIn('transactions.csv.gz', resp['Content-Disposition'])
+        lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 603)
+
+    def test_excel_export_is_uncapped_without_per_row_queries(self):
+        import io
+        from openpyxl import load_workbook
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/transactions/export_excel/')
+            content = b''.join(resp.streaming_content)
+        ws = load_workbook(io.BytesIO(content), read_only=True).active
+        rows = list(ws.iter_rows(min_row=5, values_only=True))
+        self.assertEqual(len(rows), 1205)
+        self.assertEqual(rows[0][5], 1)
+        self.assertEqual(ws['A4'].value, 'ID')
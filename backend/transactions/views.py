@@ -2,23 +2,39 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
-from django.http import HttpResponse
-from django.db import transaction as db_transaction
+from django.db.models import Count, OuterRef, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from datetime import date, timedelta
 from decimal import Decimal
-import csv
+from core import exports
+from core.dates import LocalDateFilter, date_range_q, month_days
 from .models import Transaction, TransactionLine
 from .serializers import TransactionSerializer
-from .services import create_transaction_atomic, cancel_transaction_atomic
+from .services import create_transaction_atomic, cancel_transaction_atomic, run_idempotent, request_fingerprint
 from .serializers_receipt import ReceiptSerializer
 from accounts.permissions import IsCashierOrHigher, IsAdmin
 
+# Offline sync: sales per request, tolerated till clock drift
+BULK_SYNC_MAX_SALES = 1000
+BULK_SYNC_CLOCK_SKEW = timedelta(minutes=5)
+BULK_SYNC_MAX_DEVICE_LENGTH = 64
+
+
+def bulk_sync_key(device, client_id):
+    """Idempotency-Key of an offline sale: client ids are only unique per till."""
+    return f'bulk:{device}:{client_id}'
+
 
 class TransactionFilter(filters.FilterSet):
-    date = filters.DateFilter(field_name='timestamp', lookup_expr='date')
-    date_from = filters.DateFilter(field_name='timestamp', lookup_expr='date__gte')
-    date_to = filters.DateFilter(field_name='timestamp', lookup_expr='date__lte')
-    month = filters.NumberFilter(field_name='timestamp', lookup_expr='month')
-    year = filters.NumberFilter(field_name='timestamp', lookup_expr='year')
+    date = LocalDateFilter(field_name='timestamp', lookup_expr='exact')
+    date_from = LocalDateFilter(field_name='timestamp', lookup_expr='gte')
+    date_to = LocalDateFilter(field_name='timestamp', lookup_expr='lte')
+    month = filters.NumberFilter(method='filter_by_month')
+    year = filters.NumberFilter(method='filter_by_year')
     cashier = filters.NumberFilter(field_name='cashier__id')
     payment_type = filters.CharFilter(field_name='payment_type')
     is_canceled = filters.BooleanFilter(field_name='is_canceled')
@@ -29,6 +45,23 @@ class TransactionFilter(filters.FilterSet):
     def filter_by_food_item(self, queryset, name, value):
         return queryset.filter(lines__food_item__id=value).distinct()
     
+    def filter_by_year(self, queryset, name, value):
+        year = int(value)
+        if self.form.cleaned_data.get('month') is not None:
+            return queryset  # filter_by_month narrows to that month of the year
+        if not 1 <= year <= 9998:
+            return queryset.none()
+        return queryset.filter(date_range_q('timestamp', date(year, 1, 1), date(year, 12, 31)))
+    
+    def filter_by_month(self, queryset, name, value):
+        month, year = int(value), self.form.cleaned_data.get('year')
+        if year is None:
+            # That month of every year: no timestamp range to use
+            return queryset.filter(timestamp__month=month)
+        if not (1 <= month <= 12 and 1 <= int(year) <= 9998):
+            return queryset.none()
+        return queryset.filter(date_range_q('timestamp', *month_days(int(year), month)))
+    
     class Meta:
         model = Transaction
         fields = ['date', 'date_from', 'date_to', 'month', 'year', 'cashier', 
@@ -45,7 +78,28 @@ class TransactionViewSet(viewsets.ModelViewSet):
         return super().get_queryset().order_by('-timestamp')
     
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+        """
+        Create a sale. With an Idempotency-Key header, a retry of a sale that
+        already committed replays the stored 201 response instead of selling twice.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return Response(self._create_transaction(request), status=status.HTTP_201_CREATED)
+        if len(key) > 255:
+            return Response({'error': 'Idempotency-Key must be at most 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        status_code, body, replayed = run_idempotent(
+            key, request.user, request_fingerprint(request.data),
+            lambda: (status.HTTP_201_CREATED, self._create_transaction(request))
+        )
+        response = Response(body, status=status_code)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def _create_transaction(self, request, payload=None, timestamp=None):
+        payload = request.data if payload is None else payload
+        serializer = self.get_serializer(data=payload)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         lines = data.pop('lines')
@@ -56,14 +110,78 @@ class TransactionViewSet(viewsets.ModelViewSet):
             lines_data=lines,
             tax=data.get('tax') or 0,
             discount=data.get('discount') or 0,
-            linked_account_id=request.data.get('linked_account'),
-            cash_amount=request.data.get('cash_amount'),
-            credit_amount=request.data.get('credit_amount'),
-            payment_reference=request.data.get('payment_reference'),
-            notes=data.get('notes', '')
+            linked_account_id=payload.get('linked_account'),
+            cash_amount=payload.get('cash_amount'),
+            credit_amount=payload.get('credit_amount'),
+            payment_reference=payload.get('payment_reference'),
+            notes=data.get('notes', ''),
+            timestamp=timestamp
         )
-        return Response(TransactionSerializer(tx).data, status=status.HTTP_201_CREATED)
+        prefetch_related_objects([tx], 'lines__food_item')
+        return TransactionSerializer(tx).data
     
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Sync sales a till recorded while offline.
+        Body: {"device": till id, "sales": [{"client_id": ..., "timestamp": ISO-8601, ...sale fields}]}.
+        Sales are replayed oldest first, each in its own transaction, so each
+        takes its locks in the global order like a live sale and fails alone.
+        device and client_id make the sale's Idempotency-Key, so sales that
+        already reached the server are reported as duplicates while tills
+        sharing a login may number their sales independently. Returns one
+        result per sale, in request order.
+        """
+        device = request.data.get('device')
+        if not isinstance(device, str) or not device.strip() or len(device) > BULK_SYNC_MAX_DEVICE_LENGTH:
+            return Response({'error': f'device must be a till id of at most {BULK_SYNC_MAX_DEVICE_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        sales = request.data.get('sales')
+        if not isinstance(sales, list) or not sales:
+            return Response({'error': 'sales must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(sales) > BULK_SYNC_MAX_SALES:
+            return Response({'error': f'At most {BULK_SYNC_MAX_SALES} sales per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(sales)
+        pending = []
+        latest = timezone.now() + BULK_SYNC_CLOCK_SKEW
+        for index, sale in enumerate(sales):
+            client_id = sale.get('client_id') if isinstance(sale, dict) else None
+            timestamp = parse_datetime(str(sale.get('timestamp') or '')) if client_id else None
+            if timestamp is not None and timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+            if not client_id or timestamp is None or timestamp > latest:
+                results[index] = {'client_id': client_id, 'status': 'invalid', 'error': 'client_id and a past timestamp are required'}
+            elif len(bulk_sync_key(device, client_id)) > 255:
+                results[index] = {'client_id': client_id, 'status': 'invalid', 'error': 'client_id is too long'}
+            else:
+                pending.append((timestamp, index, sale))
+
+        pending.sort(key=lambda p: (p[0], p[1]))
+        for timestamp, index, sale in pending:
+            results[index] = self._sync_sale(request, device, sale, timestamp)
+
+        return Response({'results': results})
+
+    def _sync_sale(self, request, device, sale, timestamp):
+        result = {'client_id': sale['client_id']}
+        try:
+            status_code, body, replayed = run_idempotent(
+                bulk_sync_key(device, sale['client_id']), request.user, request_fingerprint(sale),
+                lambda: (status.HTTP_201_CREATED, self._create_transaction(request, sale, timestamp))
+            )
+        except ValidationError as e:
+            return dict(result, status='invalid', error=e.detail)
+        except ObjectDoesNotExist as e:
+            return dict(result, status='invalid', error=str(e))
+        except ValueError as e:
+            # Stock ran out between recording the sale and syncing it
+            return dict(result, status='rejected', error=str(e))
+
+        if status_code != status.HTTP_201_CREATED:
+            return dict(result, status='invalid', error=body.get('error'))
+        return dict(result, status='duplicate' if replayed else 'created', transaction_id=body['id'])
+
     def destroy(self, request, *args, **kwargs):
         # Only admin can delete (cancel)
         if request.user.role != 'admin':
@@ -95,21 +213,35 @@ class TransactionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
-        """Export transactions as CSV."""
+        """Export transactions as CSV, streamed (?compress=gzip for a .csv.gz)."""
         queryset = self.filter_queryset(self.get_queryset())
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'Date', 'Cashier', 'Payment Type', 'Total', 'Tax', 'Discount', 'Items', 'Status'])
-        
-        for tx in queryset[:1000]:  # Limit to 1000 for export
+        return transactions_csv(queryset, gzip=exports.wants_gzip(request))
+    
+    @action(detail=False, methods=['get'])
+    def export_excel(self, request):
+        """Export transactions as Excel (every matching row, written in write-only mode)."""
+        queryset = self.filter_queryset(self.get_queryset())
+        return transactions_excel(queryset, request.query_params)
+
+
+def filtered_transactions(params):
+    """Transactions matching TransactionFilter params, newest first. ValueError for invalid params."""
+    filterset = TransactionFilter(params, queryset=TransactionViewSet.queryset.order_by('-timestamp'))
+    if not filterset.is_valid():
+        raise ValueError(f'Invalid filters: {dict(filterset.errors)}')
+    return filterset.qs
+
+
+def transactions_csv(queryset, gzip=False):
+    """Streamed CSV download of queryset (transactions with lines and cashier loaded)."""
+    def rows():
+        yield ['ID', 'Date', 'Cashier', 'Payment Type', 'Total', 'Tax', 'Discount', 'Items', 'Status']
+        for tx in exports.iterate(queryset):
             items_str = '; '.join([
                 f"{line.food_item.name} ({line.portion_type}) x{line.quantity}" 
                 for line in tx.lines.all()
             ])
-            writer.writerow([
+            yield [
                 tx.id,
                 tx.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                 tx.cashier.username if tx.cashier else 'N/A',
@@ -119,24 +251,28 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 str(tx.discount),
                 items_str,
                 'Canceled' if tx.is_canceled else 'Active'
-            ])
-        
-        return response
+            ]
+
+    return exports.stream_csv('transactions.csv', rows(), gzip=gzip)
+
+
+def transactions_excel(queryset, params):
+    """Excel download of queryset; the date and payment type filters in params make its subtitle."""
+    from reports.excel_utils import generate_transactions_excel
     
-    @action(detail=False, methods=['get'])
-    def export_excel(self, request):
-        """Export transactions as Excel."""
-        from reports.excel_utils import generate_transactions_excel
-        
-        queryset = self.filter_queryset(self.get_queryset())[:1000]
-        
-        # Build filters dict for subtitle
-        filters = {}
-        if request.query_params.get('date_from'):
-            filters['start_date'] = request.query_params.get('date_from')
-        if request.query_params.get('date_to'):
-            filters['end_date'] = request.query_params.get('date_to')
-        if request.query_params.get('payment_type'):
-            filters['payment_type'] = request.query_params.get('payment_type')
-        
-        return generate_transactions_excel(queryset, filters)
+    # Line counts come from one subquery column instead of a COUNT per row
+    line_count = TransactionLine.objects.filter(
+        transaction=OuterRef('pk')
+    ).order_by().values('transaction').annotate(n=Count('pk')).values('n')
+    queryset = queryset.prefetch_related(None).annotate(line_count=Coalesce(Subquery(line_count), 0))
+    
+    # Build filters dict for subtitle
+    filters = {}
+    if params.get('date_from'):
+        filters['start_date'] = params.get('date_from')
+    if params.get('date_to'):
+        filters['end_date'] = params.get('date_to')
+    if params.get('payment_type'):
+        filters['payment_type'] = params.get('payment_type')
+    
+    return generate_transactions_excel(exports.iterate(queryset), filters)
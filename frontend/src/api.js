@@ -106,6 +106,90 @@ export async function fetchFoodItems(params = '') {
   return apiFetch(`/api/food-items/${params}`)
 }
 
+/**
+ * Fetch the versioned menu snapshot. Pass the ETag of the copy already held;
+ * resolves to null when the menu has not changed (304).
+ */
+export async function fetchMenuSnapshot(etag) {
+  const headers = {}
+  const token = getToken()
+  if (token) headers['Authorization'] = `Bearer ${token}`
+  if (etag) headers['If-None-Match'] = etag
+
+  const res = await fetch(`${API_BASE}/api/food-items/snapshot/`, { headers, cache: 'no-store' })
+  if (res.status === 304) return null
+  if (!res.ok) {
+    const err = new Error(res.statusText || 'API error')
+    err.status = res.status
+    throw err
+  }
+  const data = await res.json()
+  return { ...data, etag: res.headers.get('ETag') }
+}
+
+/**
+ * Follow the live stock/menu event stream (/api/events/).
+ * onEvent(event) is called for every event and onConnect() on every
+ * (re)connect, so the caller can revalidate whatever it may have missed.
+ * Returns a function that stops the subscription.
+ */
+export function subscribeEvents(onEvent, onConnect) {
+  let controller = null
+  let stopped = false
+
+  async function follow() {
+    const headers = { Accept: 'text/event-stream' }
+    const token = getToken()
+    if (token) headers['Authorization'] = `Bearer ${token}`
+
+    controller = new AbortController()
+    const res = await fetch(`${API_BASE}/api/events/`, { headers, signal: controller.signal, cache: 'no-store' })
+    if (!res.ok || !res.body) {
+      const err = new Error(res.statusText || 'Event stream unavailable')
+      // A busy server says when to come back (503 + Retry-After, in seconds)
+      err.retryAfter = Number(res.headers.get('Retry-After')) || 0
+      throw err
+    }
+    if (onConnect) onConnect()
+
+    const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) return
+      buffer += value
+      let end
+      while ((end = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, end)
+        buffer = buffer.slice(end + 2)
+        const data = block.split('\n')
+          .filter(line => line.startsWith('data: '))
+          .map(line => line.slice(6))
+          .join('\n')
+        if (data) onEvent(JSON.parse(data))
+      }
+    }
+  }
+
+  async function run() {
+    while (!stopped) {
+      try {
+        // The server ends each stream after a few minutes; reconnect straight away
+        await follow()
+      } catch (err) {
+        const wait = err.retryAfter ? err.retryAfter * 1000 * (1 + Math.random()) : 3000
+        if (!stopped) await new Promise(resolve => setTimeout(resolve, wait))
+      }
+    }
+  }
+
+  run()
+  return () => {
+    stopped = true
+    if (controller) controller.abort()
+  }
+}
+
 export async function createFoodItem(data) {
   // Support both FormData (with image) and JSON
   const body = data instanceof FormData ? data : JSON.stringify(data)
@@ -150,11 +234,31 @@ export async function fetchTransaction(id) {
   return apiFetch(`/api/transactions/${id}/`)
 }
 
+const SALE_TIMEOUT_MS = 5000
+const SALE_ATTEMPTS = 3
+
+function newIdempotencyKey() {
+  // crypto.randomUUID is only available in secure contexts (https/localhost)
+  if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID()
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
 export async function createTransaction(payload) {
-  return apiFetch('/api/transactions/', {
-    method: 'POST',
-    body: JSON.stringify(payload)
-  })
+  // One key per sale: a retry after a timeout replays the committed sale instead of duplicating it
+  const idempotencyKey = newIdempotencyKey()
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await apiFetch('/api/transactions/', {
+        method: 'POST',
+        body: JSON.stringify(payload),
+        headers: { 'Idempotency-Key': idempotencyKey },
+        signal: AbortSignal.timeout(SALE_TIMEOUT_MS)
+      })
+    } catch (err) {
+      // Only network failures and timeouts are retried; API errors carry a status
+      if (err.status || attempt >= SALE_ATTEMPTS) throw err
+    }
+  }
 }
 
 export async function cancelTransaction(id) {
@@ -179,6 +283,16 @@ export async function fetchAccounts(params = '') {
   return apiFetch(`/api/accounts/${params}`)
 }
 
+// Typeahead for the till: the 10 best matches by ID, roll number or name
+export async function lookupAccounts(query) {
+  return apiFetch(`/api/accounts/lookup/?q=${encodeURIComponent(query)}`)
+}
+
+// The account an ID card scan names; rejects with status 404 if none
+export async function lookupAccountByBarcode(code) {
+  return apiFetch(`/api/accounts/lookup/?barcode=${encodeURIComponent(code)}`)
+}
+
 export async function fetchAccount(id) {
   return apiFetch(`/api/accounts/${id}/`)
 }
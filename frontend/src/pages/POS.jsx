@@ -7,13 +7,12 @@ import styles from './POS.module.css'
 import './Print.css' // Import global print styles
 import Input from '../components/ui/Input'
 import { Loader, useToast } from '../components/ui/Badge'
-import { fetchFoodItems, createTransaction, getReceipt, fetchAccounts, fetchCategories } from '../api'
+import { fetchMenuSnapshot, subscribeEvents, createTransaction, getReceipt, lookupAccounts, lookupAccountByBarcode, fetchCategories } from '../api'
 import ReceiptPrint from '../components/ReceiptPrint'
 
 export default function POS() {
     const [menu, setMenu] = useState([])
     const [categories, setCategories] = useState([])
-    const [accounts, setAccounts] = useState([])
     const [cart, setCart] = useState([])
     const [loading, setLoading] = useState(true)
     const [checkingOut, setCheckingOut] = useState(false)
@@ -21,12 +20,16 @@ export default function POS() {
     const [selectedCategory, setSelectedCategory] = useState('all')
     const [paymentType, setPaymentType] = useState('cash')
     const [selectedAccount, setSelectedAccount] = useState('')
+    const [accountInfo, setAccountInfo] = useState(null)
+    const [accountQuery, setAccountQuery] = useState('')
+    const [accountMatches, setAccountMatches] = useState([])
     const [receiptPayload, setReceiptPayload] = useState(null)
     const [printCashAmount, setPrintCashAmount] = useState('')
     const [showDebugReceipt, setShowDebugReceipt] = useState(false) // DEBUG MODE
 
     const toast = useToast()
     const printRef = useRef(null)
+    const menuEtag = useRef(null)
 
     // Manage printing class on body
     useEffect(() => {
@@ -44,32 +47,120 @@ export default function POS() {
         loadData()
     }, [])
 
-    // Periodic refresh to keep stock levels up-to-date
+    // Account typeahead: ask the server once typing pauses instead of loading every account
     useEffect(() => {
-        const interval = setInterval(() => {
-            // Silent refresh - don't show loading state
-            fetchFoodItems('?is_active=true')
-                .then(menuData => {
-                    setMenu(Array.isArray(menuData) ? menuData : menuData.results || [])
-                })
-                .catch(() => {
-                    // Silent fail - don't disrupt user experience
-                })
-        }, 30000) // Refresh every 30 seconds
-
-        return () => clearInterval(interval)
+        const query = accountQuery.trim()
+        if (!query || accountInfo) {
+            setAccountMatches([])
+            return
+        }
+        let stale = false
+        const timer = setTimeout(() => {
+            lookupAccounts(query)
+                .then(data => { if (!stale) setAccountMatches(data.results || []) })
+                .catch(() => { if (!stale) setAccountMatches([]) })
+        }, 150)
+        return () => {
+            stale = true
+            clearTimeout(timer)
+        }
+    }, [accountQuery, accountInfo])
+
+    // Live stock and menu updates. Every (re)connect revalidates the snapshot,
+    // which is a 304 unless something changed while disconnected.
+    useEffect(() => {
+        const lowStockSeen = new Set()
+
+        function applyEvent(event) {
+            switch (event.type) {
+                case 'availability':
+                    event.items.forEach(applyAvailability)
+                    break
+                case 'food_item':
+                    if (!event.is_active) {
+                        removeItem(event.id)
+                    } else {
+                        updateItem(event.id, {
+                            name: event.name,
+                            category: event.category,
+                            available_portions: event.available_portions,
+                            price_full: event.price_full,
+                            price_half: event.price_half,
+                        })
+                    }
+                    break
+                case 'food_item_deleted':
+                    removeItem(event.id)
+                    break
+                case 'ingredient_low_stock':
+                    if (!lowStockSeen.has(event.id)) {
+                        lowStockSeen.add(event.id)
+                        toast.warning(`${event.name} is running low (${parseFloat(event.current_quantity)} ${event.unit} left)`, 'Low stock')
+                    }
+                    break
+                case 'resync':
+                    refreshMenu()
+                    break
+            }
+        }
+
+        function applyAvailability(delta) {
+            if (!delta.is_active) {
+                removeItem(delta.id)
+                return
+            }
+            updateItem(delta.id, item => ({
+                stock_quantity: delta.stock_quantity,
+                max_daily_production: delta.can_make,
+                availability: {
+                    ...item.availability,
+                    can_make: delta.can_make,
+                    quantity: delta.stock_quantity ?? 0,
+                    available: !delta.is_sold_out,
+                    is_sold_out: delta.is_sold_out,
+                },
+            }))
+        }
+
+        function updateItem(id, changes) {
+            setMenu(current => {
+                if (!current.some(item => item.id === id)) {
+                    // Newly activated item: fetch it with the rest of the menu
+                    refreshMenu()
+                    return current
+                }
+                return current.map(item => item.id === id
+                    ? { ...item, ...(typeof changes === 'function' ? changes(item) : changes) }
+                    : item)
+            })
+        }
+
+        function removeItem(id) {
+            setMenu(current => current.filter(item => item.id !== id))
+        }
+
+        function refreshMenu() {
+            // Silent refresh - don't show loading state or disrupt the user on failure
+            loadMenu().catch(() => {})
+        }
+
+        return subscribeEvents(applyEvent, refreshMenu)
     }, [])
 
+    async function loadMenu() {
+        const snapshot = await fetchMenuSnapshot(menuEtag.current)
+        if (!snapshot) return
+        menuEtag.current = snapshot.etag
+        setMenu(snapshot.items.filter(item => item.is_active))
+    }
+
     async function loadData() {
         try {
-            const [menuData, catData, accountData] = await Promise.all([
-                fetchFoodItems('?is_active=true'),
-                fetchCategories().catch(() => []),
-                fetchAccounts().catch(() => ({ results: [] }))
+            const [, catData] = await Promise.all([
+                loadMenu(),
+                fetchCategories().catch(() => [])
             ])
-            setMenu(Array.isArray(menuData) ? menuData : menuData.results || [])
             setCategories(catData || [])
-            setAccounts(accountData.results || accountData || [])
         } catch (err) {
             console.error('Load error:', err)
             toast.error('Failed to load menu data')
@@ -150,10 +241,39 @@ export default function POS() {
     function clearCart() {
         setCart([])
         setPaymentType('cash')
-        setSelectedAccount('')
+        clearAccount()
         setPrintCashAmount('')
     }
 
+    function selectAccount(account) {
+        setSelectedAccount(account.account_id)
+        setAccountInfo(account)
+        setAccountQuery(`${account.name} (${account.account_id})`)
+        setAccountMatches([])
+    }
+
+    function clearAccount() {
+        setSelectedAccount('')
+        setAccountInfo(null)
+        setAccountQuery('')
+        setAccountMatches([])
+    }
+
+    // Card scanners type the barcode and press Enter
+    async function handleAccountKeyDown(e) {
+        if (e.key !== 'Enter' || !accountQuery.trim() || accountInfo) return
+        e.preventDefault()
+        try {
+            selectAccount(await lookupAccountByBarcode(accountQuery.trim()))
+        } catch (err) {
+            if (accountMatches.length === 1) {
+                selectAccount(accountMatches[0])
+            } else if (err.status === 404) {
+                toast.warning('No account for this card')
+            }
+        }
+    }
+
     async function handleCheckout() {
         if (cart.length === 0) return
 
@@ -203,9 +323,8 @@ export default function POS() {
             let finalPayload = { ...receipt.payload }
 
             if ((paymentType === 'credit' || paymentType === 'mixed') && selectedAccount) {
-                const account = accounts.find(a => a.account_id == selectedAccount)
-                if (account) {
-                    finalPayload.account_name = account.name
+                if (accountInfo) {
+                    finalPayload.account_name = accountInfo.name
                 }
             }
 
@@ -536,7 +655,7 @@ export default function POS() {
                             <div className={styles.paymentBtns}>
                                 <button
                                     className={`${styles.paymentBtn} ${paymentType === 'cash' ? styles.paymentBtnActive : ''}`}
-                                    onClick={() => { setPaymentType('cash'); setSelectedAccount(''); setPrintCashAmount('') }}
+                                    onClick={() => { setPaymentType('cash'); clearAccount(); setPrintCashAmount('') }}
                                 >
                                     💵 Cash
                                 </button>
@@ -573,32 +692,58 @@ export default function POS() {
 
                         {paymentType !== 'cash' && (
                             <div className={styles.accountSelect} style={{ marginTop: 'var(--spacing-3)' }}>
-                                <select
-                                    value={selectedAccount}
-                                    onChange={(e) => setSelectedAccount(e.target.value)}
+                                <input
+                                    type="text"
+                                    value={accountQuery}
+                                    onChange={(e) => {
+                                        setAccountQuery(e.target.value)
+                                        if (accountInfo) {
+                                            setSelectedAccount('')
+                                            setAccountInfo(null)
+                                        }
+                                    }}
+                                    onKeyDown={handleAccountKeyDown}
+                                    placeholder="Scan card or search name, roll no, ID..."
                                     style={{
                                         width: '100%',
                                         padding: 'var(--spacing-2) var(--spacing-3)',
                                         borderRadius: 'var(--radius-md)',
                                         border: '1px solid var(--color-gray-300)'
                                     }}
-                                >
-                                    <option value="">Select Account...</option>
-                                    <optgroup label="Students">
-                                        {accounts.filter(a => a.account_type === 'student').map(a => (
-                                            <option key={a.account_id} value={a.account_id}>
-                                                {a.name} ({a.account_id}) - Balance: Rs. {a.balance}
-                                            </option>
-                                        ))}
-                                    </optgroup>
-                                    <optgroup label="Teachers">
-                                        {accounts.filter(a => a.account_type === 'teacher').map(a => (
-                                            <option key={a.account_id} value={a.account_id}>
-                                                {a.name} ({a.account_id}) - Balance: Rs. {a.balance}
-                                            </option>
+                                />
+                                {accountInfo && (
+                                    <div style={{ fontSize: 'var(--font-size-sm)', color: 'var(--text-secondary)', marginTop: 'var(--spacing-1)' }}>
+                                        {accountInfo.account_type === 'teacher' ? 'Teacher' : 'Student'} - Balance: Rs. {accountInfo.balance}
+                                    </div>
+                                )}
+                                {accountMatches.length > 0 && (
+                                    <div style={{
+                                        marginTop: 'var(--spacing-1)',
+                                        border: '1px solid var(--color-gray-300)',
+                                        borderRadius: 'var(--radius-md)',
+                                        maxHeight: '240px',
+                                        overflowY: 'auto'
+                                    }}>
+                                        {accountMatches.map(a => (
+                                            <button
+                                                key={a.account_id}
+                                                type="button"
+                                                onClick={() => selectAccount(a)}
+                                                style={{
+                                                    display: 'block',
+                                                    width: '100%',
+                                                    textAlign: 'left',
+                                                    padding: 'var(--spacing-2) var(--spacing-3)',
+                                                    background: 'none',
+                                                    border: 'none',
+                                                    cursor: 'pointer'
+                                                }}
+                                            >
+                                                {a.name} ({a.account_id}){a.roll_no ? ` - Roll ${a.roll_no}` : ''} - Balance: Rs. {a.balance}
+                                            </button>
                                         ))}
-                                    </optgroup>
-                                </select>
+                                    </div>
+                                )}
                             </div>
                         )}
 